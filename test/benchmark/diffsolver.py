@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Copyright 2018 Erik Schulz
+#
+# This file is part of uberdot.
+#
+# uberdot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# uberdot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with uberdot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measures how the UpdateDiffSolver scales with the number of links.
+
+A profile with 10k and with 50k links is compared against an installed
+version of itself in which some links are unchanged, updated, removed or
+added. The solver needs to scale (roughly) linear, so the time for 50k links
+must not exceed the time for 10k links by more than a maximum factor.
+
+Usage: ./diffsolver.py [max factor] [repetitions]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+DIRNAME = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))
+sys.path.insert(0, os.path.join(DIRNAME, "../.."))
+
+# pylint: disable=wrong-import-position
+from uberdot import constants  # noqa: F401
+from uberdot.differencesolver import UpdateDiffSolver
+from uberdot.installedfile import LinkDescriptor
+
+
+# Constants and helpers
+###############################################################################
+
+MAX_FACTOR = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+REPETITIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+SIZES = [10000, 50000]
+
+
+def link(i, target="file"):
+    """Returns a link as it is stored in the installed-file"""
+    return LinkDescriptor(
+        name="~/.config/bench/" + str(i),
+        target="$HOME/dotfiles/" + target + str(i),
+        uid=1000,
+        gid=1000,
+        permission=644,
+        secure=True
+    )
+
+
+def setup(size):
+    """Returns an installed-file and a profile result with size links each.
+
+    Of the links 80% are unchanged, 10% are updated, 5% are removed and 5%
+    are added.
+    """
+    installed_links = []
+    new_links = []
+    for i in range(size):
+        kind = i % 20
+        if kind < 16:
+            installed_links.append(link(i))
+            new_links.append(link(i))
+        elif kind < 18:
+            installed_links.append(link(i))
+            new_links.append(link(i, "other"))
+        elif kind == 18:
+            installed_links.append(link(i))
+        else:
+            new_links.append(link(i + size))
+    installed = {
+        "@version": constants.VERSION,
+        "Bench": {
+            "name": "Bench",
+            "links": installed_links,
+            "installed": "",
+            "updated": ""
+        }
+    }
+    result = {
+        "name": "Bench",
+        "links": new_links,
+        "profiles": [],
+        "beforeUninstall": None,
+        "afterUninstall": None
+    }
+    return installed, [result]
+
+
+def measure(size):
+    """Returns the median time in seconds to solve a profile of size links"""
+    installed, results = setup(size)
+    times = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        UpdateDiffSolver(installed, results, None).solve()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+# Benchmark
+###############################################################################
+
+durations = []
+for size in SIZES:
+    durations.append(measure(size))
+    print((str(size) + " links: ").ljust(14) +
+          (str(round(durations[-1] * 1000)) + "ms").rjust(8))
+
+factor = durations[-1] / durations[0]
+print("Factor: " + str(round(factor, 1)))
+if factor > MAX_FACTOR:
+    print("\033[91mThe solver doesn't scale linear.\033[0m")
+    sys.exit(1)
+print("\033[92mThe solver scales linear.\033[0m")
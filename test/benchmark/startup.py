@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Copyright 2018 Erik Schulz
+#
+# This file is part of uberdot.
+#
+# uberdot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# uberdot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with uberdot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measures the startup time of the read-only modes of uberdot and compares
+it against a baseline revision.
+
+The baseline revision is extracted into a temporary directory. Both versions
+are started alternately, so a busy machine slows down both of them. The
+benchmark fails if the median startup time of a mode is more than a margin
+slower than the median startup time of the baseline.
+
+Usage: ./startup.py [baseline revision] [margin in %] [repetitions]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from subprocess import DEVNULL
+from subprocess import PIPE
+from subprocess import run
+
+
+# Constants and helpers
+###############################################################################
+
+DIRNAME = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))
+REPO_DIR = os.path.abspath(os.path.join(DIRNAME, "../.."))
+REVISION = sys.argv[1] if len(sys.argv) > 1 else "HEAD"
+MARGIN = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+REPETITIONS = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+MODES = {
+    "--version": ["--version"],
+    "--show": ["-s"],
+    "--debuginfo": ["--debuginfo"],
+}
+
+
+def extract(revision, directory):
+    """Extracts a revision of the repository into a directory."""
+    archive = run(["git", "archive", revision], cwd=REPO_DIR, stdout=PIPE)
+    if archive.returncode:
+        print("Could not extract revision '" + revision + "'")
+        sys.exit(1)
+    run(["tar", "-x", "-C", directory], input=archive.stdout, check=True)
+
+
+def start(repo, args):
+    """Returns the runtime of uberdot in milliseconds."""
+    cmd = ["python3", "../../udot.py", "--config", "regressiontest.ini"]
+    cmd += args
+    start_time = time.perf_counter()
+    result = run(cmd, cwd=os.path.join(repo, "test/regression"),
+                 stdout=DEVNULL, stderr=DEVNULL)
+    runtime = (time.perf_counter() - start_time) * 1000
+    if result.returncode:
+        print("'" + " ".join(cmd) + "' failed in '" + repo +
+              "' with exitcode " + str(result.returncode))
+        sys.exit(1)
+    return runtime
+
+
+def measure(baseline_repo, args):
+    """Returns the median runtimes of the baseline and the working tree."""
+    baseline_times, times = [], []
+    for _ in range(REPETITIONS):
+        baseline_times.append(start(baseline_repo, args))
+        times.append(start(REPO_DIR, args))
+    return statistics.median(baseline_times), statistics.median(times)
+
+
+# Benchmark
+###############################################################################
+
+fails = 0
+with tempfile.TemporaryDirectory() as baseline_dir:
+    extract(REVISION, baseline_dir)
+    print("Baseline: " + REVISION)
+    for name, args in MODES.items():
+        baseline, runtime = measure(baseline_dir, args)
+        result = "\033[92mOk\033[0m"
+        if runtime > baseline * (1 + MARGIN / 100):
+            result = "\033[91mToo slow\033[0m"
+            fails += 1
+        print((name + ": ").ljust(16) +
+              (str(round(runtime)) + "ms").rjust(6) + " (baseline " +
+              str(round(baseline)) + "ms)  " + result)
+
+if fails:
+    print("Startup took more than " + str(MARGIN) +
+          "% longer than the baseline.")
+    sys.exit(1)
+print("Startup took at most " + str(MARGIN) + "% longer than the baseline.")
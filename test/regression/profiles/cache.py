@@ -0,0 +1,15 @@
+"""This module collects all profiles that are used to test the generation
+cache"""
+from uberdot.profile import Profile
+
+class CacheEnv(Profile):
+    def generate(self):
+        link("name1", name="$UBERDOT_TEST_NAME")
+
+class CachePipe(Profile):
+    def generate(self):
+        link(pipe("name2", "grep 2"))
+
+class CacheDecrypt(Profile):
+    def generate(self):
+        link(decrypt("name_encrypt8"))
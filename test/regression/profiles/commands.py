@@ -37,7 +37,17 @@ class Default(Profile):
 
 class IgnoreFiles(Profile):
     def generate(self):
-        link("ignored.file", ".dotignore", optional=True)
+        link("ignored.file", ".dotignore", "ignoreddir.file",
+             "Ignored-Case.file", optional=True)
+        link("name1")
+
+class IgnoreAnchored(Profile):
+    def generate(self):
+        link("anchored.file")
+
+class GitIndex(Profile):
+    def generate(self):
+        link("untracked.file", "untracked-ignored.file", optional=True)
         link("name1")
 
 class NestedDynamicFile(Profile):
@@ -192,15 +192,17 @@ class RegressionTest():
         """Resets test environment and installed files"""
         installed_file = os.path.join(DIRNAME, "data/installed")
         installed_file = os.path.join(installed_file, self.save + ".json")
-        # Reset environment and installed dir with git
+        # Reset environment, installed and history dir with git
         process = Popen(["git", "checkout", "HEAD", "--", self.environ,
-                         DIRNAME + "/data/installed"], stderr=PIPE)
+                         DIRNAME + "/data/installed",
+                         DIRNAME + "/data/history"], stderr=PIPE)
         _, error_msg = process.communicate()
         if process.returncode:  # Exitcode is > 0, so git failed
             print(error_msg)
             raise ValueError("git-checkout failed")
         process = Popen(["git", "clean", "-fdq", "--", self.environ,
-                         DIRNAME + "/data/installed"], stderr=PIPE)
+                         DIRNAME + "/data/installed",
+                         DIRNAME + "/data/history"], stderr=PIPE)
         _, error_msg = process.communicate()
         if process.returncode:  # Exitcode is > 0, so git failed
             print(error_msg)
@@ -327,6 +329,168 @@ class OutputRegressionTest(RegressionTest):
         return True, ""
 
 
+class CacheRegressionTest(DirRegressionTest):
+    """Regression check if the generation cache reuses the result of a
+    profile when uberdot is run a second time"""
+    def __init__(self, name, cmd_args, before, after, cached, change=None,
+                 env=None, save="cache"):
+        super().__init__(name, cmd_args, before, after, save)
+        self.cached = cached
+        self.change = change
+        self.env = dict(os.environ)
+        self.env["UBERDOT_TEST_NAME"] = "name"
+        self.env_second = dict(self.env)
+        self.env_second.update(env or {})
+
+    def run(self):
+        process = Popen(self.cmd_args, stdout=PIPE, stderr=PIPE, env=self.env)
+        _, error_msg = process.communicate()
+        if process.returncode:
+            return False, process.returncode, error_msg
+        undo = self.change() if self.change is not None else None
+        try:
+            process = Popen(self.cmd_args + ["-v"], stdout=PIPE,
+                            stderr=PIPE, env=self.env_second)
+            output, error_msg = process.communicate()
+        finally:
+            if undo is not None:
+                undo()
+        if len(sys.argv) > 1:
+            print(output.decode(), end="")
+        if process.returncode:
+            return False, process.returncode, error_msg
+        cached = b"Using cached result of profile" in output
+        if cached != self.cached:
+            cause = "Cached result was " + ("" if cached else "not ") + "used"
+            return False, cause, output
+        return True, ""
+
+    def cleanup(self):
+        super().cleanup()
+        process = Popen(["git", "clean", "-fdqx", "--",
+                         DIRNAME + "/data/cache"], stderr=PIPE)
+        _, error_msg = process.communicate()
+        if process.returncode:  # Exitcode is > 0, so git failed
+            print(error_msg)
+            raise ValueError("git-clean failed")
+
+
+class SequenceRegressionTest(DirRegressionTest):
+    """Regression check if uberdot makes the expected changes to the
+    filesystem when it is run several times in a row. Optionally the output
+    of the last run is checked as well."""
+    def __init__(self, name, steps, before, after, save="default",
+                 output=None):
+        super().__init__(name, steps[-1], before, after, save)
+        base = self.cmd_args[:len(self.cmd_args)-len(steps[-1])]
+        self.steps = [base + step for step in steps]
+        self.output = output or []
+
+    def run(self):
+        for cmd_args in self.steps:
+            process = Popen(cmd_args, stdout=PIPE, stderr=PIPE)
+            output, error_msg = process.communicate()
+            if len(sys.argv) > 1:
+                print(output.decode(), end="")
+            if process.returncode:
+                return False, process.returncode, error_msg
+        for expected in self.output:
+            if expected not in output:
+                return False, "Output is not as expected", output
+        return True, ""
+
+
+class LockRegressionTest(DirRegressionTest):
+    """Regression check if uberdot waits for the lock of an installed-file
+    that is held exclusively by another process"""
+    HOLD = 2
+    """The number of seconds the other process holds the lock"""
+
+    def __init__(self, name, cmd_args, before, after, locked, waits,
+                 save="default"):
+        super().__init__(name, cmd_args + ["-v"], before, after, save)
+        self.lock_file = os.path.join(DIRNAME, "data/installed",
+                                      locked + ".lock")
+        self.waits = waits
+
+    def run(self):
+        helper = Popen([
+            "python3", "-c",
+            "import fcntl, os, sys, time\n" +
+            "fd = os.open(sys.argv[1], os.O_RDONLY | os.O_CREAT)\n" +
+            "fcntl.flock(fd, fcntl.LOCK_EX)\n" +
+            "print('locked', flush=True)\n" +
+            "time.sleep(float(sys.argv[2]))",
+            self.lock_file, str(self.HOLD)
+        ], stdout=PIPE)
+        try:
+            helper.stdout.readline()
+            process = Popen(self.cmd_args, stdout=PIPE, stderr=PIPE)
+            output, error_msg = process.communicate()
+            released = helper.poll() is not None
+        finally:
+            helper.kill()
+            helper.wait()
+            helper.stdout.close()
+        if len(sys.argv) > 1:
+            print(output.decode(), end="")
+        if process.returncode:
+            return False, process.returncode, error_msg
+        waited = b"Waiting for another instance of uberdot" in output
+        if waited != self.waits or released != self.waits:
+            cause = "uberdot did " + ("" if waited else "not ") + "wait"
+            return False, cause, output
+        return True, ""
+
+
+class GitIndexRegressionTest(DirRegressionTest):
+    """Regression check if uberdot finds the same dotfiles in the git index
+    as it would find by walking through the directories. Untracked files
+    are created before uberdot is started."""
+    def __init__(self, name, cmd_args, before, after, untracked,
+                 save="gitindex"):
+        super().__init__(name, cmd_args + ["-v"], before, after, save)
+        self.untracked = [os.path.join(DIRNAME, "files", path)
+                          for path in untracked]
+
+    def run(self):
+        for path in self.untracked:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+        process = Popen(self.cmd_args, stdout=PIPE, stderr=PIPE)
+        output, error_msg = process.communicate()
+        if len(sys.argv) > 1:
+            print(output.decode(), end="")
+        if process.returncode:
+            return False, process.returncode, error_msg
+        if b"dotfiles from git index" not in output:
+            return False, "Git index was not used", output
+        return True, ""
+
+    def cleanup(self):
+        super().cleanup()
+        process = Popen(["git", "clean", "-fdqx", "--", DIRNAME + "/files"],
+                        stderr=PIPE)
+        _, error_msg = process.communicate()
+        if process.returncode:  # Exitcode is > 0, so git failed
+            print(error_msg)
+            raise ValueError("git-clean failed")
+
+
+def add_dotfile():
+    """Adds a new dotfile and returns a function that removes it again"""
+    path = os.path.join(DIRNAME, "files/name12")
+    open(path, "w").close()
+    return lambda: os.remove(path)
+
+
+def touch_profiles():
+    """Changes the modification time of a profile module"""
+    path = os.path.join(DIRNAME, "profiles/cache.py")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
 # Test data
 ###############################################################################
 
@@ -594,6 +758,73 @@ after_nesteddynamic = {
     }
 }
 
+after_gitindex = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "name1",
+                "target": "files/name1"
+            },
+            {
+                "name": "untracked.file",
+                "target": "files/untracked-dir/untracked.file"
+            }
+        ],
+    }
+}
+
+after_cacheenv = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "name",
+                "target": "files/name1"
+            }
+        ],
+    }
+}
+
+after_cacheenvchanged = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "other",
+                "target": "files/name1"
+            }
+        ],
+    }
+}
+
+after_cachepipe = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "name2",
+                "target": "data/piped/name2#26ab0db90d72e28ad0ba1e22ee510510",
+                "content": "26ab0db90d72e28ad0ba1e22ee510510"
+            }
+        ],
+    }
+}
+
+after_cachedecrypt = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "name_encrypt8",
+                "target": "data/decrypted/name_encrypt8#" +
+                          "d6eb32081c822ed572b70567826d9d9d",
+                "content": "d6eb32081c822ed572b70567826d9d9d"
+            }
+        ],
+    }
+}
+
 after_event = {
     ".": {
         "files": [
@@ -881,6 +1112,70 @@ after_updatediroptions = {
     }
 }
 
+after_rollbackupdate = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "name1",
+                "target": "files/name1",
+                "permission": 640
+            },
+            {
+                "name": "file",
+                "target": "files/name5",
+                "permission": 640
+            }
+        ],
+    },
+    "subdir": {
+        "links": [
+            {
+                "name": "name3",
+                "target": "files/name3",
+                "permission": 640
+            },
+            {
+                "name": "name2",
+                "target": "files/name2",
+                "permission": 640
+            }
+        ],
+    }
+}
+
+after_rollbackremove = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "xname1",
+                "target": "files/name1",
+                "permission": 600
+            },
+            {
+                "name": "xfile",
+                "target": "files/name5",
+                "permission": 600
+            }
+        ],
+    },
+    "subdir": {
+        "links": [
+            {
+                "name": "xname3",
+                "target": "files/name3",
+                "permission": 600
+            },
+            {
+                "name": "xname2",
+                "target": "files/name2",
+                "permission": 600
+            }
+        ],
+    }
+}
+
 # This dirtree works only with environment-default
 after_extlink = {
     ".": {
@@ -964,6 +1259,60 @@ after_ignorefiles = {
     }
 }
 
+after_ignoreanchored = {
+    ".": {
+        "files": [{"name": "untouched.file"}],
+        "links": [
+            {
+                "name": "anchored.file",
+                "target": "files/anchored-dir/anchored.file"
+            }
+        ]
+    }
+}
+
+after_jobs = {
+    ".": {
+        "files": [
+            {"name": "untouched.file"},
+            {
+                "name": "test.file",
+                "content": "456dc30f21eb07c88257f4aabb0d946f"
+            },
+            {
+                "name": "name4",
+                "content": "26ab0db90d72e28ad0ba1e22ee510510"
+            },
+        ],
+        "links": [
+            {
+                "name": "name1",
+                "target": "files/name1",
+            },
+            {
+                "name": "name2",
+                "target": "files/name2",
+            },
+            {
+                "name": "name3",
+                "target": "files/name3",
+            },
+            {
+                "name": "test1",
+                "target": "environment-default/untouched.file"
+            }
+        ],
+    },
+    "test2": {
+        "links": [
+            {
+                "name": "untouched.file",
+                "target": "environment-default/untouched.file"
+            }
+        ]
+    }
+}
+
 after_options = {
     ".": {
         "files": [{"name": "untouched.file"}],
@@ -1049,6 +1398,15 @@ DirRegressionTest("Arguments: --option",
                       "-i", "--option", "name=file", "prefix=test",
                       "tags=tag1,notag", "--", "OptionArgument"
                   ], before, after_options).success()
+DirRegressionTest("Arguments: --rebuild-index",
+                  ["-i", "--rebuild-index", "NoOptions"],
+                  before, after_nooptions).success()
+DirRegressionTest("Arguments: --jobs",
+                  ["-i", "--jobs", "2", "SuperProfileEvent", "ExteranalLink"],
+                  before, after_jobs).success()
+DirRegressionTest("Arguments: --jobs with failing profile",
+                  ["-i", "--jobs", "2", "NoOptions", "NotAProfileFail"],
+                  before, before).fail("run", 104)
 DirRegressionTest("Option: name",
                   ["-i", "NameOption"],
                   before, after_nameoptions).success()
@@ -1094,6 +1452,9 @@ DirRegressionTest("Command: Nested dynamicfiles",
 DirRegressionTest("Command: .dotignore",
                   ["-i", "IgnoreFiles"],
                   before, after_ignorefiles).success()
+DirRegressionTest("Command: .dotignore doesn't prune on anchored pattern",
+                  ["-i", "IgnoreAnchored"],
+                  before, after_ignoreanchored).success()
 DirRegressionTest("Conflict: Same profile linked twice",
                   ["-i", "SameProfileConflict"],
                   before, before).fail("run", 102)
@@ -1124,6 +1485,18 @@ DirRegressionTest("Event: --skipafter",
 DirRegressionTest("Event: --skipevents",
                   ["-u", "--skipevents", "SuperProfileEvent"],
                   after_event, after_event_no_event, "event").success()
+DirRegressionTest("Event: On Update (shards)",
+                  ["-if", "SuperProfileEvent"],
+                  after_event, after_event_update, "event-shards").success()
+DirRegressionTest("Event: On Uninstall (shards)",
+                  ["-u", "SuperProfileEvent"],
+                  after_event, before, "event-shards").success()
+DirRegressionTest("Event: --skipafter (shards)",
+                  ["-if", "--skipafter", "SuperProfileEvent"],
+                  after_event, after_event_no_after, "event-shards").success()
+DirRegressionTest("Event: --skipevents (shards)",
+                  ["-u", "--skipevents", "SuperProfileEvent"],
+                  after_event, after_event_no_event, "event-shards").success()
 DirRegressionTest("Event: Conflicts with linking",
                   ["-i", "ConflictProfileEvent"],
                   before, before).fail("run", 103)
@@ -1142,9 +1515,82 @@ DirRegressionTest("Update: Simple",
 DirRegressionTest("Update: Uninstall",
                   ["-u", "DirOption"],
                   after_diroptions, before, "update").success()
+DirRegressionTest("Update: Simple (prefetch)",
+                  ["-i", "DirOption"],
+                  after_diroptions, after_updatediroptions,
+                  "update-prefetch").success()
+DirRegressionTest("Update: Uninstall (prefetch)",
+                  ["-u", "DirOption"],
+                  after_diroptions, before, "update-prefetch").success()
+DirRegressionTest("Update: --rollback",
+                  ["--rollback", "0"],
+                  after_diroptions, before, "update").success()
 DirRegressionTest("Update: --dui",
                   ["-i", "--dui", "SuperProfileTags"],
                   after_tags, after_updatedui, "nested").success()
+DirRegressionTest("Update: Uninstall with subprofiles",
+                  ["-u", "SuperProfileTags"],
+                  after_tags, before, "nested").success()
+DirRegressionTest("Update: --dui (sqlite)",
+                  ["-i", "--dui", "SuperProfileTags"],
+                  after_tags, after_updatedui, "nested-sqlite").success()
+DirRegressionTest("Update: Uninstall with subprofiles (sqlite)",
+                  ["-u", "SuperProfileTags"],
+                  after_tags, before, "nested-sqlite").success()
+GitIndexRegressionTest("Command: useGitIndex",
+                       ["-i", "GitIndex"],
+                       before, after_gitindex,
+                       ["untracked-dir/untracked.file",
+                        "untracked-dir/ignored-dir/untracked-ignored.file",
+                        "ignored-dir/untracked-dir/untracked-ignored.file"]
+                       ).success()
+CacheRegressionTest("Cache: Reuse unchanged profile",
+                    ["-i", "CacheEnv"],
+                    before, after_cacheenv, True).success()
+CacheRegressionTest("Cache: Dotfile added",
+                    ["-i", "CacheEnv"],
+                    before, after_cacheenv, False, add_dotfile).success()
+CacheRegressionTest("Cache: Environment variable changed",
+                    ["-i", "CacheEnv"],
+                    before, after_cacheenvchanged, False,
+                    env={"UBERDOT_TEST_NAME": "other"}).success()
+CacheRegressionTest("Cache: Profile module changed",
+                    ["-i", "CacheEnv"],
+                    before, after_cacheenv, False, touch_profiles).success()
+CacheRegressionTest("Cache: Never cache pipe()",
+                    ["-i", "CachePipe"],
+                    before, after_cachepipe, False).success()
+CacheRegressionTest("Cache: Reuse decrypting profile",
+                    ["-i", "CacheDecrypt"],
+                    before, after_cachedecrypt, True).success()
+SequenceRegressionTest("Rollback: Intermediate generation",
+                       [["-i", "--option", "permission=640", "tags=notag",
+                         "--", "DirOption"],
+                        ["-i", "--option", "permission=600", "secure=false",
+                         "prefix=x", "tags=notag", "--", "DirOption"],
+                        ["-u", "DirOption"],
+                        ["--rollback", "2"]],
+                       after_diroptions, after_rollbackupdate,
+                       "update").success()
+SequenceRegressionTest("Rollback: Removed profile",
+                       [["-i", "--option", "permission=640", "tags=notag",
+                         "--", "DirOption"],
+                        ["-i", "--option", "permission=600", "secure=false",
+                         "prefix=x", "tags=notag", "--", "DirOption"],
+                        ["-u", "DirOption"],
+                        ["--rollback", "3"]],
+                       after_diroptions, after_rollbackremove,
+                       "update").success()
+DirRegressionTest("Rollback: History doesn't match installed-file",
+                  ["--rollback", "0"],
+                  after_tags, after_tags, "nested").fail("run", 103)
+LockRegressionTest("Lock: --show waits for other instance",
+                   ["-s"],
+                   before, before, "default", True).success()
+LockRegressionTest("Lock: Other installed-file doesn't wait",
+                   ["-i", "DirOption"],
+                   after_diroptions, after_updatediroptions, "default", False,
+                   "update").success()
 OutputRegressionTest("Output: --print",
                      ["-i", "--print", "NoOptions"],
                      before).success()
@@ -1155,6 +1601,19 @@ OutputRegressionTest("Output: --dryrun",
                      ["-id", "NoOptions"],
                      before).success()
 OutputRegressionTest("Output: --debuginfo", ["--debuginfo"], before).success()
+SequenceRegressionTest("Output: --history",
+                       [["-i", "DirOption"], ["-u", "DirOption"],
+                        ["--history"]],
+                       after_diroptions, before, "update",
+                       [b"Generation 1:\n  Date: 2019-07-29 15:30:04\n" +
+                        b"  Operations: 8\n  Profiles: DirOption\n",
+                        b"Generation 2:", b"  Operations: 10\n",
+                        b"Generation 3:", b"  Operations: 5\n"]).success()
+DirRegressionTest("Ignore: --userenv outside of the temporary directory",
+                  ["--userenv",
+                   os.path.join(DIRNAME, "data/installed/update.json"),
+                   "-u", "DirOption"],
+                  after_diroptions, before, "update").success()
 DirRegressionTest("Fail: Not a profile",
                   ["-i", "NotAProfileFail"],
                   before, before).fail("run", 104)
@@ -1173,6 +1632,15 @@ DirRegressionTest("Fail: Cycle in profile",
 DirRegressionTest("Fail: Link moved between profiles",
                   ["-i", "SuperProfileTags"],
                   after_tags, before, "nested").fail("run", 102)
+DirRegressionTest("Fail: Link moved between profiles (sqlite)",
+                  ["-i", "SuperProfileTags"],
+                  after_tags, before, "nested-sqlite").fail("run", 102)
+DirRegressionTest("Fail: Link installed by unloaded profile",
+                  ["-i", "DirOption"],
+                  after_event, after_event, "event").fail("run", 102)
+DirRegressionTest("Fail: Link installed by unloaded profile (shards)",
+                  ["-i", "DirOption"],
+                  after_event, after_event, "event-shards").fail("run", 102)
 # This test needs ticket #42 to be resolved
 # OutputRegressionTest("Output: --show", ["-s"], after_diroptions, "update").success()
 
@@ -33,7 +33,7 @@ from uberdot.utils import find_files
 from uberdot.utils import get_user_env_var
 from uberdot.utils import normpath
 
-VERSION = "1.13.2_4"
+VERSION = "1.22.1_6"
 
 """Version numbers, seperated by underscore.
 
@@ -116,13 +116,47 @@ some static files."""
 SMART_CD = True
 """True, if event shell scripts shall automatically change the directory
 to the directory of the profile that triggered the event."""
+USE_GIT_INDEX = False
+"""True, if the dotfiles shall be read from the index of the git repository
+that contains :const:`TARGET_FILES` instead of walking through it."""
+GENERATION_CACHE = False
+"""True, if the results of root profiles shall be cached and reused as long
+as nothing that they depend on changed."""
+PREFETCH_DIRS = False
+"""True, if the directories of links shall be read entirely when a link is
+checked for the first time, instead of querying every file on its own."""
+INSTALLED_FORMAT = "json"
+"""The format in which the installed-file is stored. Either ``json``,
+``sqlite`` or ``shards``. Default is ``json``."""
 
 # Internal values
 """The path to the data directory."""
 INSTALLED_FILE = os.path.join(DATA_DIR, "installed/%s.json")
 """The path to the installed-file that will be used for comparison."""
-INSTALLED_FILE_BACKUP = INSTALLED_FILE + "." + BACKUP_EXTENSION
-"""The path to the file that will be used as backup of the installed-file."""
+INSTALLED_JOURNAL_FILE = os.path.join(DATA_DIR, "installed/%s.journal")
+"""The path to the journal of the installed-file that stores all operations
+that were applied since the installed-file was written."""
+INSTALLED_DB_FILE = os.path.join(DATA_DIR, "installed/%s.sqlite")
+"""The path to the database that stores the installed-file, if
+:const:`INSTALLED_FORMAT` is ``sqlite``."""
+INSTALLED_SHARD_DIR = os.path.join(DATA_DIR, "installed/%s")
+"""The path to the directory that stores the shards of the installed-file,
+if :const:`INSTALLED_FORMAT` is ``shards``."""
+HISTORY_FILE = os.path.join(DATA_DIR, "history/%s.jsonl")
+"""The path to the file that stores the history of the installed-file."""
+INSTALLED_LOCK_FILE = os.path.join(DATA_DIR, "installed/%s.lock")
+"""The path to the file that is locked while the installed-file and its
+history are used."""
+DYNAMIC_LOCK_FILE = os.path.join(DATA_DIR, "dynamic.lock")
+"""The path to the file that is locked while dynamic files are generated."""
+DOTFILE_INDEX_FILE = os.path.join(DATA_DIR, "cache/dotfiles.json")
+"""The path to the file that caches the directory listings of
+:const:`TARGET_FILES`."""
+PROFILE_REGISTRY_FILE = os.path.join(DATA_DIR, "cache/profiles.json")
+"""The path to the file that caches which module of :const:`PROFILE_FILES`
+defines which class."""
+GENERATION_CACHE_FILE = os.path.join(DATA_DIR, "cache/generation.json")
+"""The path to the file that caches the results of root profiles."""
 DIR_DEFAULT = "$HOME"
 """The default path that profiles start in."""
 DEFAULTS = {
@@ -166,15 +200,35 @@ settings of all configuration files will be used. If a specific setting is set
 in more than one configuration file, the setting from the configuration file
 with higher index will be prefered.
 """
-CONFIG_SEARCH_PATHS = [
-    "/etc/uberdot",
-    os.path.join(
-        get_user_env_var('XDG_CONFIG_HOME', normpath('~/.config')),
-        "uberdot"
-    ),
-    DATA_DIR
-]
-"""A list of paths that will be used to search for configuration files. """
+CONFIG_SEARCH_PATHS = []
+"""A list of paths that will be used to search for configuration files. This
+is set by :func:`get_config_search_paths()` when it is needed for the first
+time, because looking up the environment of the user can be slow."""
+
+
+def get_config_search_paths():
+    """Gets :const:`CONFIG_SEARCH_PATHS` and sets it up if that wasn't done
+    yet.
+
+    Returns:
+        list: The paths that will be used to search for configuration files
+    """
+    global CONFIG_SEARCH_PATHS
+    if not CONFIG_SEARCH_PATHS:
+        CONFIG_SEARCH_PATHS = [
+            "/etc/uberdot",
+            os.path.join(
+                get_user_env_var('XDG_CONFIG_HOME', normpath('~/.config')),
+                "uberdot"
+            ),
+            os.path.join(
+                os.path.dirname(
+                    os.path.dirname(sys.modules[__name__].__file__)
+                ),
+                "data"
+            )
+        ]
+    return CONFIG_SEARCH_PATHS
 
 
 def loadconfig(config_file, installed_filename="default"):
@@ -193,16 +247,20 @@ def loadconfig(config_file, installed_filename="default"):
     global C_OK, C_WARNING, C_FAIL, ENDC, BOLD, C_HIGHLIGHT, NOBOLD, C_DEBUG
     global DUISTRATEGY, FORCE, LOGGINGLEVEL, MAKEDIRS, DECRYPT_PWD, SUPERFORCE
     global SKIPROOT, DATA_DIR, SHELL, SHELL_TIMEOUT, SMART_CD, SKIPEVENTS
-    global BACKUP_EXTENSION, PROFILE_FILES, TARGET_FILES, INSTALLED_FILE_BACKUP
+    global BACKUP_EXTENSION, PROFILE_FILES, TARGET_FILES
     global COLOR, INSTALLED_FILE, DEFAULTS, DIR_DEFAULT, LOGFILE, CFG_FILES
     global ASKROOT, TAG_SEPARATOR, HASH_SEPARATOR, SKIPAFTER, SKIPBEFORE
-    global SHELL_ARGS
+    global SHELL_ARGS, DOTFILE_INDEX_FILE, USE_GIT_INDEX
+    global PROFILE_REGISTRY_FILE, GENERATION_CACHE, GENERATION_CACHE_FILE
+    global PREFETCH_DIRS, HISTORY_FILE, INSTALLED_JOURNAL_FILE
+    global INSTALLED_FORMAT, INSTALLED_DB_FILE, INSTALLED_SHARD_DIR
+    global INSTALLED_LOCK_FILE, DYNAMIC_LOCK_FILE
 
     # Load config files
     if config_file:
         CFG_FILES = [config_file]
     else:
-        CFG_FILES = find_files("uberdot.ini", CONFIG_SEARCH_PATHS)
+        CFG_FILES = find_files("uberdot.ini", get_config_search_paths())
     config = configparser.ConfigParser()
     try:
         for cfg in CFG_FILES:
@@ -284,10 +342,22 @@ def loadconfig(config_file, installed_filename="default"):
     DATA_DIR = normpath(getstr("dataDir", DATA_DIR))
     COLOR = getbool("color", COLOR)
     SMART_CD = getbool("smartShellCWD", SMART_CD)
+    USE_GIT_INDEX = getbool("useGitIndex", USE_GIT_INDEX)
+    GENERATION_CACHE = getbool("generationCache", GENERATION_CACHE)
+    PREFETCH_DIRS = getbool("prefetchDirs", PREFETCH_DIRS)
+    INSTALLED_FORMAT = getstr("installedFormat", INSTALLED_FORMAT).lower()
 
     # Setup internal values
     INSTALLED_FILE = os.path.join(DATA_DIR, "installed/%s.json")
-    INSTALLED_FILE_BACKUP = INSTALLED_FILE + "." + BACKUP_EXTENSION
+    INSTALLED_JOURNAL_FILE = os.path.join(DATA_DIR, "installed/%s.journal")
+    INSTALLED_DB_FILE = os.path.join(DATA_DIR, "installed/%s.sqlite")
+    INSTALLED_SHARD_DIR = os.path.join(DATA_DIR, "installed/%s")
+    HISTORY_FILE = os.path.join(DATA_DIR, "history/%s.jsonl")
+    INSTALLED_LOCK_FILE = os.path.join(DATA_DIR, "installed/%s.lock")
+    DYNAMIC_LOCK_FILE = os.path.join(DATA_DIR, "dynamic.lock")
+    DOTFILE_INDEX_FILE = os.path.join(DATA_DIR, "cache/dotfiles.json")
+    PROFILE_REGISTRY_FILE = os.path.join(DATA_DIR, "cache/profiles.json")
+    GENERATION_CACHE_FILE = os.path.join(DATA_DIR, "cache/generation.json")
     if not COLOR:
         C_OK = C_WARNING = C_FAIL = ENDC = BOLD = C_HIGHLIGHT = NOBOLD = ''
         C_DEBUG = ''
@@ -314,10 +384,18 @@ def loadconfig(config_file, installed_filename="default"):
 
     # Insert installed-file into constants
     INSTALLED_FILE = INSTALLED_FILE % installed_filename
-    INSTALLED_FILE_BACKUP = INSTALLED_FILE_BACKUP % installed_filename
+    INSTALLED_JOURNAL_FILE = INSTALLED_JOURNAL_FILE % installed_filename
+    INSTALLED_DB_FILE = INSTALLED_DB_FILE % installed_filename
+    INSTALLED_SHARD_DIR = INSTALLED_SHARD_DIR % installed_filename
+    HISTORY_FILE = HISTORY_FILE % installed_filename
+    INSTALLED_LOCK_FILE = INSTALLED_LOCK_FILE % installed_filename
 
     # Check if TARGET_FILES and PROFILE_FILES were set by the user
     if not TARGET_FILES or TARGET_FILES == "</path/to/your/dotfiles/>":
         raise UserError("No directory for your dotfiles specified.")
     if not PROFILE_FILES or PROFILE_FILES == "</path/to/your/profiles/>":
         raise UserError("No directory for your profiles specified.")
+    if INSTALLED_FORMAT not in ("json", "sqlite", "shards"):
+        raise UserError("'" + INSTALLED_FORMAT + "' is no valid format " +
+                        "for installed-files. Use 'json', 'sqlite' or " +
+                        "'shards'.")
@@ -6,6 +6,7 @@ the standart DiffSolver) and their resulting data structure DiffLog.
 
     DiffLog
     DiffSolver
+    Operation
 """
 
 ###############################################################################
@@ -30,28 +31,70 @@ the standart DiffSolver) and their resulting data structure DiffLog.
 ###############################################################################
 
 
-import copy
+import time
 from abc import abstractmethod
 from uberdot.errors import FatalError
+from uberdot.errors import PreconditionError
+from uberdot.installedfile import PROFILE_FIELDS
+from uberdot.installedfile import InstalledIndex
+from uberdot.installedfile import LinkDescriptor
+from uberdot.installedfile import Record
 from uberdot.interpreters import Interpreter
 from uberdot.utils import get_date_time_now
 from uberdot.utils import import_profile_class
+from uberdot.utils import log_debug
 from uberdot.utils import log_warning
 from uberdot.utils import normpath
 
 
+class Operation(Record):
+    """A single operation of a :class:`DiffLog`. Which fields are set depends
+    on the type of the operation.
+
+    Attributes:
+        operation (str): The type of the operation, e.g. ``add_l``
+        profile (str): The name of the profile that the operation belongs to
+        message (str): The message of an ``info`` operation
+        parent (str): The (new) parent of an ``add_p`` or ``update_p``
+            operation
+        symlink (LinkDescriptor): The link of an ``add_l`` operation
+        symlink_name (str): The name of the link of a ``remove_l`` operation
+        symlink1 (LinkDescriptor): The installed link of an ``update_l``
+            operation
+        symlink2 (LinkDescriptor): The new link of an ``update_l`` operation
+        enabled (bool): If the script of an ``update_s`` operation is
+            enabled
+        event (str): The event of an ``update_s`` operation
+    """
+
+    __slots__ = ("operation", "profile", "message", "parent", "symlink",
+                 "symlink_name", "symlink1", "symlink2", "enabled", "event")
+
+
 class DiffLog():
     """This class stores the operations that were determined by a
     Difference-Solver. Furthermore it provides helpers to create such
     operations and a function that allows multiple interpreters to interprete
     the operations at the same time.
 
+    A DiffLog can also be streamed. Then the operations are generated by its
+    solver not until interpreters are run for the first time, and they are
+    interpreted while they are generated.
+
     Attributes:
         data (list): Used to store the operations
+        solver (DiffSolver): The solver that will generate the operations
+            when interpreters are run for the first time. ``None``, if the
+            operations were generated already.
+        keep (bool): False, if generated operations are only interpreted
+            but not stored in ``data``
     """
     def __init__(self):
         """Constructor"""
         self.data = []
+        self.solver = None
+        self.keep = True
+        self.__traversal = None
 
     def add_info(self, profilename, message):
         """Create an info operation.
@@ -132,11 +175,11 @@ class DiffLog():
         filesystem and create an entry in the installed file.
 
         Args:
-            symlink (dict): A dictionary that describes the symbolic link that
-                needs to be created
+            symlink (LinkDescriptor): Describes the symbolic link that needs
+                to be created
             profilename (str): The name of profile that the link belongs to
         """
-        symlink["date"] = get_date_time_now()
+        symlink.date = get_date_time_now()
         self.__append_data("add_l", profilename, symlink=symlink)
 
     def remove_link(self, symlink_name, profilename):
@@ -163,12 +206,12 @@ class DiffLog():
         entry of the old link in the installed-file.
 
         Args:
-            installed_symlink (dict): A dictionary that describes the symbolic
-                link that needs to be replaced
-            new_symlink (dict): A dictionary that describes the symbolic
-                link that will replace the old link
+            installed_symlink (LinkDescriptor): Describes the symbolic link
+                that needs to be replaced
+            new_symlink (LinkDescriptor): Describes the symbolic link that
+                will replace the old link
         """
-        new_symlink["date"] = get_date_time_now()
+        new_symlink.date = get_date_time_now()
         self.__append_data("update_l", profilename,
                            symlink1=installed_symlink,
                            symlink2=new_symlink)
@@ -198,9 +241,12 @@ class DiffLog():
                 operation
             **kwargs (dict): All further key/value pairs of the operation
         """
-        self.data.append(
-            {"operation": operation, "profile": profilename, **kwargs}
-        )
+        operation = Operation(operation=operation, profile=profilename,
+                              **kwargs)
+        if self.keep:
+            self.data.append(operation)
+        if self.__traversal is not None:
+            self.__traversal.feed(operation)
 
     def run_interpreter(self, *interpreters):
         """Run a list of :mod:`interpreters` for all operations.
@@ -214,19 +260,149 @@ class DiffLog():
             interpreters (Interpreter): A list of interpreters that will
                 interpret the operations
         """
-        # Initialize interpreters
-        for interpreter in interpreters:
-            interpreter.set_difflog_data(self.data)
-        # Send a "start" operation to indicate that operations will follow
-        for interpreter in interpreters:
-            interpreter.call_operation({"operation": "start"})
-        # Run interpreters for every operation
-        for operation in self.data:
-            for interpreter in interpreters:
-                interpreter.call_operation(operation)
-        # And send a "fin" operation when we are finished
-        for interpreter in interpreters:
-            interpreter.call_operation({"operation": "fin"})
+        self.run_pipeline(interpreters)
+
+    def run_pipeline(self, *stages):
+        """Run a list of stages for all operations. A stage is a single
+        interpreter or a list of interpreters that are run together like in
+        :func:`run_interpreter()`.
+
+        Consecutive stages that only consist of read-only interpreters (see
+        :const:`~interpreters.Interpreter.READONLY`) are fused into a single
+        traversal of all operations. The result is the same as running the
+        stages one after another: If a stage raises an error, all later stages
+        are dropped, but all earlier stages will still interpret the
+        remaining operations, because their errors take precedence.
+
+        If the DiffLog is streamed, the operations are generated now and
+        the first traversal interprets them while they are generated.
+
+        Args:
+            stages (list): A list of stages that will interpret the
+                operations
+        Raises:
+            :class:`~errors.FatalError`: The operations need to be traversed
+                multiple times, but they were not stored
+        """
+        groups = []
+        for stage in stages:
+            if isinstance(stage, Interpreter):
+                stage = [stage]
+            readonly = all(interpreter.READONLY for interpreter in stage)
+            if readonly and groups and groups[-1][0]:
+                groups[-1][1].append(stage)
+            else:
+                groups.append((readonly, [stage]))
+        groups = [group for _, group in groups]
+        if self.solver is not None:
+            if len(groups) > 1 and not self.keep:
+                raise FatalError("The operations can't be interpreted " +
+                                 "multiple times, because they are streamed.")
+            solver, self.solver = self.solver, None
+            self.__traversal = Traversal(groups.pop(0), self.data)
+            try:
+                solver.solve(self)
+            finally:
+                traversal, self.__traversal = self.__traversal, None
+            traversal.finish()
+        for group in groups:
+            traversal = Traversal(group, self.data)
+            for operation in self.data:
+                traversal.feed(operation)
+            traversal.finish()
+
+
+class Traversal():
+    """A single traversal of operations by multiple stages of interpreters.
+
+    The stages interpret every operation in order. If a stage fails, it is
+    deactivated together with all later stages. The error of the first stage
+    that failed is raised when the traversal finishes or when all stages are
+    deactivated.
+
+    Attributes:
+        stages (list): The stages. Every stage is a list of interpreters.
+        handlers (dict): The implementations of every stage by the name of an
+            operation
+        tables (list): The dispatch tables of all interpreters for each stage
+        timings (list): The time in seconds that every stage took
+        active (int): The number of stages that are still active
+        failure (Exception): The error of the first stage that failed
+    """
+    def __init__(self, stages, data):
+        """Constructor.
+
+        Initializes all interpreters and feeds them the "start" operation.
+
+        Args:
+            stages (list): The stages that will interpret the operations
+            data (list): The raw DiffLog that will be passed to the
+                interpreters
+        """
+        self.stages = stages
+        self.handlers = {}
+        self.tables = []
+        for stage in stages:
+            for interpreter in stage:
+                interpreter.set_difflog_data(data)
+            self.tables.append(
+                [interpreter.get_dispatch_table() for interpreter in stage]
+            )
+        self.timings = [0.0] * len(stages)
+        self.active = len(stages)
+        self.failure = None
+        self.feed(Operation(operation="start"))
+
+    def feed(self, operation):
+        """Lets all active stages interpret an operation.
+
+        Args:
+            operation (Operation): The operation
+        Raises:
+            Exception: The error of the first stage that failed, if all
+                stages are deactivated now
+        """
+        name = operation.operation
+        handlers = self.handlers.get(name)
+        if handlers is None:
+            # Look up the implementations of this operation only once
+            handlers = [[table[name] for table in stage if name in table]
+                        for stage in self.tables]
+            self.handlers[name] = handlers
+        clock = time.perf_counter
+        last = clock()
+        for i in range(self.active):
+            if not handlers[i]:
+                continue
+            try:
+                for handler in handlers[i]:
+                    handler(operation)
+            except Exception as err:
+                self.failure = err
+                self.active = i
+            now = clock()
+            self.timings[i] += now - last
+            last = now
+            if i == self.active:
+                break
+        if not self.active:
+            self.finish()
+
+    def finish(self):
+        """Feeds the "fin" operation to all active stages and logs how long
+        each stage took.
+
+        Raises:
+            Exception: The error of the first stage that failed
+        """
+        if self.active:
+            self.feed(Operation(operation="fin"))
+        for stage, timing in zip(self.stages, self.timings):
+            log_debug("Interpreting operations with " +
+                      ", ".join(type(interp).__name__ for interp in stage) +
+                      " took " + str(round(timing * 1000, 1)) + "ms.")
+        if self.failure is not None:
+            raise self.failure
 
 
 class DiffSolver():
@@ -245,12 +421,17 @@ class DiffSolver():
         """ Constructor."""
         self.difflog = None
 
-    def solve(self, difflog=None):
+    def solve(self, difflog=None, stream=False, keep=True):
         """Start solving differences.
 
         Args:
             difflog (DiffLog): A DiffLog that will be used to store (append)
                 all operations instead of the internal DiffLog
+            stream (bool): If True, the operations will be generated not until
+                interpreters are run on the resulting DiffLog, so they can
+                interpret them while they are generated
+            keep (bool): If False, streamed operations will not be stored in
+                the resulting DiffLog
         returns:
             DiffLog: the resulting DiffLog
         """
@@ -258,7 +439,11 @@ class DiffSolver():
             self.difflog = DiffLog()
         else:
             self.difflog = difflog
-        self._generate_operations()
+        if stream:
+            self.difflog.solver = self
+            self.difflog.keep = keep
+        else:
+            self._generate_operations()
         return self.difflog
 
     @abstractmethod
@@ -276,20 +461,29 @@ class UninstallDiffSolver(DiffSolver):
 
     Attributes:
         installed (dict): The installed-file that is used for solving
+        index (InstalledIndex): The index of the installed-file
         profile_names (list): A list of profile names that will be uninstalled
     """
-    def __init__(self, installed, profile_names):
+    def __init__(self, installed, profile_names, index=None):
         """ Constructor.
 
         Args:
             installed (dict): The installed-file that is used for solving
             profile_names (list): A list of profile names that will be
                 uninstalled
+            index (InstalledIndex): An index of the installed-file that
+                will be used instead of creating a new one
         """
         super().__init__()
         self.installed = installed
+        self.index = index
         self.profile_names = profile_names
 
+    def solve(self, difflog=None, stream=False, keep=True):
+        if self.index is None:
+            self.index = InstalledIndex(self.installed)
+        return super().solve(difflog, stream, keep)
+
     def _generate_operations(self, profilelist=None):
         """Generates operations to remove all installed profiles of
         ``profilelist``.
@@ -303,7 +497,7 @@ class UninstallDiffSolver(DiffSolver):
         if profilelist is None:
             profilelist = self.profile_names
         for profilename in profilelist:
-            if profilename in self.installed:
+            if profilename in self.index:
                 self.__generate_profile_unlink(profilename)
             else:
                 log_warning("The profile " + profilename +
@@ -319,21 +513,207 @@ class UninstallDiffSolver(DiffSolver):
             profile_name (str): Name of the profile that will be removed
         """
         # Recursive call for all subprofiles
-        subprofiles = []
-        for installed_name, installed_dict in self.installed.items():
-            if ("parent" in installed_dict and
-                    installed_dict["parent"] == profile_name):
-                subprofiles.append(installed_name)
-        self._generate_operations(subprofiles)
+        self._generate_operations(self.index.get_children(profile_name))
         # We are removing all symlinks of this profile before we
         # remove the profile from the installed file
-        installed_links = copy.deepcopy(self.installed[profile_name]["links"])
-        for installed_link in installed_links:
+        for installed_link in self.index.get_links(profile_name):
             self.difflog.remove_link(installed_link["name"], profile_name)
         self.difflog.remove_profile(profile_name)
 
 
-# class HistoryDiffSolver(DiffSolver):
+class HistoryDiffSolver(DiffSolver):
+    """This solver determines the operations that are needed to restore an
+    earlier generation of the installed-file from its history.
+
+    The recorded operations of all later generations are reverted, starting
+    with the latest one, which results in the installed-file as it was at the
+    end of the generation. The generated operations are the differences
+    between the current installed-file and the restored one, so no profile
+    needs to be generated again.
+
+    Attributes:
+        installed (dict): The installed-file that is used for solving
+        history (History): The history of the installed-file
+        generation (int): The generation that will be restored
+    """
+    def __init__(self, installed, history, generation):
+        """ Constructor.
+
+        Args:
+            installed (dict): The installed-file that is used for solving
+            history (History): The history of the installed-file
+            generation (int): The generation that will be restored
+        """
+        super().__init__()
+        self.installed = installed
+        self.history = history
+        self.generation = generation
+
+    def _generate_operations(self):
+        """Generates operations to restore the generation.
+
+        Raises:
+            :class:`~errors.PreconditionError`: The history doesn't match the
+                installed-file
+        """
+        current = self.__load_state(self.installed)
+        target = self.__load_state(self.installed)
+        records = self.history.load(self.generation)
+        try:
+            for record in reversed(records):
+                self.__revert(target, record)
+        except KeyError:
+            msg = "The history of your installed-file doesn't match the "
+            msg += "installed-file itself, so it can't be used to restore "
+            msg += "generation " + str(self.generation) + "."
+            raise PreconditionError(msg)
+        # Remove links and profiles first, so their names can be reused
+        changed = set()
+        for name in self.__ordered(current, reverse=True):
+            links = target[name]["links"] if name in target else {}
+            for linkname in current[name]["links"]:
+                if linkname not in links:
+                    self.difflog.remove_link(linkname, name)
+                    changed.add(name)
+            if name not in target:
+                self.difflog.remove_profile(name)
+        # Then add and update the remaining profiles
+        for name in self.__ordered(target):
+            new, old = target[name], current.get(name)
+            if old is None:
+                old = {"parent": new["parent"], "links": {}, "events": {}}
+                self.difflog.add_profile(name, new["parent"])
+            events = [(event, False) for event in old["events"]
+                      if event not in new["events"] and old["events"][event]]
+            events += [(event, enabled)
+                       for event, enabled in new["events"].items()
+                       if old["events"].get(event) != enabled]
+            links = [(old["links"].get(linkname), link)
+                     for linkname, link in new["links"].items()
+                     if linkname not in old["links"] or
+                     self.__link_key(link) !=
+                     self.__link_key(old["links"][linkname])]
+            if name in current:
+                if new["parent"] != old["parent"]:
+                    self.difflog.update_parent(name, new["parent"])
+                elif events or links or name in changed:
+                    self.difflog.update_profile(name)
+            for event, enabled in events:
+                self.difflog.update_script(enabled, name, event)
+            for installed_link, link in links:
+                if installed_link is None:
+                    self.difflog.add_link(link.copy(), name)
+                else:
+                    self.difflog.update_link(installed_link, link.copy(),
+                                             name)
+
+    @staticmethod
+    def __load_state(installed):
+        """Creates the state of all profiles of an installed-file that can be
+        restored.
+
+        Args:
+            installed (dict): The installed-file
+        Returns:
+            dict: The parent, the links by their name and the events of each
+            profile by its name
+        """
+        state = {}
+        for name, profile in installed.items():
+            if name[0] != "@":
+                state[name] = HistoryDiffSolver.__load_profile(profile)
+                state[name]["links"] = {
+                    link["name"]: link for link in profile["links"]
+                }
+        return state
+
+    @staticmethod
+    def __load_profile(entry):
+        """Creates the state of a single profile without its links.
+
+        Args:
+            entry (dict): The profile entry of the installed-file
+        Returns:
+            dict: The parent, the links and the events of the profile
+        """
+        return {
+            "parent": entry.get("parent"),
+            "links": {},
+            "events": {key: value for key, value in entry.items()
+                       if key not in PROFILE_FIELDS}
+        }
+
+    @staticmethod
+    def __revert(state, record):
+        """Reverts a recorded operation.
+
+        Args:
+            state (dict): The state of all profiles that will be changed
+            record (dict): The record of the operation
+        Raises:
+            KeyError: The operation doesn't match the state
+        """
+        operation = record["operation"]
+        name = record.get("profile")
+        if operation == "add_p":
+            del state[name]
+        elif operation == "remove_p":
+            state[name] = HistoryDiffSolver.__load_profile(record["entry"])
+        elif operation == "update_p":
+            if "old_parent" in record:
+                state[name]["parent"] = record["old_parent"]
+        elif operation == "update_s":
+            if record["old_enabled"] is None:
+                state[name]["events"].pop(record["event"], None)
+            else:
+                state[name]["events"][record["event"]] = record["old_enabled"]
+        elif operation == "add_l":
+            del state[name]["links"][record["symlink"]["name"]]
+        elif operation == "remove_l":
+            if record["symlink"] is not None:
+                link = LinkDescriptor.from_dict(record["symlink"])
+                state[name]["links"][link.name] = link
+        elif operation == "update_l":
+            links = state[name]["links"]
+            del links[record["symlink2"]["name"]]
+            link = LinkDescriptor.from_dict(record["symlink1"])
+            links[link.name] = link
+
+    @staticmethod
+    def __link_key(symlink):
+        """Creates a key for a link that is the same for all links that would
+        be created the same way.
+
+        Args:
+            symlink (LinkDescriptor): The link
+        Returns:
+            tuple: The key of the link
+        """
+        return (symlink.target, symlink.uid, symlink.gid, symlink.permission,
+                symlink.secure)
+
+    @staticmethod
+    def __ordered(state, reverse=False):
+        """Orders the profiles of a state, so parents come before their
+        subprofiles.
+
+        Args:
+            state (dict): The state of all profiles
+            reverse (bool): If True, subprofiles come before their parents
+        Returns:
+            list: The names of all profiles
+        """
+        depths = {}
+
+        def depth(name):
+            if name not in depths:
+                depths[name] = 0
+                parent = state[name]["parent"]
+                if parent in state:
+                    depths[name] = depth(parent) + 1
+            return depths[name]
+
+        return sorted(state, key=depth, reverse=reverse)
 
 
 class UpdateDiffSolver(DiffSolver):
@@ -342,6 +722,7 @@ class UpdateDiffSolver(DiffSolver):
 
     Attributes:
         installed (dict): The installed-file that is used for solving
+        index (InstalledIndex): The index of the installed-file
         profile_results (dict): The result of the executed profiles
         parent(str): The name of the parent that all profiles will change
             its parent to (only set if ``--parent`` was specified)
@@ -357,6 +738,7 @@ class UpdateDiffSolver(DiffSolver):
         """
         super().__init__()
         self.installed = installed
+        self.index = None
         self.profile_results = profile_results
         self.parent = parent
 
@@ -366,11 +748,12 @@ class UpdateDiffSolver(DiffSolver):
         This function resolves each root profile with their subprofiles
         separately.
         """
-        allpnames = []
+        self.index = InstalledIndex(self.installed)
+        allpnames = set()
 
         def add_profilenames(profile):
             """Recursively add all names of subprofiles to allpnames"""
-            allpnames.append(profile["name"])
+            allpnames.add(profile["name"])
             for prof in profile["profiles"]:
                 add_profilenames(prof)
 
@@ -380,6 +763,20 @@ class UpdateDiffSolver(DiffSolver):
             # Generate difflog from diff between links and installed
             self.__generate_profile_link(profile, allpnames, self.parent)
 
+    @staticmethod
+    def __link_key(symlink):
+        """Creates a key for a link that is the same for all links that are
+        equal. The first two elements are the normalized name and target,
+        which are used to find similar links.
+
+        Args:
+            symlink (LinkDescriptor): The link
+        Returns:
+            tuple: The key of the link
+        """
+        return (normpath(symlink.name), normpath(symlink.target),
+                symlink.uid, symlink.gid, symlink.permission, symlink.secure)
+
     def __generate_profile_link(self, profile_dict, all_profilenames,
                                 parent_name):
         """Generate operations for resolving the differences between a single
@@ -390,103 +787,125 @@ class UpdateDiffSolver(DiffSolver):
         Args:
             profile_dict (dict): The result of an executed profile that will be
                 compared against the installed-file
-            all_profilenames (list): A list with all profile names (including
+            all_profilenames (set): A set with all profile names (including
                 all sub- and root-profiles)
             parent_name (str): The name of the profiles (new) parent. If
                 parent_name is ``None``, the profile is treated as a root
                 profile
         """
-        def symlinks_similar(sym1, sym2):
-            return normpath(sym1["name"]) == normpath(sym2["name"]) or \
-                   normpath(sym1["target"]) == normpath(sym2["target"])
-
-        def symlinks_equal(sym1, sym2):
-            return normpath(sym1["name"]) == normpath(sym2["name"]) and \
-                   normpath(sym1["target"]) == normpath(sym2["target"]) and \
-                   sym1["uid"] == sym2["uid"] and \
-                   sym1["gid"] == sym2["gid"] and \
-                   sym1["permission"] == sym2["permission"] and \
-                   sym1["secure"] == sym2["secure"]
-
         profile_new = False
         profile_changed = False
 
         # Load the links from the InstalledLog
         profile_name = profile_dict["name"]
         installed_profile = None
-        if profile_name in self.installed:
+        if profile_name in self.index:
             installed_profile = self.installed[profile_name]
-            installed_links = copy.deepcopy(installed_profile["links"])
+            installed_links = [link.copy()
+                               for link in self.index.get_links(profile_name)]
         else:
             installed_links = []
             # The profile wasn't installed
             self.difflog.add_profile(profile_name, parent_name)
             profile_new = True
         # And from the new profile
-        new_links = copy.deepcopy(profile_dict["links"])
+        new_links = [link.copy() for link in profile_dict["links"]]
 
-        # Now we can compare installed_dict and profile_dict and write
-        # the difflog that resolves these differences
-        # To do so we actually compare installed_links with new_links
-        # and check which links
+        # Now we can compare installed_links with new_links and check which
+        # links
         #   - didn't changed (must be the same in both)
         #   - are removed (occure only in installed_links)
         #   - are updated (two links that differ, but name or target are same)
         #   - are added (occure only in new_links)
-        # Whenever we find a link to be unchanged/removed/etc. we will remove
-        # it from new_links and installed_links, so in the end both lists
-        # need to be empty.
-
-        # Check all unchanged
+        # To do this in linear time, the links are indexed by their
+        # normalized name and target. Whenever we find a link to be
+        # unchanged/removed/etc. we will set it to None in new_links and
+        # installed_links, so in the end both lists need to be empty.
+        installed_keys = [self.__link_key(link) for link in installed_links]
+        new_keys = [self.__link_key(link) for link in new_links]
+
+        # Check all unchanged. Every installed link is matched with the first
+        # new link that is equal and not matched yet.
+        new_by_key = {}
+        for i, key in enumerate(new_keys):
+            new_by_key.setdefault(key, []).append(i)
+        new_by_key = {key: iter(value) for key, value in new_by_key.items()}
         count = 0
-        for installed_link in installed_links[:]:
-            for new_link in new_links[:]:
-                if symlinks_equal(installed_link, new_link):
-                    # Link in new profile is the same as a installed one,
-                    # so we do nothing to the difflog
-                    installed_links.remove(installed_link)
-                    new_links.remove(new_link)
-                    count += 1
-                    break
+        for i, key in enumerate(installed_keys):
+            match = next(new_by_key.get(key, iter(())), None)
+            if match is not None:
+                # Link in new profile is the same as a installed one,
+                # so we do nothing to the difflog
+                installed_links[i] = None
+                new_links[match] = None
+                count += 1
         if count > 0:
             msg = str(count)
             msg += " links will be left untouched, no changes here..."
             self.difflog.add_info(profile_name, msg)
 
         # Check all removed
-        for installed_link in installed_links[:]:
-            remove = True
-            for new_link in new_links[:]:
-                if symlinks_similar(installed_link, new_link):
-                    remove = False
-                    break
-            if remove:
+        new_names = set()
+        new_targets = set()
+        for i, new_link in enumerate(new_links):
+            if new_link is not None:
+                new_names.add(new_keys[i][0])
+                new_targets.add(new_keys[i][1])
+        installed_by_name = {}
+        installed_by_target = {}
+        for i, installed_link in enumerate(installed_links):
+            if installed_link is None:
+                continue
+            name, target = installed_keys[i][:2]
+            if name not in new_names and target not in new_targets:
                 # Installed link is not similiar to any new link, so create
                 # a remove operation in the difflog
                 profile_changed = True
                 self.difflog.remove_link(installed_link["name"], profile_name)
-                installed_links.remove(installed_link)
+                installed_links[i] = None
+            else:
+                installed_by_name.setdefault(name, []).append(i)
+                installed_by_target.setdefault(target, []).append(i)
+
+        def first_unmatched(indices):
+            """Returns the first index of a link that wasn't matched yet"""
+            while indices and installed_links[indices[-1]] is None:
+                indices.pop()
+            return indices[-1] if indices else None
+
+        # Reverse the lists, so matched indices can be popped from the end
+        for indices in installed_by_name.values():
+            indices.reverse()
+        for indices in installed_by_target.values():
+            indices.reverse()
 
         # Check all changed and added links
-        for new_link in new_links[:]:
-            add = True
-            for installed_link in installed_links[:]:
-                if symlinks_similar(installed_link, new_link):
-                    # new_link has same name or target, so we need to create
-                    # an update operation in the difflog
-                    profile_changed = True
-                    self.difflog.update_link(installed_link, new_link,
-                                             profile_name)
-                    installed_links.remove(installed_link)
-                    new_links.remove(new_link)
-                    add = False
-                    break
-            if add:
+        for i, new_link in enumerate(new_links):
+            if new_link is None:
+                continue
+            name, target = new_keys[i][:2]
+            candidates = [
+                first_unmatched(installed_by_name.get(name, [])),
+                first_unmatched(installed_by_target.get(target, []))
+            ]
+            candidates = [index for index in candidates if index is not None]
+            if candidates:
+                # new_link has same name or target as an installed link, so we
+                # need to create an update operation in the difflog
+                match = min(candidates)
+                profile_changed = True
+                self.difflog.update_link(installed_links[match], new_link,
+                                         profile_name)
+                installed_links[match] = None
+            else:
                 # There was no similar installed link, so we need to create an
                 # add operation in the difflog
                 profile_changed = True
                 self.difflog.add_link(new_link, profile_name)
-                new_links.remove(new_link)
+            new_links[i] = None
+
+        installed_links = [link for link in installed_links if link is not None]
+        new_links = [link for link in new_links if link is not None]
 
         # We removed every symlink from new_links and installed_links when
         # we found the correct operation for them. If they aren't empty now,
@@ -498,14 +917,10 @@ class UpdateDiffSolver(DiffSolver):
 
         # Remove all installed subprofiles that doesnt occur in profile anymore
         if installed_profile is not None:
-            installed_subprofiles = set()
-            profiles_subprofiles = set()
             # First get all subprofiles that were installed
-            for installed_name, installed_dict in self.installed.items():
-                if "parent" in installed_dict:
-                    if installed_dict["parent"] == profile_name:
-                        installed_subprofiles.add(installed_name)
+            installed_subprofiles = self.index.get_children(profile_name)
             # Then get all subprofiles that shall be installed
+            profiles_subprofiles = set()
             if "profiles" in profile_dict:
                 for subprofile in profile_dict["profiles"]:
                     profiles_subprofiles.add(subprofile["name"])
@@ -520,7 +935,8 @@ class UpdateDiffSolver(DiffSolver):
                     old_subprofiles.pop(i)
             # We can use another DiffSolver to create all the operations needed
             # to uninstall all the old profiles and all their links
-            dfs = UninstallDiffSolver(self.installed, old_subprofiles)
+            dfs = UninstallDiffSolver(self.installed, old_subprofiles,
+                                      self.index)
             dfs.solve(self.difflog)
 
         # If something in the profile changed we need to update
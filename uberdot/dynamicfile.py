@@ -46,6 +46,8 @@ from uberdot.utils import md5
 from uberdot.utils import normpath
 from uberdot.utils import log
 from uberdot.utils import log_debug
+from uberdot.utils import record_dependency
+from uberdot.utils import record_file
 
 
 logger = logging.getLogger("root")
@@ -96,7 +98,9 @@ class DynamicFile:
         Args:
             target (str): A path to a file that will be used as source
         """
-        self.sources.append(normpath(target))
+        target = normpath(target)
+        record_file(target)
+        self.sources.append(target)
 
     def update(self):
         """Generates the newest version of the file and writes it
@@ -104,6 +108,7 @@ class DynamicFile:
         # Generate file and calc checksum
         file_bytes = self._generate_file()
         self.md5sum = md5(file_bytes)
+        record_dependency("output", self.getpath(), True)
         # If this version of the file (with same checksum) doesn't exist,
         # write it to the correct location
         if not os.path.isfile(self.getpath()):
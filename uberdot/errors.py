@@ -55,6 +55,14 @@ class CustomError(Exception):
         self._message = message
         super().__init__()
 
+    def __reduce__(self):
+        """Makes the error picklable, so it can be passed between processes.
+
+        The constructors of the subclasses modify the message, so the error
+        is restored without calling them again.
+        """
+        return (_restore_error, (self.__class__, self.__dict__))
+
     @property
     @abstractmethod
     def EXITCODE(self):
@@ -70,6 +78,20 @@ class CustomError(Exception):
         return msg
 
 
+def _restore_error(error_class, state):
+    """Restores a pickled :class:`CustomError`.
+
+    Args:
+        error_class (class): The class of the error
+        state (dict): The attributes of the error
+    Returns:
+        CustomError: The restored error
+    """
+    error = Exception.__new__(error_class)
+    error.__dict__.update(state)
+    return error
+
+
 class FatalError(CustomError):
     """A custom exception for all errors that violate expected invariants."""
 
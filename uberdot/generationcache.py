@@ -0,0 +1,232 @@
+"""
+This module contains the GenerationCache. It stores the results of root
+profiles together with everything their generation depended on, so an
+unchanged profile doesn't need to be generated again.
+
+The dependencies are recorded by :func:`~utils.record_dependency()` while a
+profile is generated. Every kind of dependency has a check that tells if the
+recorded value is still valid. Only what is read via the commands and
+helpers of uberdot is recorded. If ``generate()`` reads files, environment
+variables or anything else directly, e.g. via ``open()``, ``os.environ`` or
+``os.path``, changes of it won't invalidate the cached result.
+
+.. autosummary::
+    :nosignatures:
+
+    GenerationCache
+"""
+
+###############################################################################
+#
+# Copyright 2018 Erik Schulz
+#
+# This file is part of uberdot.
+#
+# uberdot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# uberdot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with uberdot.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+
+import json
+import os
+from uberdot import constants
+from uberdot.installedfile import LinkDescriptor
+from uberdot.utils import get_dir_owner
+from uberdot.utils import get_dotfile_index
+from uberdot.utils import get_user_env
+from uberdot.utils import list_profile_modules
+from uberdot.utils import load_cache_file
+from uberdot.utils import log_debug
+from uberdot.utils import md5
+from uberdot.utils import write_cache_file
+
+
+def _check_dotfiles(root, fingerprint):
+    return get_dotfile_index().fingerprint == fingerprint
+
+
+def _check_env(name, value):
+    return get_user_env().get(name) == value
+
+
+def _check_exists(path, exists):
+    return os.path.exists(path) == exists
+
+
+def _check_file(path, stat):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return [info.st_mtime_ns, info.st_size] == stat
+
+
+def _check_output(path, _):
+    return os.path.exists(path)
+
+
+def _check_owner(path, owner):
+    return list(get_dir_owner(path)) == owner
+
+
+def _check_script(link, script):
+    return (os.path.islink(link) and os.readlink(link) == script and
+            os.path.exists(script))
+
+
+def _decode_result(result):
+    """Creates a copy of a cached result with all links converted back into
+    link descriptors.
+
+    Args:
+        result (dict): The cached result
+    Returns:
+        dict: The converted copy of the result
+    """
+    result = dict(result)
+    result["links"] = [LinkDescriptor.from_dict(link)
+                       for link in result["links"]]
+    result["profiles"] = [_decode_result(subprofile)
+                          for subprofile in result["profiles"]]
+    return result
+
+
+def _encode_result(result):
+    """Creates a copy of a result with all links converted into dictionaries,
+    so it can be stored as JSON.
+
+    Args:
+        result (dict): The result of a profile
+    Returns:
+        dict: The converted copy of the result
+    """
+    result = dict(result)
+    result["links"] = [link.to_dict() for link in result["links"]]
+    result["profiles"] = [_encode_result(subprofile)
+                          for subprofile in result["profiles"]]
+    return result
+
+
+DEPENDENCY_CHECKS = {
+    "dotfiles": _check_dotfiles,
+    "env": _check_env,
+    "exists": _check_exists,
+    "file": _check_file,
+    "output": _check_output,
+    "owner": _check_owner,
+    "script": _check_script,
+}
+"""Maps every kind of dependency to a function that checks if the recorded
+value is still valid."""
+
+
+class GenerationCache:
+    """Stores the results of root profiles in
+    :const:`~constants.GENERATION_CACHE_FILE`.
+
+    A cached result is only used if the profile modules, the options and all
+    relevant settings are the same and all recorded dependencies are still
+    valid.
+
+    Attributes:
+        fingerprint (str): A hash of everything that all root profiles depend
+            on, no matter which dependencies were recorded
+        entries (dict): The cached entries by the name of their profile
+        changed (bool): True, if entries were added or removed
+    """
+    def __init__(self, options, directory):
+        """Constructor.
+
+        Loads the cached results and calculates the fingerprint.
+
+        Args:
+            options (dict): The options for all root profiles
+            directory (str): The directory in which all root profiles start
+        """
+        modules = []
+        for file in list_profile_modules():
+            try:
+                info = os.stat(file)
+            except OSError:
+                continue
+            modules.append([file, info.st_mtime_ns, info.st_size])
+        self.fingerprint = md5(json.dumps([
+            constants.VERSION, constants.TARGET_FILES, constants.DATA_DIR,
+            constants.TAG_SEPARATOR, constants.HASH_SEPARATOR,
+            constants.DIR_DEFAULT, constants.SMART_CD,
+            md5(str(constants.DECRYPT_PWD)), options, directory, modules
+        ], sort_keys=True, default=str))
+        content = load_cache_file(constants.GENERATION_CACHE_FILE)
+        self.entries = {}
+        if content.get("@version") == constants.VERSION:
+            self.entries = content["profiles"]
+        self.changed = False
+
+    def get(self, profilename):
+        """Gets the cached result of a root profile.
+
+        Args:
+            profilename (str): The name of the profile
+        Returns:
+            dict: The cached result. ``None``, if there is no valid result.
+        """
+        entry = self.entries.get(profilename)
+        if entry is None:
+            return None
+        if entry["fingerprint"] != self.fingerprint:
+            log_debug("Cached result of profile '" + profilename +
+                      "' is outdated.")
+            return None
+        for kind, dependencies in entry["dependencies"].items():
+            check = DEPENDENCY_CHECKS[kind]
+            for key, value in dependencies.items():
+                if not check(key, value):
+                    log_debug("Cached result of profile '" + profilename +
+                              "' is outdated, because " + kind + " '" + key +
+                              "' changed.")
+                    return None
+        log_debug("Using cached result of profile '" + profilename + "'.")
+        return _decode_result(entry["result"])
+
+    def put(self, profilename, result, dependencies):
+        """Stores the result of a root profile.
+
+        Args:
+            profilename (str): The name of the profile
+            result (dict): The result of the profile
+            dependencies (dict): The dependencies that were recorded during
+                the generation of the profile
+        """
+        if "uncacheable" in dependencies:
+            log_debug("Result of profile '" + profilename + "' can't be " +
+                      "cached, because it uses " +
+                      ", ".join(dependencies["uncacheable"]) + ".")
+            if self.entries.pop(profilename, None) is not None:
+                self.changed = True
+            return
+        self.entries[profilename] = {
+            "fingerprint": self.fingerprint,
+            "dependencies": dependencies,
+            "result": _encode_result(result)
+        }
+        self.changed = True
+
+    def save(self):
+        """Writes the cache to :const:`~constants.GENERATION_CACHE_FILE` if
+        anything changed."""
+        if self.changed:
+            write_cache_file(constants.GENERATION_CACHE_FILE, {
+                "@version": constants.VERSION,
+                "profiles": self.entries
+            })
@@ -0,0 +1,2010 @@
+"""
+This module contains everything to work with installed-files, that aren't
+part of the interpreters or difference solvers.
+
+.. autosummary::
+    :nosignatures:
+
+    History
+    InstalledFile
+    InstalledIndex
+    Journal
+    LinkDescriptor
+    Record
+    ShardedInstalledFile
+    SQLiteInstalledFile
+"""
+
+###############################################################################
+#
+# Copyright 2018 Erik Schulz
+#
+# This file is part of uberdot.
+#
+# uberdot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# uberdot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with uberdot.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+
+import json
+import os
+import shutil
+import sys
+from uberdot import constants
+from uberdot.errors import PreconditionError
+from uberdot.utils import get_date_time_now
+from uberdot.utils import get_gid
+from uberdot.utils import get_uid
+from uberdot.utils import log_debug
+from uberdot.utils import md5
+from uberdot.utils import normpath
+
+
+class Record:
+    """Base class for compact records with a fixed set of fields.
+
+    Records store their fields in slots instead of a dictionary, but can be
+    accessed like dictionaries as well. A field that was never set is treated
+    like a missing key. Two records are equal, if all their fields are equal.
+
+    Records shouldn't be changed anymore when they are used as keys of
+    dictionaries or in sets.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        """Constructor.
+
+        Args:
+            **fields (dict): The values of the fields
+        Raises:
+            KeyError: A field doesn't exist for this type of record
+        """
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def _values(self):
+        """Returns:
+            tuple: The values of all fields. ``None`` for all fields that are
+            not set.
+        """
+        return tuple(getattr(self, key, None) for key in self.__slots__)
+
+    def get(self, key, default=None):
+        """Gets the value of a field like ``dict.get()``.
+
+        Args:
+            key (str): The name of the field
+            default: The value that is returned if the field is not set
+        Returns:
+            The value of the field
+        """
+        return getattr(self, key, default) if key in self.__slots__ \
+            else default
+
+    def copy(self):
+        """Returns:
+            Record: A shallow copy of this record
+        """
+        record = type(self).__new__(type(self))
+        for key in self.__slots__:
+            if hasattr(self, key):
+                setattr(record, key, getattr(self, key))
+        return record
+
+    def to_dict(self):
+        """Converts the record into a dictionary. The keys are in the same
+        order as the fields.
+
+        Returns:
+            dict: All fields that are set
+        """
+        result = {}
+        for key in self.__slots__:
+            if hasattr(self, key):
+                result[key] = getattr(self, key)
+        return result
+
+
+class LinkDescriptor(Record):
+    """Describes a single link of a profile, as it is stored in the
+    installed-file.
+
+    The name and the target are interned, because a lot of links share them
+    with operations and other profiles.
+
+    Attributes:
+        target (str): The absolute path to the file that the link points to
+        name (str): The absolute path of the link
+        uid (int): The UID of the owner of the link
+        gid (int): The GID of the owner of the link
+        permission (int): The permission of the target
+        secure (bool): True, if the permission of the target will be set
+        date (str): The date when the link was created or updated
+        extra (dict): Further keys of the installed-file that are unknown to
+            this version of uberdot. They are kept, so a link can be
+            converted back without losing anything.
+    """
+
+    __slots__ = ("target", "name", "uid", "gid", "permission", "secure",
+                 "date", "extra")
+
+    def __setattr__(self, key, value):
+        if key in ("name", "target") and isinstance(value, str):
+            value = sys.intern(value)
+        super().__setattr__(key, value)
+
+    def __hash__(self):
+        # Unknown keys are ignored, because their values might be unhashable
+        return hash(self._values()[:-1])
+
+    @classmethod
+    def from_dict(cls, link):
+        """Creates a link descriptor from a link of the installed-file.
+
+        Args:
+            link (dict): The link as it is stored in the installed-file
+        Returns:
+            LinkDescriptor: The link descriptor
+        """
+        fields = {}
+        extra = {}
+        for key, value in link.items():
+            if key in cls.__slots__ and key != "extra":
+                fields[key] = value
+            else:
+                extra[key] = value
+        if extra:
+            fields["extra"] = extra
+        return cls(**fields)
+
+    def to_dict(self):
+        """Converts the link descriptor back into a link of the
+        installed-file.
+
+        Returns:
+            dict: The link as it is stored in the installed-file
+        """
+        result = super().to_dict()
+        result.update(result.pop("extra", {}))
+        return result
+
+
+def encode_record(obj):
+    """Converts records into dictionaries. Used as ``default`` of
+    ``json.dump()``.
+
+    Args:
+        obj: The object that can't be serialized by ``json`` itself
+    Raises:
+        TypeError: The object is no record
+    Returns:
+        dict: The record as dictionary
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+LINK_DEFAULTS = ("uid", "gid", "permission", "secure", "date")
+"""The fields of links that are stored only once per profile by
+:func:`encode_installed()` if most links of the profile share their value."""
+
+
+def _split_path(path):
+    """Splits a path after its last slash. Other than ``os.path.split()``
+    this is lossless, so the path can be restored by concatenation.
+
+    Args:
+        path (str): The path
+    Returns:
+        tuple: The directory including the trailing slash and the filename
+    """
+    head, sep, tail = path.rpartition("/")
+    return head + sep, tail
+
+
+def _encode_profile(profile):
+    """Converts a profile into the compact schema of the installed-file.
+
+    The directories of all names and targets are stored once in ``dirs`` and
+    every link is reduced to a row that references them. The most common
+    value of every field in :const:`LINK_DEFAULTS` is stored once in
+    ``defaults``, so the rows only need to contain values that differ from
+    it.
+
+    Args:
+        profile (dict): The profile with its links as link descriptors
+    Returns:
+        dict: The encoded profile
+    """
+    links = [link.to_dict() for link in profile["links"]]
+    defaults = {}
+    for key in LINK_DEFAULTS:
+        counts = {}
+        for link in links:
+            if key not in link:
+                # Fields that aren't set for all links have no default
+                break
+            counts[link[key]] = counts.get(link[key], 0) + 1
+        else:
+            if counts:
+                defaults[key] = max(counts, key=counts.get)
+    dirs = {}
+    rows = []
+    for link in links:
+        name_dir, name = _split_path(link.pop("name"))
+        target_dir, target = _split_path(link.pop("target"))
+        row = [dirs.setdefault(name_dir, len(dirs)), name,
+               dirs.setdefault(target_dir, len(dirs)), target]
+        overrides = {key: value for key, value in link.items()
+                     if key not in defaults or value != defaults[key]}
+        if overrides:
+            row.append(overrides)
+        rows.append(row)
+    result = {}
+    for key, value in profile.items():
+        if key == "links":
+            result["dirs"] = list(dirs)
+            result["defaults"] = defaults
+            result["links"] = rows
+        else:
+            result[key] = value
+    return result
+
+
+def _decode_profile(profile):
+    """Converts all links of a profile into link descriptors. Links can be
+    stored as rows of the compact schema or as dictionaries like in
+    schema 4 and 5.
+
+    Args:
+        profile (dict): The profile as it is stored in the installed-file
+    Returns:
+        dict: The profile
+    """
+    dirs = profile.pop("dirs", [])
+    defaults = profile.pop("defaults", {})
+    links = []
+    for link in profile["links"]:
+        if isinstance(link, list):
+            fields = dict(defaults)
+            fields["name"] = dirs[link[0]] + link[1]
+            fields["target"] = dirs[link[2]] + link[3]
+            if len(link) > 4:
+                fields.update(link[4])
+            link = fields
+        links.append(LinkDescriptor.from_dict(link))
+    profile["links"] = links
+    return profile
+
+
+def encode_installed(installed):
+    """Converts an installed-file into its compact schema.
+
+    Args:
+        installed (dict): The installed-file with link descriptors
+    Returns:
+        dict: The encoded installed-file. It can be serialized by
+        ``json.dump()``.
+    """
+    return {key: value if key[0] == "@" else _encode_profile(value)
+            for key, value in installed.items()}
+
+
+def decode_installed(installed):
+    """Converts all links of an installed-file into link descriptors.
+
+    Args:
+        installed (dict): The installed-file as loaded by ``json.load()``
+    Returns:
+        dict: The installed-file
+    """
+    for key, profile in installed.items():
+        if key[0] != "@":
+            _decode_profile(profile)
+    return installed
+
+
+def _operation_fields(operation):
+    """Gets the fields of an operation.
+
+    Args:
+        operation: The operation. Either an
+            :class:`~differencesolver.Operation` or a record of the journal.
+    Returns:
+        dict: The fields of the operation without the sequence number and
+        the date of a record
+    """
+    if isinstance(operation, Record):
+        return operation.to_dict()
+    return {key: value for key, value in operation.items()
+            if key not in ("sequence", "date")}
+
+
+def decode_record(record):
+    """Converts all links of a recorded operation into link descriptors.
+
+    Args:
+        record (dict): The operation as loaded by ``json.load()``
+    Returns:
+        dict: The record
+    """
+    for key in ("symlink", "symlink1", "symlink2"):
+        if key in record:
+            record[key] = LinkDescriptor.from_dict(record[key])
+    return record
+
+
+class InstalledIndex:
+    """An index of the profiles of an installed-file, so the relations
+    between profiles can be looked up without scanning the whole
+    installed-file.
+
+    The index is created once and won't be updated if the installed-file
+    changes afterwards.
+
+    Attributes:
+        parents (dict): The name of the parent by profile name. The parent of
+            root profiles is ``None``.
+        children (dict): A list of the names of all subprofiles by the name of
+            their parent. The lists are in the same order as the profiles in
+            the installed-file.
+        links (dict): The list of installed links by profile name
+    """
+    def __init__(self, installed):
+        """Constructor.
+
+        Args:
+            installed (dict): The installed-file that will be indexed
+        """
+        self.parents = {}
+        self.children = {}
+        self.links = {}
+        self._roots = {}
+        for name, profile in installed.items():
+            if name[0] == "@":
+                continue
+            parent = profile.get("parent")
+            self.parents[name] = parent
+            self.links[name] = profile["links"]
+            if parent is not None:
+                self.children.setdefault(parent, []).append(name)
+
+    def __contains__(self, profilename):
+        return profilename in self.parents
+
+    def get_parent(self, profilename):
+        """Gets the parent of an installed profile.
+
+        Args:
+            profilename (str): The name of the profile
+        Returns:
+            str: The name of the parent. ``None`` if the profile is a root
+            profile.
+        """
+        return self.parents[profilename]
+
+    def get_children(self, profilename):
+        """Gets the subprofiles of an installed profile.
+
+        Args:
+            profilename (str): The name of the profile
+        Returns:
+            list: The names of all installed subprofiles
+        """
+        return self.children.get(profilename, [])
+
+    def get_links(self, profilename):
+        """Gets the links of an installed profile.
+
+        Args:
+            profilename (str): The name of the profile
+        Returns:
+            list: The installed links of the profile
+        """
+        return self.links[profilename]
+
+    def get_root(self, profilename):
+        """Gets the root profile of an installed profile.
+
+        Args:
+            profilename (str): The name of the profile
+        Returns:
+            str: The name of the root profile. This is the name of the
+            profile itself, if it is a root profile.
+        """
+        if profilename not in self._roots:
+            chain = []
+            name = profilename
+            while (name not in self._roots and name not in chain and
+                   self.parents.get(name) in self.parents):
+                chain.append(name)
+                name = self.parents[name]
+            root = self._roots.get(name, name)
+            for name in chain:
+                self._roots[name] = root
+            self._roots[profilename] = root
+        return self._roots[profilename]
+
+
+def _makedirs(directory):
+    """Creates a directory for files of uberdot, if it doesn't exist yet.
+    The directory will be owned by the user, even if uberdot runs as root.
+
+    Args:
+        directory (str): The path of the directory
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        os.chown(directory, get_uid(), get_gid())
+
+
+def _write_atomic(path, content):
+    """Writes a file atomically. The content is written into a temporary
+    file, that is synced to the disk and renamed afterwards.
+
+    Args:
+        path (str): The path of the file
+        content (bytes): The content of the file
+    """
+    directory = os.path.dirname(path)
+    _makedirs(directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.chown(tmp_path, get_uid(), get_gid())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+PROFILE_FIELDS = ("name", "links", "installed", "updated", "parent")
+"""The fields of a profile entry of the installed-file that aren't events."""
+
+
+class History:
+    """The history of all operations that were applied to an installed-file.
+
+    The history is stored as JSON lines and is only ever appended to. Every
+    run that changes the installed-file starts a new generation with a
+    "start" record. It is followed by a record for each applied operation,
+    that is written as soon as the operation was applied. Besides the date
+    and the sequence number of the operation in the installed-file, it
+    contains everything that is needed to revert it:
+
+    - ``remove_l``: The removed link as ``symlink``
+    - ``remove_p``: The removed profile entry without its links as ``entry``
+    - ``update_p``: The old parent as ``old_parent``, if the parent changed
+    - ``update_s``: The old value as ``old_enabled``
+
+    Attributes:
+        path (str): The path of the history file
+        generation (int): The generation of the recorded operations.
+            ``None``, if nothing was recorded yet.
+    """
+    def __init__(self, path):
+        """Constructor.
+
+        Args:
+            path (str): The path of the history file
+        """
+        self.path = path
+        self.generation = None
+        self._file = None
+
+    def load(self, since=0):
+        """Loads all records of the generations after ``since``.
+
+        Incomplete records, e.g. because uberdot was killed while writing
+        them, are skipped.
+
+        Args:
+            since (int): The last generation that won't be loaded
+        Returns:
+            list: The records in the order they were recorded
+        """
+        records = []
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        log_debug("Skipping incomplete record in history.")
+                        continue
+                    if record["generation"] > since:
+                        records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _last_records(self):
+        """Reads the last complete records of the history file. Only the end
+        of the file is read for this.
+
+        Returns:
+            list: The last records in reversed order. Empty, if the end of
+            the file contains no complete record.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(0, size - 65536))
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in reversed(lines):
+            try:
+                records.append(json.loads(line.decode()))
+            except ValueError:
+                continue
+        if not records and size > 65536:
+            records = list(reversed(self.load()))
+        return records
+
+    def last_generation(self):
+        """Gets the number of the last generation that was saved.
+
+        Returns:
+            int: The number of the generation. 0, if the history is empty.
+        """
+        for record in self._last_records():
+            if "generation" in record:
+                return record["generation"]
+        return 0
+
+    def last_record(self):
+        """Gets the last record that was saved.
+
+        Returns:
+            dict: The record. ``None``, if the history is empty.
+        """
+        records = self._last_records()
+        return records[0] if records else None
+
+    def record(self, operation, date, sequence=None, **undo):
+        """Appends an operation that was applied to the history file. The
+        first recorded operation starts a new generation.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation was applied
+            sequence (int): The sequence number of the operation in the
+                installed-file
+            **undo (dict): Everything that is needed to revert the operation
+        """
+        if self._file is None:
+            _makedirs(os.path.dirname(self.path))
+            self._file = open(self.path, "a")
+            os.chown(self.path, get_uid(), get_gid())
+        records = []
+        if self.generation is None:
+            self.generation = self.last_generation() + 1
+            records.append({
+                "generation": self.generation,
+                "operation": "start",
+                "date": get_date_time_now()
+            })
+        record = {"generation": self.generation, "date": date}
+        if sequence is not None:
+            record["sequence"] = sequence
+        record.update(_operation_fields(operation))
+        record.update(undo)
+        records.append(record)
+        self._file.write("".join(
+            json.dumps(record, separators=(",", ":"),
+                       default=encode_record) + "\n"
+            for record in records
+        ))
+        self._file.flush()
+
+    def close(self):
+        """Closes the history file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def apply_operation(installed, operation, date):
+    """Applies the changes of an operation to an installed-file. This is used
+    to execute operations as well as to replay them from a journal.
+
+    Args:
+        installed (dict): The installed-file that will be changed
+        operation (Operation): The operation. Operations that were loaded
+            from a journal are dictionaries with all links converted into link
+            descriptors.
+        date (str): The date when the operation was applied
+    Raises:
+        KeyError: The operation doesn't fit the installed-file
+    Returns:
+        dict: Everything that is needed to revert the operation
+    """
+    kind = operation["operation"]
+    profile = installed.get(operation["profile"])
+    undo = {}
+    if kind == "add_p":
+        profile = {
+            "name": operation["profile"],
+            "links": [],
+            "installed": date,
+            "updated": date
+        }
+        if operation.get("parent") is not None:
+            profile["parent"] = operation["parent"]
+        installed[operation["profile"]] = profile
+    elif kind == "remove_p":
+        entry = installed.pop(operation["profile"])
+        undo["entry"] = {key: value for key, value in entry.items()
+                         if key != "links"}
+    elif kind == "update_p":
+        if "parent" in operation:
+            undo["old_parent"] = profile.get("parent")
+            if operation["parent"] is not None:
+                profile["parent"] = operation["parent"]
+            elif "parent" in profile:
+                del profile["parent"]
+        profile["updated"] = date
+    elif kind == "update_s":
+        undo["old_enabled"] = profile.get(operation["event"])
+        profile[operation["event"]] = operation["enabled"]
+    elif kind == "add_l":
+        profile["links"].append(operation["symlink"])
+    elif kind == "remove_l":
+        undo["symlink"] = None
+        for link in list(profile["links"]):
+            if link["name"] == operation["symlink_name"]:
+                profile["links"].remove(link)
+                undo["symlink"] = link
+    elif kind == "update_l":
+        profile["links"].remove(operation["symlink1"])
+        profile["links"].append(operation["symlink2"])
+    else:
+        raise KeyError(kind)
+    return undo
+
+
+def _link_exists(link):
+    """Checks if a link exists in the filesystem as it is described.
+
+    Args:
+        link (LinkDescriptor): The link
+    Returns:
+        bool: True, if the link exists, points to its target and has the
+        owner of the link
+    """
+    name = normpath(link["name"])
+    try:
+        info = os.lstat(name)
+        target = os.readlink(name)
+    except OSError:
+        return False
+    return (normpath(target) == normpath(link["target"]) and
+            (info.st_uid, info.st_gid) == (link["uid"], link["gid"]))
+
+
+def _link_removal(record):
+    """Creates a record that only removes the old link of an ``update_l``
+    operation.
+
+    Args:
+        record (dict): The record of the ``update_l`` operation
+    Returns:
+        dict: The record of the ``remove_l`` operation
+    """
+    return {"sequence": record["sequence"], "date": record["date"],
+            "operation": "remove_l", "profile": record["profile"],
+            "symlink_name": record["symlink1"]["name"]}
+
+
+def reconcile_operation(record):
+    """Determines how much of an operation was applied to the filesystem by
+    looking at the filesystem. Operations on profiles don't change the
+    filesystem, so they count as not applied.
+
+    Args:
+        record (dict): The record of the operation
+    Returns:
+        dict: The record of the operation that was applied. ``None``, if
+        nothing was applied.
+    """
+    kind = record["operation"]
+    if kind == "add_l":
+        return record if _link_exists(record["symlink"]) else None
+    if kind == "remove_l":
+        if os.path.lexists(normpath(record["symlink_name"])):
+            return None
+        return record
+    if kind == "update_l":
+        if _link_exists(record["symlink2"]):
+            return record
+        if os.path.lexists(normpath(record["symlink1"]["name"])):
+            return None
+        # The old link was removed, but the new one wasn't created yet
+        return _link_removal(record)
+    return None
+
+
+def recover_operation(installed_file, installed, persist=True):
+    """Recovers the operation that was executed when uberdot got killed.
+
+    Every operation is written to the history before it is marked as
+    applied in the installed-file. So if the history already contains the
+    operation, it was applied. Otherwise :func:`reconcile_operation()`
+    determines how much of it was applied.
+
+    Args:
+        installed_file (InstalledFile): The installed-file
+        installed (dict): The loaded installed-file. ``None``, if nothing
+            was loaded.
+        persist (bool): True, if the result will be written to the
+            installed-file and the history. False, if it will only be
+            applied to the loaded installed-file, e.g. because other
+            processes might read the installed-file at the same time.
+    Raises:
+        :class:`~errors.PreconditionError`: The operation doesn't fit the
+            installed-file
+    Returns:
+        dict: The installed-file
+    """
+    pending = installed_file.pending
+    if pending is None:
+        return installed
+    history = History(constants.HISTORY_FILE)
+    last = history.last_record()
+    recorded = (last is not None and
+                last.get("sequence") == pending["sequence"] and
+                last.get("date") == pending["date"])
+    if recorded:
+        record = pending
+        if last["operation"] != pending["operation"]:
+            record = _link_removal(pending)
+    else:
+        record = reconcile_operation(pending)
+    log_debug("Recovering operation " + str(pending["sequence"]) +
+              " that was executed when uberdot got killed: " +
+              ("not applied" if record is None else record["operation"]) +
+              ".")
+    if installed is None:
+        installed = {"@version": constants.VERSION}
+    undo = {}
+    if record is not None:
+        installed_file.load_profiles(installed, [record["profile"]])
+        try:
+            undo = apply_operation(installed, record, record["date"])
+        except (KeyError, TypeError, ValueError):
+            msg = "The operation that was executed when uberdot got killed "
+            msg += "doesn't fit your installed-file."
+            raise PreconditionError(msg)
+    if persist:
+        if (last is not None and
+                last.get("sequence") == pending["sequence"] - 1):
+            # The operation belongs to the generation of the killed run
+            history.generation = last["generation"]
+        if record is not None and not recorded:
+            history.record(record, record["date"], record["sequence"],
+                           **undo)
+            history.close()
+        if record is pending:
+            installed_file.record(record, record["date"])
+        else:
+            installed_file.discard()
+            if record is not None:
+                installed_file.record(record, record["date"])
+    return installed
+
+
+class Journal:
+    """A journal of all operations that were applied to an installed-file
+    since its last snapshot.
+
+    The journal is stored as JSON lines. Every operation is written to the
+    file as a pending record before it is executed. As soon as it was
+    applied, a line that marks it as applied follows. So the journal always
+    knows which operation was executed when uberdot got killed, see
+    :func:`recover_operation()`. To keep the overhead low, the records are
+    only synced to the disk in batches of :const:`BATCH_SIZE`.
+
+    Every record has a consecutive sequence number. The snapshot stores the
+    sequence number of the last record that it contains, so records that
+    were already compacted into the snapshot are never replayed twice.
+
+    Attributes:
+        path (str): The path of the journal file
+        sequence (int): The sequence number of the last record
+        size (int): The size of the journal file in bytes
+        pending (dict): The record of the operation that is executed at the
+            moment or that was executed when uberdot got killed. ``None``,
+            if there is no such operation.
+    """
+
+    BATCH_SIZE = 64
+    """The number of records that are written before they are synced"""
+
+    def __init__(self, path):
+        """Constructor.
+
+        Args:
+            path (str): The path of the journal file
+        """
+        self.path = path
+        self.sequence = 0
+        self.size = 0
+        self.pending = None
+        self._fd = None
+        self._unsynced = 0
+
+    def load(self, since):
+        """Loads all records that are newer than the snapshot.
+
+        Replaying stops at the first incomplete record, e.g. because uberdot
+        was killed while writing it. Everything after it will be overwritten
+        by the next record.
+
+        Args:
+            since (int): The sequence number of the last record that is
+                already part of the snapshot
+        Returns:
+            list: The records in the order they were written
+        """
+        self.sequence = since
+        self.pending = None
+        records = []
+        try:
+            with open(self.path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return records
+        for line in content.splitlines(True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError()
+                record = json.loads(line.decode())
+            except ValueError:
+                log_debug("Skipping incomplete records in journal.")
+                break
+            self.size += len(line)
+            if record["sequence"] <= since:
+                continue
+            self.sequence = record["sequence"]
+            if "applied" in record:
+                # The pending operation was resolved
+                if self.pending is not None and record["applied"]:
+                    records.append(self.pending)
+                self.pending = None
+            elif record.pop("pending", False):
+                self.pending = decode_record(record)
+            else:
+                records.append(decode_record(record))
+        return records
+
+    def replay(self, installed, records):
+        """Applies loaded records to an installed-file.
+
+        Args:
+            installed (dict): The installed-file
+            records (list): The records as returned by :func:`load()`
+        Raises:
+            :class:`~errors.PreconditionError`: A record doesn't fit the
+                installed-file
+        """
+        log_debug("Replaying " + str(len(records)) + " operations " +
+                  "from the journal of the installed-file.")
+        for record in records:
+            try:
+                apply_operation(installed, record, record["date"])
+            except (KeyError, TypeError, ValueError):
+                msg = "The journal of your installed-file doesn't fit "
+                msg += "its snapshot. Operation " + str(record["sequence"])
+                msg += " in '" + self.path + "' can't be applied."
+                raise PreconditionError(msg)
+
+    def _open(self):
+        """Opens the journal file for appending and cuts off incomplete
+        records."""
+        _makedirs(os.path.dirname(self.path))
+        created = not os.path.exists(self.path)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        if created:
+            os.chown(self.path, get_uid(), get_gid())
+        os.ftruncate(self._fd, self.size)
+        os.lseek(self._fd, self.size, os.SEEK_SET)
+
+    def _write(self, record):
+        """Writes a record to the journal file.
+
+        Args:
+            record (dict): The record
+        """
+        if self._fd is None:
+            self._open()
+        line = json.dumps(record, separators=(",", ":"),
+                          default=encode_record) + "\n"
+        line = line.encode()
+        os.write(self._fd, line)
+        self.size += len(line)
+        self._unsynced += 1
+        if self._unsynced >= self.BATCH_SIZE:
+            self.sync()
+
+    def append(self, operation, date, pending=False):
+        """Appends an operation to the journal.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation was applied
+            pending (bool): True, if the operation is about to be executed
+                and will be resolved by :func:`resolve()` later
+        Returns:
+            int: The sequence number of the record
+        """
+        self.sequence += 1
+        record = {"sequence": self.sequence, "date": date}
+        record.update(_operation_fields(operation))
+        if pending:
+            record["pending"] = True
+        self._write(record)
+        if pending:
+            del record["pending"]
+            self.pending = record
+        return self.sequence
+
+    def resolve(self, applied):
+        """Marks the pending operation as applied or as not applied.
+
+        Args:
+            applied (bool): True, if the operation was applied
+        """
+        self._write({"sequence": self.pending["sequence"], "applied": applied})
+        self.pending = None
+
+    def sync(self):
+        """Syncs all written records to the disk."""
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+
+    def clear(self):
+        """Removes all records, after they were compacted into a snapshot."""
+        if self._fd is None:
+            if not self.size:
+                return
+            self._open()
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.fsync(self._fd)
+        self.size = 0
+        self._unsynced = 0
+
+    def close(self):
+        """Syncs and closes the journal file."""
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+
+class InstalledFile:
+    """An installed-file, that consists of a snapshot and a journal of all
+    operations that were applied since then.
+
+    The snapshot is never modified in place. Applied operations are only
+    appended to the journal and the state is recovered by replaying the
+    journal when the installed-file is loaded. As soon as the journal grows
+    larger than half of the snapshot, it is compacted into a new snapshot
+    that atomically replaces the old one.
+
+    Attributes:
+        path (str): The path of the snapshot
+        journal (Journal): The journal of the installed-file
+        version (str): The version of uberdot that wrote the snapshot
+        size (int): The size of the snapshot in bytes
+    """
+    def __init__(self, path, journal_path):
+        """Constructor.
+
+        Args:
+            path (str): The path of the snapshot
+            journal_path (str): The path of the journal
+        """
+        self.path = path
+        self.journal = Journal(journal_path)
+        self.version = constants.VERSION
+        self.size = 0
+
+    def exists(self):
+        """Returns:
+            bool: True, if the snapshot or the journal exists
+        """
+        return os.path.exists(self.path) or os.path.exists(self.journal.path)
+
+    def load(self, profiles=None):
+        """Loads the snapshot and replays the journal.
+
+        Args:
+            profiles (list): Ignored, because the snapshot always contains
+                all profiles
+        Raises:
+            :class:`~errors.PreconditionError`: The journal doesn't fit the
+                snapshot
+        Returns:
+            dict: The installed-file. ``None``, if there is no snapshot
+            and no journal.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                content = file.read()
+            installed = decode_installed(json.loads(content.decode()))
+            self.size = len(content)
+        except FileNotFoundError:
+            installed = None
+        since = 0
+        if installed is not None:
+            self.version = installed["@version"]
+            since = installed.pop("@journal", 0)
+        records = self.journal.load(since)
+        if records:
+            if installed is None:
+                installed = {"@version": constants.VERSION}
+            self.journal.replay(installed, records)
+        return installed
+
+    @property
+    def pending(self):
+        """dict: The record of the operation that is executed at the moment
+        or that was executed when uberdot got killed"""
+        return self.journal.pending
+
+    def load_profiles(self, installed, profiles):
+        """Loads further profiles into a loaded installed-file. Nothing
+        needs to be done, because all profiles are loaded at once.
+
+        Args:
+            installed (dict): The loaded installed-file
+            profiles (list): The names of the profiles
+        """
+
+    def find_link(self, name):
+        """Finds the profile that installed a link, if it wasn't loaded.
+
+        Args:
+            name (str): The normalized name of the link
+        Returns:
+            str: Always ``None``, because all profiles are loaded at once
+        """
+        return None
+
+    def import_installed(self, installed):
+        """Replaces the snapshot with an installed-file.
+
+        Args:
+            installed (dict): The installed-file
+        """
+        self.compact(installed)
+        self.journal.close()
+
+    def prepare(self, operation, date):
+        """Records an operation in the journal before it is executed.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation will be applied
+        Returns:
+            int: The sequence number of the operation
+        """
+        return self.journal.append(operation, date, pending=True)
+
+    def record(self, operation, date):
+        """Records an applied operation in the journal. If the operation
+        was prepared, it's only marked as applied.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation was applied
+        """
+        if self.journal.pending is not None:
+            self.journal.resolve(True)
+        else:
+            self.journal.append(operation, date)
+
+    def discard(self):
+        """Marks the prepared operation as not applied."""
+        self.journal.resolve(False)
+
+    def save(self, installed):
+        """Syncs the journal and compacts it into a new snapshot if it grew
+        too large or if the snapshot was written by another version. The
+        journal isn't compacted as long as an operation is pending, so it
+        can be recovered later.
+
+        Args:
+            installed (dict): The current state of the installed-file
+        """
+        self.journal.sync()
+        if self.journal.pending is None and (
+                self.journal.size * 2 > self.size or
+                self.version != constants.VERSION):
+            self.compact(installed)
+        self.journal.close()
+
+    def compact(self, installed):
+        """Writes a new snapshot and clears the journal afterwards.
+
+        Args:
+            installed (dict): The current state of the installed-file
+        """
+        log_debug("Compacting journal into installed-file.")
+        snapshot = dict(installed)
+        snapshot["@journal"] = self.journal.sequence
+        content = json.dumps(encode_installed(snapshot),
+                             separators=(",", ":"))
+        content = content.encode()
+        _write_atomic(self.path, content)
+        self.size = len(content)
+        self.version = installed["@version"]
+        self.journal.clear()
+
+    def remove(self):
+        """Removes the snapshot and the journal."""
+        self.journal.close()
+        for path in (self.path, self.journal.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+LINK_COLUMNS = ("name", "target", "uid", "gid", "permission", "secure",
+                "date")
+"""The fields of links that are stored in their own columns by
+:class:`SQLiteInstalledFile`."""
+
+
+class SQLiteInstalledFile:
+    """An installed-file that is stored in a sqlite database.
+
+    Profiles and links are stored in their own tables, that are indexed by
+    the name, the target and the parent, so single profiles can be loaded
+    and links can be looked up without reading the whole installed-file.
+    Their order is kept by their row ids. Fields that have no column of
+    their own are stored as JSON, so every installed-file can be converted
+    without losing anything.
+
+    Only two read paths use the indexes. :func:`load()` selects the
+    requested profiles and their subprofiles, and :func:`find_link()` looks
+    up the owner of a link. Everything else, e.g. ``--show``, uninstalling
+    and the difference solvers, works on the loaded profiles in memory like
+    with the other formats. Modes that don't get any profiles, e.g.
+    ``--show`` without arguments or ``--rollback``, load all of them.
+
+    Every applied operation is written in its own transaction. Before it
+    is executed, it's stored in the table of pending operations, so the
+    operation that was executed when uberdot got killed can be recovered.
+    The database uses a write-ahead log, so the transactions are only synced
+    to the disk when it is checkpointed at the end.
+
+    Attributes:
+        path (str): The path of the database
+        lock (FileLock): The lock of the installed-file. It will be made
+            exclusive before the database is migrated.
+        pending (dict): The record of the operation that is executed at the
+            moment or that was executed when uberdot got killed. ``None``,
+            if there is no such operation.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            parent TEXT,
+            installed TEXT,
+            updated TEXT,
+            extra TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS profiles_parent ON profiles (parent);
+        CREATE TABLE IF NOT EXISTS links (
+            id INTEGER PRIMARY KEY,
+            profile TEXT NOT NULL,
+            name TEXT NOT NULL,
+            target TEXT,
+            uid INTEGER,
+            gid INTEGER,
+            permission INTEGER,
+            secure INTEGER,
+            date TEXT,
+            extra TEXT,
+            path TEXT
+        );
+        CREATE INDEX IF NOT EXISTS links_profile ON links (profile);
+        CREATE INDEX IF NOT EXISTS links_name ON links (name);
+        CREATE INDEX IF NOT EXISTS links_target ON links (target);
+        CREATE TABLE IF NOT EXISTS pending (
+            sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL
+        );
+    """
+    """The tables and indexes of the database"""
+
+    TABLES = ("meta", "profiles", "profiles_parent", "links",
+              "links_profile", "links_name", "links_target", "links_path",
+              "pending")
+    """The names of all tables and indexes of the current schema"""
+
+    def __init__(self, path, lock=None):
+        """Constructor.
+
+        Args:
+            path (str): The path of the database
+            lock (FileLock): The lock of the installed-file
+        """
+        self.path = path
+        self.lock = lock
+        self.pending = None
+        self._connection = None
+
+    def exists(self):
+        """Returns:
+            bool: True, if the database exists
+        """
+        return os.path.exists(self.path)
+
+    def _outdated(self):
+        """Checks if tables, indexes or columns of the current schema are
+        missing in the database.
+
+        Returns:
+            bool: True, if the database needs to be migrated
+        """
+        names = {row[0] for row in self._connection.execute(
+            "SELECT name FROM sqlite_master"
+        )}
+        if not names.issuperset(self.TABLES):
+            return True
+        columns = [row[1] for row in self._connection.execute(
+            "PRAGMA table_info(links)"
+        )]
+        return "path" not in columns
+
+    def _migrate(self):
+        """Creates all missing tables, indexes and columns."""
+        log_debug("Migrating installed-file database.")
+        self._connection.executescript(self.SCHEMA)
+        columns = [row[1] for row in self._connection.execute(
+            "PRAGMA table_info(links)"
+        )]
+        if "path" not in columns:
+            # Databases of older versions have no normalized names
+            with self._connection:
+                self._connection.execute(
+                    "ALTER TABLE links ADD COLUMN path TEXT"
+                )
+                self._connection.executemany(
+                    "UPDATE links SET path = ? WHERE id = ?",
+                    [(normpath(name), row_id) for row_id, name in
+                     self._connection.execute(
+                         "SELECT id, name FROM links"
+                     ).fetchall()]
+                )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS links_path ON links (path)"
+        )
+
+    def _connect(self):
+        """Opens the database and migrates it if needed. Other processes
+        might read the database at the same time, so the lock is made
+        exclusive before.
+
+        Raises:
+            :class:`~errors.PreconditionError`: Python was built without
+                sqlite
+        Returns:
+            sqlite3.Connection: The connection to the database
+        """
+        if self._connection is None:
+            try:
+                import sqlite3
+            except ImportError:
+                msg = "Your installation of python doesn't support sqlite. "
+                msg += "Please set installedFormat to 'json'."
+                raise PreconditionError(msg)
+            _makedirs(os.path.dirname(self.path))
+            created = not self.exists()
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            if self._outdated():
+                if self.lock is not None:
+                    self.lock.acquire(exclusive=True)
+                # Another process might have migrated it meanwhile
+                self._migrate()
+            if created:
+                os.chown(self.path, get_uid(), get_gid())
+        return self._connection
+
+    def load(self, profiles=None):
+        """Loads the installed-file.
+
+        Args:
+            profiles (list): The names of the profiles that will be loaded
+                together with all of their subprofiles. ``None``, if all
+                profiles shall be loaded.
+        Returns:
+            dict: The installed-file. ``None``, if the database doesn't
+            exist.
+        """
+        if not self.exists():
+            return None
+        connection = self._connect()
+        installed = {"@version": constants.VERSION}
+        for key, value in connection.execute("SELECT key, value FROM meta"):
+            installed[key] = json.loads(value)
+        self.pending = None
+        for sequence, operation in connection.execute(
+                "SELECT sequence, operation FROM pending"):
+            self.pending = decode_record(json.loads(operation))
+            self.pending["sequence"] = sequence
+        if profiles is None:
+            selection = ""
+            parameters = ()
+        else:
+            # Select the profiles and their subprofiles by walking down the
+            # index of the parents
+            selection = """
+                WITH RECURSIVE tree(name) AS (
+                    SELECT name FROM profiles WHERE name IN (%s)
+                    UNION SELECT profiles.name FROM profiles
+                        JOIN tree ON profiles.parent = tree.name
+                )
+            """ % ", ".join("?" * len(profiles))
+            parameters = tuple(profiles)
+        query = selection + "SELECT name, parent, installed, updated, extra "
+        query += "FROM profiles"
+        if profiles is not None:
+            query += " WHERE name IN tree"
+        query += " ORDER BY id"
+        for name, parent, date_installed, updated, extra in \
+                connection.execute(query, parameters):
+            profile = {"name": name, "links": []}
+            if date_installed is not None:
+                profile["installed"] = date_installed
+            if updated is not None:
+                profile["updated"] = updated
+            if parent is not None:
+                profile["parent"] = parent
+            profile.update(json.loads(extra))
+            installed[name] = profile
+        query = selection + "SELECT profile, " + ", ".join(LINK_COLUMNS)
+        query += ", extra FROM links"
+        if profiles is not None:
+            query += " WHERE profile IN tree"
+        query += " ORDER BY id"
+        for row in connection.execute(query, parameters):
+            fields = {}
+            for key, value in zip(LINK_COLUMNS, row[1:-1]):
+                if value is not None:
+                    fields[key] = value
+            if "secure" in fields:
+                fields["secure"] = bool(fields["secure"])
+            if row[-1] is not None:
+                fields["extra"] = json.loads(row[-1])
+            installed[row[0]]["links"].append(LinkDescriptor(**fields))
+        return installed
+
+    def load_profiles(self, installed, profiles):
+        """Loads further profiles together with all of their subprofiles
+        into a loaded installed-file.
+
+        Args:
+            installed (dict): The loaded installed-file
+            profiles (list): The names of the profiles
+        """
+        profiles = [name for name in profiles if name not in installed]
+        if not profiles or not self.exists():
+            return
+        for key, value in self.load(profiles).items():
+            if key[0] != "@" and key not in installed:
+                installed[key] = value
+
+    def find_link(self, name):
+        """Finds the profile that installed a link by the index of the
+        normalized link names.
+
+        Args:
+            name (str): The normalized name of the link
+        Returns:
+            str: The name of the profile. ``None``, if the link isn't
+            installed.
+        """
+        if not self.exists():
+            return None
+        row = self._connect().execute(
+            "SELECT profile FROM links WHERE path = ? LIMIT 1", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def _insert_profile(connection, profile):
+        """Inserts a profile entry without its links.
+
+        Args:
+            connection (sqlite3.Connection): The connection to the database
+            profile (dict): The profile entry of the installed-file
+        """
+        extra = {key: value for key, value in profile.items()
+                 if key not in PROFILE_FIELDS}
+        connection.execute(
+            "INSERT INTO profiles (name, parent, installed, updated, extra) " +
+            "VALUES (?, ?, ?, ?, ?)",
+            (profile["name"], profile.get("parent"), profile.get("installed"),
+             profile.get("updated"), json.dumps(extra))
+        )
+
+    @staticmethod
+    def _insert_link(connection, profilename, link):
+        """Inserts a link.
+
+        Args:
+            connection (sqlite3.Connection): The connection to the database
+            profilename (str): The name of the profile that installed the link
+            link (LinkDescriptor): The link
+        """
+        extra = link.get("extra")
+        connection.execute(
+            "INSERT INTO links (profile, " + ", ".join(LINK_COLUMNS) +
+            ", extra, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (profilename,) + tuple(link.get(key) for key in LINK_COLUMNS) +
+            (None if extra is None else json.dumps(extra),
+             normpath(link["name"]))
+        )
+
+    def import_installed(self, installed):
+        """Replaces the whole content of the database with an installed-file
+        in a single transaction.
+
+        Args:
+            installed (dict): The installed-file
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM meta")
+            connection.execute("DELETE FROM profiles")
+            connection.execute("DELETE FROM links")
+            for key, profile in installed.items():
+                if key[0] == "@":
+                    connection.execute(
+                        "INSERT INTO meta (key, value) VALUES (?, ?)",
+                        (key, json.dumps(profile))
+                    )
+                    continue
+                self._insert_profile(connection, profile)
+                for link in profile["links"]:
+                    self._insert_link(connection, key, link)
+
+    def prepare(self, operation, date):
+        """Stores an operation as pending before it is executed.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation will be applied
+        Returns:
+            int: The sequence number of the operation
+        """
+        connection = self._connect()
+        record = {"date": date}
+        record.update(_operation_fields(operation))
+        with connection:
+            connection.execute("DELETE FROM pending")
+            sequence = connection.execute(
+                "INSERT INTO pending (operation) VALUES (?)",
+                (json.dumps(record, default=encode_record),)
+            ).lastrowid
+        record["sequence"] = sequence
+        self.pending = record
+        return sequence
+
+    def discard(self):
+        """Removes the pending operation without applying it."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pending")
+        self.pending = None
+
+    def record(self, operation, date):
+        """Applies an operation to the database in its own transaction. The
+        pending operation is removed in the same transaction.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation was applied
+        """
+        connection = self._connect()
+        kind = operation["operation"]
+        name = operation["profile"]
+        with connection:
+            connection.execute("DELETE FROM pending")
+            if kind == "add_p":
+                profile = {"name": name, "installed": date, "updated": date}
+                if operation.get("parent") is not None:
+                    profile["parent"] = operation["parent"]
+                self._insert_profile(connection, profile)
+            elif kind == "remove_p":
+                connection.execute("DELETE FROM links WHERE profile = ?",
+                                   (name,))
+                connection.execute("DELETE FROM profiles WHERE name = ?",
+                                   (name,))
+            elif kind == "update_p":
+                if "parent" in operation:
+                    connection.execute(
+                        "UPDATE profiles SET parent = ? WHERE name = ?",
+                        (operation["parent"], name)
+                    )
+                connection.execute(
+                    "UPDATE profiles SET updated = ? WHERE name = ?",
+                    (date, name)
+                )
+            elif kind == "update_s":
+                extra, = connection.execute(
+                    "SELECT extra FROM profiles WHERE name = ?", (name,)
+                ).fetchone()
+                extra = json.loads(extra)
+                extra[operation["event"]] = operation["enabled"]
+                connection.execute(
+                    "UPDATE profiles SET extra = ? WHERE name = ?",
+                    (json.dumps(extra), name)
+                )
+            elif kind == "add_l":
+                self._insert_link(connection, name, operation["symlink"])
+            elif kind == "remove_l":
+                connection.execute(
+                    "DELETE FROM links WHERE profile = ? AND name = ?",
+                    (name, operation["symlink_name"])
+                )
+            elif kind == "update_l":
+                connection.execute(
+                    "DELETE FROM links WHERE profile = ? AND name = ?",
+                    (name, operation["symlink1"]["name"])
+                )
+                self._insert_link(connection, name, operation["symlink2"])
+        self.pending = None
+
+    def save(self, installed):
+        """Stores the version of the installed-file and syncs the database
+        to the disk.
+
+        Args:
+            installed (dict): The current state of the installed-file
+        """
+        connection = self._connect()
+        with connection:
+            for key, value in installed.items():
+                if key[0] == "@":
+                    connection.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) " +
+                        "VALUES (?, ?)", (key, json.dumps(value))
+                    )
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.close()
+
+    def close(self):
+        """Closes the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def remove(self):
+        """Removes the database with all of its files."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class ShardedInstalledFile:
+    """An installed-file that is split into shards. Every shard contains a
+    root profile together with all of its subprofiles.
+
+    The shards are stored in a directory together with a manifest, that
+    maps every profile to its root profile, and an index, that maps the
+    normalized names of all links to the profiles that installed them. So
+    only the shards of the profiles that are used need to be loaded and
+    conflicts with links of other profiles are found without loading their
+    shards.
+
+    Applied operations are recorded in a journal like for
+    :class:`InstalledFile`. When the installed-file is saved, only the shards
+    that changed are written to new files. The manifest that refers to them
+    is replaced atomically at last, so the old state stays valid until then.
+    If the journal still contains records when the installed-file is loaded,
+    all shards are loaded to replay them.
+
+    Attributes:
+        directory (str): The directory of the shards
+        journal (Journal): The journal of the installed-file
+        manifest (dict): The loaded manifest
+        loaded (dict): The hashes of all loaded shards by their root profile
+    """
+    def __init__(self, directory):
+        """Constructor.
+
+        Args:
+            directory (str): The directory of the shards
+        """
+        self.directory = directory
+        self.journal = Journal(os.path.join(directory, "journal.jsonl"))
+        self.manifest = None
+        self.loaded = {}
+        self._links = None
+
+    def _path(self, filename):
+        """Returns:
+            str: The path of a file in the directory of the shards
+        """
+        return os.path.join(self.directory, filename)
+
+    def exists(self):
+        """Returns:
+            bool: True, if the manifest or the journal exists
+        """
+        return (os.path.exists(self._path("manifest.json")) or
+                os.path.exists(self.journal.path))
+
+    def _read_manifest(self):
+        """Reads the manifest if it wasn't read yet.
+
+        Returns:
+            dict: The manifest
+        """
+        if self.manifest is None:
+            try:
+                with open(self._path("manifest.json"), "r") as file:
+                    self.manifest = json.load(file)
+            except FileNotFoundError:
+                self.manifest = {"generation": 0, "shards": {},
+                                 "profiles": {}, "links": None}
+        return self.manifest
+
+    def _load_shards(self, installed, roots):
+        """Loads shards into an installed-file. Shards that are already
+        loaded are skipped.
+
+        Args:
+            installed (dict): The installed-file
+            roots (set): The names of the root profiles of the shards
+        """
+        for root, filename in self._read_manifest()["shards"].items():
+            if root not in roots or root in self.loaded:
+                continue
+            with open(self._path(filename), "rb") as file:
+                content = file.read()
+            installed.update(decode_installed(json.loads(content.decode())))
+            self.loaded[root] = md5(content)
+
+    def load(self, profiles=None):
+        """Loads the shards and replays the journal.
+
+        Args:
+            profiles (list): The names of the profiles whose shards will be
+                loaded. ``None``, if all shards shall be loaded.
+        Raises:
+            :class:`~errors.PreconditionError`: The journal doesn't fit the
+                shards
+        Returns:
+            dict: The installed-file. ``None``, if there is no manifest and
+            no journal.
+        """
+        if not self.exists():
+            return None
+        manifest = self._read_manifest()
+        installed = {"@version": constants.VERSION}
+        installed.update({key: value for key, value in manifest.items()
+                          if key[0] == "@" and key != "@journal"})
+        records = self.journal.load(manifest.get("@journal", 0))
+        if records or profiles is None:
+            roots = set(manifest["shards"])
+        else:
+            roots = {manifest["profiles"][name] for name in profiles
+                     if name in manifest["profiles"]}
+        self._load_shards(installed, roots)
+        if records:
+            self.journal.replay(installed, records)
+        return installed
+
+    def load_profiles(self, installed, profiles):
+        """Loads the shards of further profiles into a loaded installed-file.
+
+        Args:
+            installed (dict): The loaded installed-file
+            profiles (list): The names of the profiles
+        """
+        manifest = self._read_manifest()
+        self._load_shards(installed, {
+            manifest["profiles"][name] for name in profiles
+            if name not in installed and name in manifest["profiles"]
+        })
+
+    @property
+    def pending(self):
+        """dict: The record of the operation that is executed at the moment
+        or that was executed when uberdot got killed"""
+        return self.journal.pending
+
+    def _read_links(self):
+        """Reads the index of all links if it wasn't read yet.
+
+        Returns:
+            dict: The names of the profiles by the normalized link names
+        """
+        if self._links is None:
+            self._links = {}
+            filename = self._read_manifest()["links"]
+            if filename is not None:
+                with open(self._path(filename), "r") as file:
+                    self._links = json.load(file)
+        return self._links
+
+    def find_link(self, name):
+        """Finds the profile that installed a link by the index of all links.
+
+        Args:
+            name (str): The normalized name of the link
+        Returns:
+            str: The name of the profile. ``None``, if the link isn't
+            installed.
+        """
+        return self._read_links().get(name)
+
+    def import_installed(self, installed):
+        """Replaces all shards with an installed-file.
+
+        Args:
+            installed (dict): The installed-file
+        """
+        self._read_manifest()
+        self.loaded = {root: None for root in self.manifest["shards"]}
+        self.write(installed)
+        self.journal.close()
+        # The shards need to be loaded again by load()
+        self.loaded = {}
+
+    def prepare(self, operation, date):
+        """Records an operation in the journal before it is executed.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation will be applied
+        Returns:
+            int: The sequence number of the operation
+        """
+        return self.journal.append(operation, date, pending=True)
+
+    def record(self, operation, date):
+        """Records an applied operation in the journal. If the operation
+        was prepared, it's only marked as applied.
+
+        Args:
+            operation (Operation): The operation
+            date (str): The date when the operation was applied
+        """
+        if self.journal.pending is not None:
+            self.journal.resolve(True)
+        else:
+            self.journal.append(operation, date)
+
+    def discard(self):
+        """Marks the prepared operation as not applied."""
+        self.journal.resolve(False)
+
+    def save(self, installed):
+        """Writes all changed shards and clears the journal. Nothing is
+        written as long as an operation is pending, so it can be recovered
+        later.
+
+        Args:
+            installed (dict): The current state of the loaded profiles
+        """
+        self.journal.sync()
+        if self.journal.pending is None:
+            self.write(installed)
+        self.journal.close()
+
+    def write(self, installed):
+        """Writes all loaded shards that changed, a new index of all links if
+        it changed and a new manifest. Afterwards the journal is cleared and
+        all files that aren't used anymore are removed.
+
+        Args:
+            installed (dict): The current state of the loaded profiles
+        """
+        manifest = self._read_manifest()
+        old_links = self._read_links()
+        index = InstalledIndex(installed)
+        generation = manifest["generation"] + 1
+        shards = dict(manifest["shards"])
+        profiles = {name: root for name, root in manifest["profiles"].items()
+                    if root not in self.loaded}
+        # Group the loaded profiles by their root profiles
+        groups = {}
+        for name, profile in installed.items():
+            if name[0] != "@":
+                groups.setdefault(index.get_root(name), {})[name] = profile
+        changed = False
+        for root in self.loaded:
+            if root not in groups and root in shards:
+                del shards[root]
+                changed = True
+        for root, shard in groups.items():
+            profiles.update({name: root for name in shard})
+            content = json.dumps(encode_installed(shard),
+                                 separators=(",", ":"))
+            content = content.encode()
+            if self.loaded.get(root) == md5(content) and root in shards:
+                continue
+            filename = root + "." + str(generation) + ".json"
+            _write_atomic(self._path(filename), content)
+            shards[root] = filename
+            self.loaded[root] = md5(content)
+            changed = True
+        links_file = manifest["links"]
+        if changed:
+            links = {name: profile for name, profile in old_links.items()
+                     if manifest["profiles"].get(profile) not in self.loaded}
+            for name in index.links:
+                for link in index.get_links(name):
+                    links[normpath(link["name"])] = name
+            if links != old_links:
+                links_file = "links." + str(generation) + ".json"
+                _write_atomic(self._path(links_file),
+                              json.dumps(links).encode())
+                self._links = links
+        new_manifest = {key: value for key, value in installed.items()
+                        if key[0] == "@"}
+        new_manifest.update({
+            "@journal": self.journal.sequence,
+            "generation": generation,
+            "shards": shards,
+            "profiles": profiles,
+            "links": links_file
+        })
+        for key in ("@version", "@journal", "shards", "links"):
+            if manifest.get(key) != new_manifest[key]:
+                break
+        else:
+            return
+        log_debug("Writing manifest of installed-file.")
+        _write_atomic(self._path("manifest.json"),
+                      json.dumps(new_manifest, indent=4).encode())
+        self.manifest = new_manifest
+        self.journal.clear()
+        # Remove old shards and leftovers of interrupted writes
+        used = set(shards.values())
+        used.update(("manifest.json", os.path.basename(self.journal.path),
+                     links_file))
+        for filename in os.listdir(self.directory):
+            if filename not in used:
+                os.remove(self._path(filename))
+
+    def remove(self):
+        """Removes all shards, the manifest and the journal."""
+        self.journal.close()
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+def check_version(installed):
+    """Checks if an installed-file can be read by this version of uberdot.
+    Schema 4 only differs in that it had no journal and schema 5 only differs
+    in that links weren't compacted. Both are decoded just like the current
+    schema and will be migrated when the installed-file is written the next
+    time.
+
+    Args:
+        installed (dict): The installed-file
+    Raises:
+        :class:`~errors.PreconditionError`: uberdot and installed-file
+            aren't version compatible
+    """
+    schema = int(installed["@version"].split("_")[1])
+    if schema not in (4, 5, int(constants.VERSION.split("_")[1])):
+        msg = "There was a change of the installed-file schema "
+        msg += "with the last update. Please revert to version "
+        msg += installed["@version"] + " and uninstall "
+        msg += "all of your profiles before using this version."
+        raise PreconditionError(msg)
+
+
+def open_installed_file(profiles=None, lock=None):
+    """Opens and loads the installed-file in the format that is set by
+    :const:`~constants.INSTALLED_FORMAT`. If the installed-file is still
+    stored in another format, it's converted first.
+
+    Args:
+        profiles (list): The names of the profiles that need to be loaded
+            together with all of their subprofiles. ``None``, if all
+            profiles need to be loaded. This is only a hint, some formats
+            always load all profiles.
+        lock (FileLock): The lock of the installed-file. It will be made
+            exclusive before the installed-file is converted or migrated.
+    Raises:
+        :class:`~errors.PreconditionError`: uberdot and installed-file
+            aren't version compatible or the journal or the pending operation
+            doesn't fit the installed-file
+    Returns:
+        tuple: The opened installed-file and the loaded installed-file. The
+        latter is ``None`` if nothing is installed yet.
+    """
+    formats = {
+        "json": InstalledFile(constants.INSTALLED_FILE,
+                              constants.INSTALLED_JOURNAL_FILE),
+        "sqlite": SQLiteInstalledFile(constants.INSTALLED_DB_FILE, lock),
+        "shards": ShardedInstalledFile(constants.INSTALLED_SHARD_DIR)
+    }
+    installed_file = formats.pop(constants.INSTALLED_FORMAT)
+    if not installed_file.exists():
+        for name, other_file in formats.items():
+            if other_file.exists():
+                if lock is not None:
+                    lock.acquire(exclusive=True)
+                    # Another process might have converted it meanwhile
+                    if installed_file.exists():
+                        break
+                installed = other_file.load()
+                installed = recover_operation(other_file, installed)
+                check_version(installed)
+                log_debug("Converting installed-file from " + name + " to " +
+                          constants.INSTALLED_FORMAT + ".")
+                installed_file.import_installed(installed)
+                other_file.remove()
+                break
+    installed = installed_file.load(profiles)
+    # Only a process that may write the installed-file resolves a pending
+    # operation, others just need to know its outcome
+    installed = recover_operation(installed_file, installed,
+                                  lock is None or lock.exclusive)
+    if installed is not None:
+        check_version(installed)
+    return installed_file, installed
@@ -74,6 +74,8 @@ from subprocess import Popen
 from threading import Thread
 from uberdot import constants
 from uberdot.errors import *
+from uberdot.installedfile import InstalledIndex
+from uberdot.installedfile import apply_operation
 from uberdot.utils import *
 
 
@@ -87,6 +89,14 @@ class Interpreter():
         data (list): The raw DiffLog that is interpreted.
             Only needed by Interpreters that alter the DiffLog.
     """
+
+    READONLY = False
+    """True, if the interpreter has no side effects (e.g. user interaction or
+    changes to files) when interpreting operations, but only checks them.
+    Only the "fin" operation may have side effects. Read-only interpreters can
+    share a traversal in :func:`~differencesolver.DiffLog.run_pipeline()`.
+    """
+
     def __init__(self):
         """Constructor"""
         self.data = None
@@ -101,6 +111,22 @@ class Interpreter():
         """
         self.data = data
 
+    def get_dispatch_table(self):
+        """Creates a table of all operations that this interpreter has
+        implemented.
+
+        Returns:
+            dict: The implementations of the operations by the name of the
+            operation
+        """
+        table = {}
+        for name in dir(self):
+            if name.startswith("_op_"):
+                attribute = getattr(self, name)
+                if callable(attribute):
+                    table[name[4:]] = attribute
+        return table
+
     def call_operation(self, operation):
         """Call the implemented behavior for this operation.
 
@@ -235,8 +261,8 @@ class PrintInterpreter(Interpreter):
             msg_start = dop["symlink1"]["name"] + " has changed "
             if dop["symlink2"]["permission"] != dop["symlink1"]["permission"]:
                 msg = msg_start + "permission from "
-                msg += str(dop["symlink1"]["permssion"])
-                msg += " to " + str(dop["symlink2"]["permssion"])
+                msg += str(dop["symlink1"]["permission"])
+                msg += " to " + str(dop["symlink2"]["permission"])
                 log_operation(dop["profile"], msg)
             if dop["symlink2"]["uid"] != dop["symlink1"]["uid"] or \
                     dop["symlink2"]["gid"] != dop["symlink1"]["gid"]:
@@ -461,36 +487,50 @@ class CheckLinksInterpreter(Interpreter):
     Conflicts are things like duplicates, multiple targets / overwrites, etc.
 
     Args:
-        linklist (list): list that stores all links, their corresponding
-            profiles and if they are already installed. Links that are already
+        links (dict): Stores for all links, which profiles own them and if the
+            link is already installed. Maps the name of the link to a list of
+            tuples (profile name, is installed). Links that are already
             installed and won't be removed, will end up twice in this list.
+        installed (dict): The installed-file, that was used to create the
+            current DiffLog
+        installed_file (InstalledFile): The installed-file that is used to
+            look up links of profiles that weren't loaded
     """
-    def __init__(self, installed):
+
+    READONLY = True
+    """This interpreter only checks operations"""
+
+    def __init__(self, installed, installed_file=None):
         """Constructor.
 
-        Initializes ``linklist`` with all links from the installed-file.
+        Initializes ``links`` with all links from the installed-file.
 
         Args:
             installed (dict): The installed-file, that was used to create the
                 current DiffLog
+            installed_file (InstalledFile): The installed-file that is used
+                to look up links of profiles that weren't loaded
         """
         super().__init__()
-        # Setup linklist to store/lookup which links are modified
-        # Stores for any link: (linkname, profile, is_installed)
-        self.linklist = []
+        self.installed = installed
+        self.installed_file = installed_file
+        # Setup links to store/lookup which links are modified
+        self.links = {}
         for key, profile in installed.items():
             if key[0] != "@":  # Ignore special entrys like @version
                 for link in profile["links"]:
                     link_name = normpath(link["name"])
-                    self.linklist.append((link_name, profile["name"], True))
+                    self.links.setdefault(link_name, []).append(
+                        (profile["name"], True)
+                    )
 
     def _op_add_l(self, dop):
-        """Checks if the to be added link already occurs in ``linklist``.
+        """Checks if the to be added link already occurs in ``links``.
 
         This would be forbidden, because a link that is already installed can't
         be added again (only updated). Similary it would be forbidden to add a
         link that was already added by another profile in the same run.
-        If everything is valid, the link will be added to the list.
+        If everything is valid, the link will be added to ``links``.
 
         Args:
             dop (dict): The add-operation that will be checked
@@ -498,21 +538,26 @@ class CheckLinksInterpreter(Interpreter):
             IntegrityError: The check failed
         """
         name = dop["symlink"]["name"]
-        for item in self.linklist:
-            if item[0] == name:
-                if item[2]:
-                    msg = " installed "
-                else:
-                    msg = " defined "
-                msg = "The link '" + name + "' is already" + msg + "by '"
-                msg += item[1] + "' and would be overwritten by '"
-                msg += dop["profile"] + "'. In most cases this error can be "
-                msg += "fixed by setting the --dui flag."
-                raise IntegrityError(msg)
-        self.linklist.append((name, dop["profile"], False))
+        if name not in self.links and self.installed_file is not None:
+            # The link could be installed by a profile that wasn't loaded
+            owner = self.installed_file.find_link(normpath(name))
+            if owner is not None and owner not in self.installed:
+                self.links[name] = [(owner, True)]
+        if name in self.links:
+            owner, installed = self.links[name][0]
+            if installed:
+                msg = " installed "
+            else:
+                msg = " defined "
+            msg = "The link '" + name + "' is already" + msg + "by '"
+            msg += owner + "' and would be overwritten by '"
+            msg += dop["profile"] + "'. In most cases this error can be "
+            msg += "fixed by setting the --dui flag."
+            raise IntegrityError(msg)
+        self.links[name] = [(dop["profile"], False)]
 
     def _op_remove_l(self, dop):
-        """Removes link from linklist because links could be removed and
+        """Removes link from ``links`` because links could be removed and
         added in one run by different profiles.
 
         In that case it would look like the link is added even though it is
@@ -522,14 +567,13 @@ class CheckLinksInterpreter(Interpreter):
             dop (dict): The remove-operation that will be used to remove the
                 link
         """
-        count = 0
-        for item in self.linklist:
-            if item[0] == normpath(dop["symlink_name"]):
-                break
-            count += 1
-        if count == len(self.linklist):
+        name = normpath(dop["symlink_name"])
+        if name not in self.links:
             raise FatalError("Can't remove link that isn't installed")
-        self.linklist.pop(count)
+        owners = self.links[name]
+        owners.pop(0)
+        if not owners:
+            del self.links[name]
 
 
 class CheckLinkBlacklistInterpreter(Interpreter):
@@ -622,6 +666,10 @@ class CheckLinkDirsInterpreter(Interpreter):
     Attributes:
         makedirs (bool): Stores, if ``--makedirs`` was set
     """
+
+    READONLY = True
+    """This interpreter only checks operations"""
+
     def __init__(self, makedirs):
         """Constructor
 
@@ -657,7 +705,7 @@ class CheckLinkDirsInterpreter(Interpreter):
                 isn't set
         """
         if not self.makedirs:
-            if not os.path.isdir(dirname):
+            if not get_filesystem_cache().isdir(dirname):
                 msg = "The directory '" + dirname + "/' needs to be created "
                 msg += "in order to perform this action, but "
                 msg += "--makedirs is not set"
@@ -672,6 +720,10 @@ class CheckLinkExistsInterpreter(Interpreter):
         removed_links (list): A collection of all links that are going to be
             removed
     """
+
+    READONLY = True
+    """This interpreter only checks operations"""
+
     def __init__(self, force):
         """Constructor"""
         super().__init__()
@@ -689,7 +741,7 @@ class CheckLinkExistsInterpreter(Interpreter):
         Raises:
             PreconditionError: The to be removed link does not exist
         """
-        if not os.path.lexists(dop["symlink_name"]):
+        if not get_filesystem_cache().lexists(dop["symlink_name"]):
             msg = "'" + dop["symlink_name"] + "' can not be removed because"
             msg += " it does not exist on your filesystem."
             msg += " Check your installed file!"
@@ -710,21 +762,22 @@ class CheckLinkExistsInterpreter(Interpreter):
                 link already exists or the new link points to a non-existent
                 file
         """
-        if not os.path.lexists(dop["symlink1"]["name"]):
+        cache = get_filesystem_cache()
+        if not cache.lexists(dop["symlink1"]["name"]):
             msg = "'" + dop["symlink1"]["name"] + "' can not be updated"
             msg += " because it does not exist on your filesystem."
             msg += " Check your installed file!"
             raise PreconditionError(msg)
         if (normpath(dop["symlink1"]["target"]) != dop["symlink2"]["target"]
-                and not os.path.exists(dop["symlink2"]["target"])):
+                and not cache.exists(dop["symlink2"]["target"])):
             msg = "'" + dop["symlink1"]["name"] + "' will not be updated"
             msg += " to point to '" + dop["symlink2"]["target"] + "'"
             msg += " because '" + dop["symlink2"]["target"]
             msg += "' does not exist in your filesystem."
             raise PreconditionError(msg)
         if normpath(dop["symlink1"]["name"]) != dop["symlink2"]["name"]:
-            if os.path.lexists(dop["symlink2"]["name"]):
-                if os.path.isdir(dop["symlink2"]["name"]):
+            if cache.lexists(dop["symlink2"]["name"]):
+                if cache.isdir(dop["symlink2"]["name"]):
                     if not self.force:
                         msg = "'" + dop["symlink1"]["name"] + "' can not be "
                         msg += "moved to '" + dop["symlink2"]["name"] + "' "
@@ -732,7 +785,7 @@ class CheckLinkExistsInterpreter(Interpreter):
                         msg += "overwritten. You can force to overwrite empty"
                         msg += " directories by setting the --force flag."
                         raise PreconditionError(msg)
-                    if os.listdir(dop["symlink2"]["name"]):
+                    if cache.listdir(dop["symlink2"]["name"]):
                         msg = "'" + dop["symlink1"]["name"] + "' can not be "
                         msg += "moved to '" + dop["symlink2"]["name"] + "' "
                         msg += "because it is a directory and contains files"
@@ -755,15 +808,16 @@ class CheckLinkExistsInterpreter(Interpreter):
             PreconditionError: The new link already exists or its target does
                 not exist
         """
+        cache = get_filesystem_cache()
         name = dop["symlink"]["name"]
-        if not normpath(name) in self.removed_links and os.path.lexists(name):
-            if os.path.isdir(name):
+        if not normpath(name) in self.removed_links and cache.lexists(name):
+            if cache.isdir(name):
                 if not self.force:
                     msg = "'" + name + "' is a directory and would be"
                     msg += " overwritten. You can force to overwrite empty"
                     msg += " directories by setting the --force flag."
                     raise PreconditionError(msg)
-                if os.listdir(name):
+                if cache.listdir(name):
                     msg = "'" + name + "' is a directory and contains files"
                     msg += " that would be overwritten. Please empty the"
                     msg += " directory or remove it entirely."
@@ -774,7 +828,7 @@ class CheckLinkExistsInterpreter(Interpreter):
                 msg += " '. You can force to overwrite the"
                 msg += " original file by setting the --force flag."
                 raise PreconditionError(msg)
-        if not os.path.exists(dop["symlink"]["target"]):
+        if not cache.exists(dop["symlink"]["target"]):
             msg = "'" + name + "' will not be created"
             msg += " because it points to '" + dop["symlink"]["target"]
             msg += "' which does not exist in your filesystem."
@@ -787,15 +841,18 @@ class CheckProfilesInterpreter(Interpreter):
 
     Attributes:
         parent_arg (str): Stores the value of ``--parent``
-        profile_list (list): A list that stores all profiles, their parents
-            and if they are already installed. Profiles that are still
-            installed in the end, will end up twice in this list.
+        index (InstalledIndex): The index of the installed-file, that is used
+            to look up already installed profiles
+        profiles (dict): Stores the parents of all profiles, that will be
+            installed, by the name of the profile
     """
+
+    READONLY = True
+    """This interpreter only checks operations"""
+
     def __init__(self, installed, parent_arg=None):
         """Constructor.
 
-        Initializes ``profile_list`` with all profiles from the installed-file.
-
         Args:
             installed (dict): The installed-file, that was used to create the
                 DiffLog
@@ -803,35 +860,32 @@ class CheckProfilesInterpreter(Interpreter):
         """
         super().__init__()
         self.parent_arg = parent_arg
-        self.profile_list = []
-        # profile_list contains: (profile name, parent name, is installed)
-        for key, profile in installed.items():
-            if key[0] != "@":
-                self.profile_list.append(
-                    (profile["name"],
-                     profile["parent"] if "parent" in profile else None, True))
+        self.index = InstalledIndex(installed)
+        self.profiles = {}
 
     def get_known(self, name, is_installed):
-        """Returns the entry of a profile from ``profile_list``. Either for
-        already installed profiles or for to be installed profiles.
+        """Returns the entry of a profile. Either for already installed
+        profiles or for to be installed profiles.
 
         Args:
             name (str): Name of the profile
             is_installed (bool): True, for lookups of already installed
                 profiles
         Returns:
-            Tuple: The entry that was found in ``profile_list``. ``None`` if
-            no entry was found.
-        """
-        for p_name, p_parent, p_installed in self.profile_list:
-            if name == p_name and p_installed == is_installed:
-                return (p_name, p_parent, p_installed)
+            Tuple: The entry (profile name, parent name, is installed).
+            ``None`` if no entry was found.
+        """
+        if is_installed:
+            if name in self.index:
+                return (name, self.index.get_parent(name), True)
+        elif name in self.profiles:
+            return (name, self.profiles[name], False)
         return None
 
     def _op_add_p(self, dop):
         """Checks if a profile is added twice.
 
-        Adds the profile to ``profile_list`` if the operation is valid.
+        Adds the profile to ``profiles`` if the operation is valid.
 
         Args:
             dop (dict): The add-operation that will be checked
@@ -850,9 +904,7 @@ class CheckProfilesInterpreter(Interpreter):
         if self.get_known(dop["profile"], True) is not None:
             raise FatalError("addP-operation found where" +
                              " update_p-operation was expected")
-        self.profile_list.append(
-            (dop["profile"], dop["parent"] if "parent" in dop else None, False)
-        )
+        self.profiles[dop["profile"]] = dop.get("parent")
 
     def _op_update_p(self, dop):
         """Checks if profiles will be overwritten.
@@ -880,9 +932,7 @@ class CheckProfilesInterpreter(Interpreter):
                 if dop["parent"] is None:
                     return
                 # Get root profile of installed profile
-                while known[1] is not None:
-                    known = self.get_known(known[1], True)
-                old_root = known[0]
+                old_root = self.index.get_root(known[0])
                 # Get root profile of updated profile
                 known = self.get_known(dop["parent"], False)
                 while known[1] is not None:
@@ -903,7 +953,8 @@ class EventInterpreter(Interpreter):
     work with profile events. Implements _op_* depending on self.event_type.
 
     Attributes:
-        profiles (list): A list of profiles **after** their execution.
+        profiles (list): A list of the results of all root profiles **after**
+            their execution.
         installed (dict): A copy of the old installed-file that is used to
             lookup if a profile had Uninstall-events set
         event_type (str): A specific type ("after" or "before") that determines
@@ -916,7 +967,8 @@ class EventInterpreter(Interpreter):
         Sets _op_add_p and _op_update_p depending on event_type.
 
         Args:
-            profiles (list): A list of profiles **after** their execution.
+            profiles (list): A list of the results of all root profiles
+                **after** their execution.
             installed (dict): A copy of the old installed-file that is used to
                 lookup if a profile had Uninstall-events set
             event_type (str): A specific type ("after" or "before") that
@@ -929,17 +981,17 @@ class EventInterpreter(Interpreter):
         self._op_update_p = self.event_handler(self.event_type + "Update")
 
     def get_profile(self, profilename):
-        """Gets a profile from :attr:`self.profiles<EventInterpreter.profiles>`
-        by it's name.
+        """Gets the result of a profile from
+        :attr:`self.profiles<EventInterpreter.profiles>` by it's name.
 
         Args:
             profilename (str): Name of the profile that will be searched for.
         Returns:
-            Profile: The corresponding profile
+            dict: The result of the corresponding profile
         """
         def get_subprofile(parent, profilename):
-            for sub in parent.subprofiles:
-                if sub.name == profilename:
+            for sub in parent["profiles"]:
+                if sub["name"] == profilename:
                     return sub
                 subsub = get_subprofile(sub, profilename)
                 if subsub is not None:
@@ -947,7 +999,7 @@ class EventInterpreter(Interpreter):
             return None
 
         for profile in self.profiles:
-            if profile.name == profilename:
+            if profile["name"] == profilename:
                 return profile
             result = get_subprofile(profile, profilename)
             if result is not None:
@@ -997,7 +1049,7 @@ class EventInterpreter(Interpreter):
         """
         def start(dop):
             profile = self.get_profile(dop["profile"])
-            if profile.result[event_name]:
+            if profile[event_name]:
                 self.start_event(dop["profile"], event_name)
         return start
 
@@ -1142,6 +1194,9 @@ class EventExecInterpreter(EventInterpreter):
             # Convert all exceptions that are not a CustomError in a
             # UnkownError to handle them in the outer pokemon handler
             raise UnkownError(err, msg)
+        finally:
+            # The script could have changed anything in the filesystem
+            get_filesystem_cache().clear()
 
     def listen_for_script_output(self):
         """Runnable of ``thread_out``. Waits for the shell to push something
@@ -1191,12 +1246,21 @@ class ExecuteInterpreter(Interpreter):
     """This interpreter actually executes the operations from the DiffLog.
 
     It can create/delete links in the filesystem and modify the installed-file.
+    Every operation is prepared in the journal of the installed-file before
+    it is executed. Afterwards it's recorded in the history and then marked
+    as applied in the journal, so the operation that was executed when
+    uberdot got killed can be recovered.
 
     Attributes:
         installed (dict): The installed-file that will be updated
         force (bool): Stores, if ``--force`` was set
+        history (History): The history that executed operations will be
+            recorded in. ``None``, if they shall not be recorded.
+        installed_file (InstalledFile): The installed-file whose journal
+            executed operations will be recorded in. ``None``, if they shall
+            not be recorded.
     """
-    def __init__(self, installed, force):
+    def __init__(self, installed, force, history=None, installed_file=None):
         """Constructor.
 
         Updates the version number of the installed-file.
@@ -1204,11 +1268,45 @@ class ExecuteInterpreter(Interpreter):
         Args:
             installed (dict): The installed-file that will be updated
             force (bool): The value of ``--force``
+            history (History): The history that executed operations will be
+                recorded in
+            installed_file (InstalledFile): The installed-file whose journal
+                executed operations will be recorded in
         """
         super().__init__()
         self.installed = installed
         self.installed["@version"] = constants.VERSION  # Update version number
         self.force = force
+        self.history = history
+        self.installed_file = installed_file
+        self.sequence = None
+
+    def _prepare(self, dop):
+        """Prepares an operation in the journal before it is executed.
+
+        Args:
+            dop (dict): The operation that will be executed
+        Returns:
+            str: The date when the operation will be applied
+        """
+        date = get_date_time_now()
+        if self.installed_file is not None:
+            self.sequence = self.installed_file.prepare(dop, date)
+        return date
+
+    def _apply(self, dop, date):
+        """Applies an executed operation to the installed-file, records it
+        in the history and marks it as applied in the journal.
+
+        Args:
+            dop (dict): The operation that was executed
+            date (str): The date that was returned by :func:`_prepare()`
+        """
+        undo = apply_operation(self.installed, dop, date)
+        if self.history is not None:
+            self.history.record(dop, date, self.sequence, **undo)
+        if self.installed_file is not None:
+            self.installed_file.record(dop, date)
 
     def _op_update_s(self, dop):
         """Updates the script_path of the onUninstall-script for a profile.
@@ -1216,7 +1314,7 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The update-operation that will be executed
         """
-        self.installed[dop["profile"]][dop["event"]] = dop["enabled"]
+        self._apply(dop, self._prepare(dop))
 
     def _op_add_p(self, dop):
         """Adds a profile entry of the installed-file.
@@ -1224,13 +1322,7 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The add-operation that will be executed
         """
-        new_profile = {}
-        new_profile["name"] = dop["profile"]
-        new_profile["links"] = []
-        new_profile["installed"] = new_profile["updated"] = get_date_time_now()
-        if dop["parent"] is not None:
-            new_profile["parent"] = dop["parent"]
-        self.installed[new_profile["name"]] = new_profile
+        self._apply(dop, self._prepare(dop))
 
     def _op_remove_p(self, dop):
         """Removes a profile entry of the installed-file.
@@ -1238,7 +1330,7 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The remove-operation that will be executed
         """
-        del self.installed[dop["profile"]]
+        self._apply(dop, self._prepare(dop))
 
     def _op_update_p(self, dop):
         """Updates a profile entry of the installed-file.
@@ -1246,12 +1338,7 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The update-operation that will be executed
         """
-        if "parent" in dop:
-            if dop["parent"] is not None:
-                self.installed[dop["profile"]]["parent"] = dop["parent"]
-            elif "parent" in self.installed[dop["profile"]]:
-                del self.installed[dop["profile"]]["parent"]
-        self.installed[dop["profile"]]["updated"] = get_date_time_now()
+        self._apply(dop, self._prepare(dop))
 
     def _op_add_l(self, dop):
         """Adds a link to the filesystem and adds a link entry of the
@@ -1260,13 +1347,14 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The add-operation that will be executed
         """
+        date = self._prepare(dop)
         self.__create_symlink(dop["symlink"]["name"],
                               dop["symlink"]["target"],
                               dop["symlink"]["uid"],
                               dop["symlink"]["gid"],
                               dop["symlink"]["permission"],
                               dop["symlink"]["secure"])
-        self.installed[dop["profile"]]["links"].append(dop["symlink"])
+        self._apply(dop, date)
 
     def _op_remove_l(self, dop):
         """Removes a link from the filesystem and removes the links entry of
@@ -1275,10 +1363,9 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The remove-operation that will be executed
         """
+        date = self._prepare(dop)
         self.__remove_symlink(dop["symlink_name"])
-        for link in self.installed[dop["profile"]]["links"]:
-            if link["name"] == dop["symlink_name"]:
-                self.installed[dop["profile"]]["links"].remove(link)
+        self._apply(dop, date)
 
     def _op_update_l(self, dop):
         """Updates a link in the filesystem and updates the links entry of
@@ -1287,15 +1374,15 @@ class ExecuteInterpreter(Interpreter):
         Args:
             dop (dict): The update-operation that will be executed
         """
+        date = self._prepare(dop)
         self.__remove_symlink(dop["symlink1"]["name"])
-        self.installed[dop["profile"]]["links"].remove(dop["symlink1"])
         self.__create_symlink(dop["symlink2"]["name"],
                               dop["symlink2"]["target"],
                               dop["symlink2"]["uid"],
                               dop["symlink2"]["gid"],
                               dop["symlink2"]["permission"],
                               dop["symlink2"]["secure"])
-        self.installed[dop["profile"]]["links"].append(dop["symlink2"])
+        self._apply(dop, date)
 
     def __create_symlink(self, name, target, uid, gid, permission, secure):
         """Create a symlink in the filesystem.
@@ -1311,12 +1398,13 @@ class ExecuteInterpreter(Interpreter):
         Raises:
             UnkownError: The link could not be created
         """
-        if not os.path.isdir(os.path.dirname(name)):
+        cache = get_filesystem_cache()
+        if not cache.isdir(os.path.dirname(name)):
             self._makedirs(name)
         try:
             # Remove existing symlink
-            if self.force and os.path.lexists(name):
-                if os.path.isdir(name):
+            if self.force and cache.lexists(name):
+                if cache.isdir(name):
                     # Overwriting empty dirs is also possible. CheckLinkExists
                     # will make sure that the directory is empty
                     os.rmdir(name)
@@ -1328,6 +1416,8 @@ class ExecuteInterpreter(Interpreter):
                     os.unlink(name)
             # Create new symlink
             os.symlink(target, name)
+            cache.invalidate(name)
+            cache.invalidate_listing(os.path.dirname(name))
             # Set owner and permission
             os.lchown(name, uid, gid)
             if permission != 644:
@@ -1337,6 +1427,7 @@ class ExecuteInterpreter(Interpreter):
                 os.chown(target, uid, gid)
             else:
                 os.chown(target, get_uid(), get_gid())
+            cache.invalidate(target)
         except OSError as err:
             raise UnkownError(err, "An unkown error occured when trying to" +
                               " create the link '" + name + "'.")
@@ -1348,12 +1439,17 @@ class ExecuteInterpreter(Interpreter):
         Args:
             path (str): The path to the symlink, that will be removed
         """
+        cache = get_filesystem_cache()
         os.unlink(path)
+        cache.invalidate(path)
         parent = os.path.dirname(path)
-        while not os.listdir(parent):  # while parent dir is empty
+        cache.invalidate_listing(parent)
+        while not cache.listdir(parent):  # while parent dir is empty
             log_debug("Removing directory '" + parent + "'.")
             os.rmdir(parent)
+            cache.invalidate(parent)
             parent = os.path.dirname(parent)
+            cache.invalidate_listing(parent)
 
     @staticmethod
     def _makedirs(filename):
@@ -1369,25 +1465,46 @@ class ExecuteInterpreter(Interpreter):
             filename (str): The full path of the file that needs its
                 directories created
         """
+        cache = get_filesystem_cache()
         # First find the deepest directory of the path that exists
         dirname = os.path.dirname(filename)
-        while not os.path.isdir(dirname):
+        while not cache.isdir(dirname):
             dirname = os.path.dirname(dirname)
         # And remember its owner
-        uid, gid = os.stat(dirname).st_uid, os.stat(dirname).st_gid
+        uid, gid = cache.owner(dirname)
         top_dir = dirname
         # Then create directories
         dirname = os.path.dirname(filename)
         log_debug("Creating directory '" + dirname + "'.")
         os.makedirs(dirname)
+        cache.invalidate_listing(top_dir)
         # And change owner of all created directories to the remembered owner
         while dirname != top_dir:
             os.chown(dirname, uid, gid)
+            cache.invalidate(dirname)
             dirname = os.path.dirname(dirname)
 
 
 class DetectRootInterpreter(Interpreter):
-    """Detects if root permission is needed to perform operations. """
+    """Detects if root permission is needed to perform operations.
+
+    Usually a lot of links are placed in only a few directories, so the
+    write access and the owner are only determined once per directory.
+
+    Attributes:
+        writable (dict): Maps directories to whether we have write access to
+            them or to one of their parent directories
+        owners (dict): Maps directories to the owner that links in them will
+            have by default
+    """
+
+    READONLY = True
+    """This interpreter only checks operations"""
+
+    def __init__(self):
+        super().__init__()
+        self.writable = {}
+        self.owners = {}
 
     def _access(self, path):
         """Checks if we have write access for a given path.
@@ -1404,10 +1521,39 @@ class DetectRootInterpreter(Interpreter):
         """
         if not path or path == "/":
             return False
+        # Go upwards until we find a directory that was already checked
+        # or that we have access to
+        cache = get_filesystem_cache()
+        visited = []
         dirname = os.path.dirname(path)
-        if os.access(dirname, os.W_OK):
-            return True
-        return self._access(dirname)
+        while dirname not in self.writable:
+            visited.append(dirname)
+            if cache.access(dirname, os.W_OK):
+                result = True
+                break
+            if not dirname or dirname == "/":
+                result = False
+                break
+            dirname = os.path.dirname(dirname)
+        else:
+            result = self.writable[dirname]
+        # All visited directories have the same result
+        for dirname in visited:
+            self.writable[dirname] = result
+        return result
+
+    def _owner(self, path):
+        """Gets the owner that a link will have by default.
+
+        Args:
+            path (str): The path of the link
+        Returns:
+            tuple: The UID and the GID of the owner
+        """
+        dirname = os.path.dirname(path)
+        if dirname not in self.owners:
+            self.owners[dirname] = get_dir_owner(path)
+        return self.owners[dirname]
 
     def _op_add_l(self, dop):
         """Checks if new links are either created in inaccessible directories
@@ -1417,7 +1563,7 @@ class DetectRootInterpreter(Interpreter):
             dop (dict): The add-operation that will be checked
         """
         name = dop["symlink"]["name"]
-        uid, gid = get_dir_owner(name)
+        uid, gid = self._owner(name)
         if dop["symlink"]["uid"] != uid or dop["symlink"]["gid"] != gid:
             self._root_detected(dop, "change owner of", name)
         elif not self._access(name):
@@ -1431,7 +1577,8 @@ class DetectRootInterpreter(Interpreter):
             dop (dict): The remove-operation that will be checked
         """
         try:
-            if not os.access(os.path.dirname(dop["symlink_name"]), os.W_OK):
+            if not get_filesystem_cache().access(
+                    os.path.dirname(dop["symlink_name"]), os.W_OK):
                 self._root_detected(dop, "remove links from",
                                     os.path.dirname(dop["symlink_name"]))
         except FileNotFoundError:
@@ -1484,14 +1631,13 @@ class SkipRootInterpreter(DetectRootInterpreter):
     """Skips all operations that would require root permission.
 
     Attributes:
-        skipped (list): A list of all operations that will be skipped
-        skipped_reasons (list): A list of tuples that counts how often a
-            description occured
+        skip (set): The ids of all operations that will be skipped
+        skipped_reasons (dict): Counts how often a description occured
     """
 
     def __init__(self):
         super().__init__()
-        self.skip = []
+        self.skip = set()
         self.skipped_reasons = {}
 
     def _root_detected(self, dop, description, affected_file):
@@ -1504,8 +1650,8 @@ class SkipRootInterpreter(DetectRootInterpreter):
             affected_file (str): Used to determine if description refers to
                 a file or a directory
         """
-        self.skip.append(dop)
-        if os.path.isdir(affected_file):
+        self.skip.add(id(dop))
+        if get_filesystem_cache().isdir(affected_file):
             description += " protected directories"
         else:
             description += " protected files"
@@ -1522,15 +1668,10 @@ class SkipRootInterpreter(DetectRootInterpreter):
             dop (dict): Unused in this implementation
         """
         # Remove all operations from self.skip
-        new_data = []
-        for operation in self.data:
-            if operation in self.skip:
-                self.skip.remove(operation)
-            else:
-                new_data.append(operation)
+        new_data = [operation for operation in self.data
+                    if id(operation) not in self.skip]
         self.data.clear()
-        for operation in new_data:
-            self.data.append(operation)
+        self.data.extend(new_data)
         # Print out summary of what we skipped
         for reason, count in self.skipped_reasons.items():
             if count == 1:
@@ -1546,18 +1687,20 @@ class RootNeededInterpreter(DetectRootInterpreter):
     Prints out all such operations.
 
     Attributes:
-         content (list): A list of tuples with (dop, description, affected_file)
-            that stores which operations require root permission, which file
-            or directory they affect and a description of what the operation
-            would exactly require root permission for
+        logged (set): All files and directories that require root
+            permission
+        messages (list): A list of messages that describe what the operations
+            would exactly require root permission for. They are printed when
+            all operations were checked.
     """
 
     def __init__(self):
         super().__init__()
-        self.logged = []
+        self.logged = set()
+        self.messages = []
 
     def _root_detected(self, dop, description, affected_file):
-        """Logs and prints out the operation that needs root permission.
+        """Stores the operation that needs root permission.
 
         Args:
             dop (dict): Unused in this implementation
@@ -1566,9 +1709,18 @@ class RootNeededInterpreter(DetectRootInterpreter):
             affected_file (str): The file that the description refers to
         """
         if affected_file not in self.logged:
-            self.logged.append(affected_file)
-            log_warning("Root permission required to " + description +
-                        " '" + affected_file + "'.")
+            self.logged.add(affected_file)
+            self.messages.append("Root permission required to " + description +
+                                 " '" + affected_file + "'.")
+
+    def _op_fin(self, dop):
+        """Prints out all operations that need root permission.
+
+        Args:
+            dop (dict): Unused in this implementation
+        """
+        for message in self.messages:
+            log_warning(message)
 
 
 class GainRootInterpreter(RootNeededInterpreter):
@@ -1582,9 +1734,13 @@ class GainRootInterpreter(RootNeededInterpreter):
         Args:
             dop (dict): Unused in this implementation
         """
+        super()._op_fin(dop)
         if self.logged:
             if constants.ASKROOT:
-                args = [sys.executable] + sys.argv
+                # Pass the environment of the user, so it doesn't need to
+                # be loaded again by logging in as the user
+                args = [sys.executable, sys.argv[0],
+                        "--userenv", save_user_env()] + sys.argv[1:]
                 call_msg = "'sudo " + " ".join(args) + "'"
                 log_debug("Replacing process with " + call_msg + ".")
                 os.execvp('sudo', args)
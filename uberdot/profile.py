@@ -36,13 +36,15 @@ from uberdot.dynamicfile import *
 from uberdot.errors import CustomError
 from uberdot.errors import GenerationError
 from uberdot.errors import FatalError
+from uberdot.installedfile import LinkDescriptor
 from uberdot.utils import expandpath
 from uberdot.utils import find_target
 from uberdot.utils import get_dir_owner
+from uberdot.utils import get_dotfile_index
 from uberdot.utils import import_profile_class
 from uberdot.utils import log_debug
 from uberdot.utils import normpath
-from uberdot.utils import walk_dotfiles
+from uberdot.utils import record_dependency
 
 
 custom_builtins = []
@@ -96,8 +98,9 @@ class Profile:
             a root profile.
         parent (Profile): The parent profile. ``None`` if this a root profile.
         subprofiles (list): A list of all subprofiles
-        result (dict): The result of :func:`generate()`. Contains name, parent,
-            generated links and the result of all subprofiles.
+        result (dict): The result of :func:`generate()`. Contains name, the
+            name of the parent, generated links and the result of all
+            subprofiles. It contains only picklable values.
     """
     def __init__(self, options=None, directory=None, parent=None):
         """Constructor.
@@ -122,7 +125,7 @@ class Profile:
         self.subprofiles = []
         self.result = {
             "name": self.name,
-            "parent": self.parent,
+            "parent": self.parent.name if self.parent is not None else None,
             "links": [],
             "profiles": [],
             "beforeUpdate": None,
@@ -280,6 +283,7 @@ class Profile:
             if os.path.exists(link_path):
                 os.remove(link_path)
             os.symlink(script_path, link_path)
+            record_dependency("script", link_path, script_path)
 
         def getscriptattr(event_name):
             # Get event property
@@ -290,6 +294,9 @@ class Profile:
             if isinstance(attribute, str):
                 return attribute
             if callable(attribute):
+                # The function could return anything, so we can't cache
+                # the result of this profile
+                record_dependency("uncacheable", event_name + "()", True)
                 # If attribute is a function we need to execute it safely and
                 # make sure that it returns a string
                 try:
@@ -473,6 +480,9 @@ class Profile:
           :class:`~dynamicfile.FilteredFile`: The dynamic file that holds the
           output of the shell command
         """
+        # The output of a shell command could depend on anything, so we
+        # can't cache the result of this profile
+        record_dependency("uncacheable", "pipe()", True)
         if isinstance(target, DynamicFile):
             filtered = FilteredFile(target.name, shell_command)
             filtered.add_source(target.getpath())
@@ -519,7 +529,9 @@ class Profile:
         """
         read_opt = self._make_read_opt(kwargs)
         path = os.path.join(self.directory, expandpath(path))
-        if os.path.exists(path):
+        exists = os.path.exists(path)
+        record_dependency("exists", path, exists)
+        if exists:
             self.__create_link_descriptor(path, **kwargs)
         elif not read_opt("optional"):
             self._gen_err("Target path '" + path +
@@ -544,51 +556,41 @@ class Profile:
         """
         read_opt = self._make_read_opt(kwargs)
         target_list = []
-        target_dir = {}
 
         # Use target_pattern as replace_pattern
         if read_opt("replace") and not read_opt("replace_pattern"):
             kwargs["replace_pattern"] = target_pattern
 
-        # Find all files that match target_pattern and index
-        # them by their name without tag
-        for root, name in walk_dotfiles():
-            tag, base = (None, os.path.basename(name))
-            if constants.TAG_SEPARATOR in base:
-                tag, base = base.split(constants.TAG_SEPARATOR, 1)
-            match = None
+        # Find all files that match target_pattern. The index has them
+        # already grouped by their name without tag
+        index = get_dotfile_index()
+        pattern = re.compile(target_pattern)
+        for base, variants in index.variants.items():
             if match_path:
-                match = re.search(target_pattern, os.path.join(root, base))
-            else:
-                match = re.fullmatch(target_pattern, base)
-            if match is not None:
-                if base not in target_dir:
-                    target_dir[base] = []
-                target_dir[base].append((tag, os.path.join(root, name)))
-
-        def choose_file(base, tags):
-            # Go through set tags and take the first file that matches a tag
-            for tmp_tag in self.options["tags"]:
-                for item in tags:
-                    if item[0] == tmp_tag:
-                        target_list.append(item[1])
-                        return
-            # Look for files without tags
-            no_tag = None
-            for item in tags:
-                if item[0] is None:
-                    if no_tag is None:
-                        no_tag = item
-                    else:
-                        msg = "There are two targets found with the same name:"
-                        msg += " '" + base + "'\n  " + no_tag[1]
-                        msg += "\n  " + item[1]
-                        self._gen_err(msg)
-            if no_tag is not None:
-                target_list.append(no_tag[1])
-        # Then choose wisely which files will be linked
-        for base, tags in target_dir.items():
-            choose_file(base, tags)
+                variants = [
+                    item for item in variants
+                    if pattern.search(
+                        os.path.join(os.path.dirname(item[1]), base)
+                    ) is not None
+                ]
+                if not variants:
+                    continue
+            elif pattern.fullmatch(base) is None:
+                continue
+            # Then choose wisely which file will be linked
+            try:
+                if match_path:
+                    target = index.choose(base, variants, self.options["tags"])
+                else:
+                    target = index.resolve(base, self.options["tags"])
+            except ValueError:
+                untagged = [item[1] for item in variants if item[0] is None]
+                msg = "There are two targets found with the same name:"
+                msg += " '" + base + "'\n  " + untagged[0]
+                msg += "\n  " + untagged[1]
+                self._gen_err(msg)
+            if target is not None:
+                target_list.append(target)
 
         # Now we have all targets and can create links for each one
         if not target_list and not read_opt("optional"):
@@ -695,13 +697,10 @@ class Profile:
             uid, gid = get_dir_owner(name)
 
         # Finally create the result entry
-        linkdescriptor = {}
-        linkdescriptor["target"] = target
-        linkdescriptor["name"] = name
-        linkdescriptor["uid"] = uid
-        linkdescriptor["gid"] = gid
-        linkdescriptor["permission"] = read_opt("permission")
-        linkdescriptor["secure"] = read_opt("secure")
+        linkdescriptor = LinkDescriptor(
+            target=target, name=name, uid=uid, gid=gid,
+            permission=read_opt("permission"), secure=read_opt("secure")
+        )
         self.result["links"].append(linkdescriptor)
 
     @command
@@ -24,7 +24,6 @@ E.g. retrieving a environment variable or fixing file permisions."""
 
 
 import datetime
-import hashlib
 import grp
 import importlib.util
 import logging
@@ -34,6 +33,9 @@ import pwd
 import re
 import subprocess
 import time
+from stat import S_IMODE
+from stat import S_ISDIR
+from stat import S_ISREG
 from uberdot import constants
 from uberdot.errors import FatalError
 from uberdot.errors import GenerationError
@@ -43,7 +45,7 @@ from uberdot.errors import PreconditionError
 # Utils for finding targets
 ###############################################################################
 
-def find_target(target, tags):
+def find_target(target, tags, subtree=None):
     """Finds the correct target version in the repository to link to.
 
     This will search :const:`~constants.TARGET_FILES` for files that match the
@@ -55,34 +57,22 @@ def find_target(target, tags):
         target (str): The filename that will be searched for
         tags (list): A list of tags that will be matched against the search
             result
+        subtree (str): A directory in :const:`~constants.TARGET_FILES` that
+            the search will be limited to
     Raises:
         ValueError: Multiple targets where found
     Returns:
         str: Relative path of found file. Returns ``None`` if no target found.
     """
-    targets = []
-    # Collect all files that have the same filename as the target
-    for root, name in walk_dotfiles():
-        # We need to look if filename matches a tag
-        for tag in tags:
-            if name == tag + "%" + target:
-                targets.append(os.path.join(root, name))
-    if not targets:
-        # Seems like nothing was found, but we searched only files
-        # with tags so far. Trying without tags as fallback
-        return find_exact_target(target)
-    # Return found target. Because we found files with tags, we use
-    # the file that matches the earliest defined tag
-    for tag in tags:
-
-        for tmp_target in targets:
-            if os.path.basename(tmp_target).startswith(tag):
-                return tmp_target
-    raise FatalError("No target was found even though there seems to " +
-                     "exist one. That's strange...")
+    path = get_dotfile_index().resolve(target, tags, subtree)
+    if path is not None:
+        return path
+    # Seems like nothing was found, but the target itself could
+    # contain a tag. Trying the exact name as fallback
+    return find_exact_target(target, subtree)
 
 
-def find_exact_target(target):
+def find_exact_target(target, subtree=None):
     """Finds the exact target in the repository to link to.
 
     This will search :const:`~constants.TARGET_FILES` for files that match
@@ -90,17 +80,18 @@ def find_exact_target(target):
 
     Args:
         target (str): The filename that will be searched for
+        subtree (str): A directory in :const:`~constants.TARGET_FILES` that
+            the search will be limited to
     Raises:
         :class:`~errors.ValueError`: Multiple targets where found
     Returns:
         str: Relative path of found file. Returns ``None`` if no target
         found.
     """
-    targets = []
     # Collect all files that have the same filename as the target
-    for root, name in walk_dotfiles():
-        if name == target:
-            targets.append(os.path.join(root, name))
+    tag, base = split_tag(target)
+    targets = [path for var_tag, path
+               in get_dotfile_index().lookup(base, subtree) if var_tag == tag]
     # Whithout tags there shall be only one file that matches the target
     if len(targets) > 1:
         msg = "There are multiple targets that match: '" + target + "'"
@@ -114,40 +105,808 @@ def find_exact_target(target):
     return targets[0]
 
 
+def split_tag(filename):
+    """Splits the tag from the name of a dotfile.
+
+    Args:
+        filename (str): The name of the dotfile
+    Returns:
+        tuple: The tag (``None`` if the file has no tag) and the name of the
+        dotfile without its tag
+    """
+    if constants.TAG_SEPARATOR in filename:
+        tag, base = filename.split(constants.TAG_SEPARATOR, 1)
+        return tag, base
+    return None, filename
+
+
 def walk_dotfiles():
     """Walks through the :const:`~constants.TARGET_FILES` and returns all files
     found.
 
-    This also takes the .dotignore-file into account.
+    This also takes the .dotignore-file into account. Directories that are
+    ignored won't be walked through at all. The directory listings are
+    cached in :const:`~constants.DOTFILE_INDEX_FILE`, so only directories
+    that changed since the last run need to be scanned again.
+
+    If :const:`~constants.USE_GIT_INDEX` is set, the files will be read from
+    the git index instead. If that's not possible, this falls back to
+    walking through the directories.
 
     Returns:
         (list): Contains tuples with the directory and the filename of every
         found file
     """
-    # load ignore list
+    ignorelist = load_dotignore()
+    if constants.USE_GIT_INDEX:
+        result = list_git_dotfiles(ignorelist)
+        if result is not None:
+            return result
+        log_debug("Falling back to walking through the dotfiles.")
+    result = []
+    for root, files in scan_dotfile_dirs(ignorelist):
+        for name in files:
+            if not ignorelist.ignores(os.path.join(root, name)):
+                result.append((root, name))
+    return result
+
+
+class IgnoreList:
+    """The compiled patterns of a .dotignore-file.
+
+    All patterns are combined into a single regular expression, so a path
+    needs to be matched only once and the matching stops at the first
+    pattern that matches. Patterns with groups or inline flags are matched
+    one by one instead.
+
+    Attributes:
+        hash (str): The md5 hash of the .dotignore-file. Empty, if there is
+            no .dotignore-file.
+        patterns (list): The compiled patterns
+        matcher (function): Searches a path for any of the patterns
+        dir_matcher (function): Searches a path for any of the patterns
+            that ignore everything below a directory they match
+    """
+    BOUNDARIES = ("$", "\\Z", "\\b", "\\B", "(?=", "(?!")
+    """Anchors and lookaheads that look past the end of the path of a
+    directory. A pattern that contains one of them might match a directory
+    but none of the files in it."""
+
+    def __init__(self, entries, ignorelist_hash=""):
+        """Constructor.
+
+        Args:
+            entries (list): The regular expressions that will be compiled.
+                Empty entries will be skipped.
+            ignorelist_hash (str): The md5 hash of the .dotignore-file
+        Raises:
+            :class:`~errors.PreconditionError`: One of the entries isn't a
+                valid regular expression
+        """
+        self.hash = ignorelist_hash
+        self.patterns = []
+        for entry in entries:
+            if not entry:
+                continue
+            try:
+                self.patterns.append(re.compile(entry))
+            except re.error as err:
+                msg = "The .dotignore-file contains the invalid pattern '"
+                msg += entry + "': " + str(err)
+                raise PreconditionError(msg)
+        self.matcher = self.__compile(self.patterns)
+        self.dir_matcher = self.__compile([
+            pattern for pattern in self.patterns
+            if not any(token in pattern.pattern for token in self.BOUNDARIES)
+        ])
+
+    @staticmethod
+    def __compile(patterns):
+        """Creates a function that searches a path for any of the patterns.
+
+        Args:
+            patterns (list): The compiled patterns
+        Returns:
+            function: Returns the first match or ``None``
+        """
+        def search_all(path):
+            for pattern in patterns:
+                match = pattern.search(path)
+                if match is not None:
+                    return match
+            return None
+
+        # Joining patterns would break numbered backreferences and inline
+        # flags, which need to be at the start of a pattern. An empty
+        # pattern would match everything.
+        if patterns and not any(pattern.groups or pattern.flags & ~re.UNICODE
+                                for pattern in patterns):
+            try:
+                return re.compile("|".join(
+                    "(?:" + pattern.pattern + ")" for pattern in patterns
+                )).search
+            except re.error:
+                log_debug("Matching the patterns of the .dotignore-file " +
+                          "one by one.")
+        return search_all
+
+    def ignores(self, path):
+        """Checks if a file shall be ignored.
+
+        Args:
+            path (str): The path of the file
+        Returns:
+            bool: True, if any pattern matches the path
+        """
+        return self.matcher(path) is not None
+
+    def ignores_dir(self, path):
+        """Checks if a directory and all of its content shall be ignored.
+
+        A directory is ignored if any pattern matches its path followed by a
+        path separator. Patterns that contain one of :const:`BOUNDARIES`
+        are not considered, because they might not match the files in the
+        directory. Those files are checked one by one instead.
+
+        Args:
+            path (str): The path of the directory
+        Returns:
+            bool: True, if any pattern matches the directory
+        """
+        return self.dir_matcher(os.path.join(path, "")) is not None
+
+
+def load_dotignore():
+    """Loads and compiles the .dotignore-file of
+    :const:`~constants.TARGET_FILES`.
+
+    Returns:
+        IgnoreList: The compiled ignore list
+    """
     ignorelist_path = os.path.join(constants.TARGET_FILES, ".dotignore")
-    ignorelist = []
+    entries = []
+    ignorelist_hash = ""
     if os.path.exists(ignorelist_path):
         with open(ignorelist_path, "r") as file:
-            ignorelist = file.readlines()
-        ignorelist = [entry.strip() for entry in ignorelist]
-    ignorelist.append(".dotignore")
+            content = file.read()
+        ignorelist_hash = md5(content)
+        entries = [entry.strip() for entry in content.splitlines()]
+    entries.append(".dotignore")
+    return IgnoreList(entries, ignorelist_hash)
+
+
+def list_git_dotfiles(ignorelist):
+    """Lists all files of :const:`~constants.TARGET_FILES` by reading the
+    index of the git repository that contains it.
 
-    # walk through dotfile directory
+    Besides the tracked files, this lists also all untracked files (even if
+    ignored by git), so the result equals the result of walking through the
+    directories. Only the content of the ``.git`` directory is skipped.
+    Untracked directories are listed by git as a whole, so the directories
+    that are ignored by the .dotignore-file are skipped without walking
+    through them.
+
+    Args:
+        ignorelist (IgnoreList): The ignore list that is used to skip
+            files and directories
+    Returns:
+        list: Contains tuples with the directory and the filename of every
+        found file. ``None``, if the git index can't be used.
+    """
+    def git_ls_files(*args):
+        proc = subprocess.run(
+            ["git", "ls-files", "-z"] + list(args),
+            cwd=constants.TARGET_FILES,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        if proc.returncode:
+            raise OSError("git ls-files exited with " + str(proc.returncode))
+        return [os.fsdecode(item) for item in proc.stdout.split(b"\0")[:-1]]
+
+    try:
+        staged = git_ls_files("-s")
+        untracked = git_ls_files("-o", "--directory")
+        deleted = set(git_ls_files("-d"))
+    except OSError as err:
+        log_debug("Can't read git index: " + str(err))
+        return None
+    ignored_dirs = {"": False}
+
+    def is_ignored_dir(reldir):
+        if reldir not in ignored_dirs:
+            ignored_dirs[reldir] = (
+                is_ignored_dir(os.path.dirname(reldir)) or
+                ignorelist.ignores_dir(
+                    os.path.join(constants.TARGET_FILES, reldir)
+                )
+            )
+        return ignored_dirs[reldir]
+
+    # Collect the paths of all files
+    files = []
+    for line in staged:
+        info, relpath = line.split("\t", 1)
+        mode = info.split(" ")[0]
+        if mode == "160000":
+            log_debug("Git index contains submodule '" + relpath + "'.")
+            return None
+        if relpath in deleted or (mode == "120000" and os.path.isdir(
+                os.path.join(constants.TARGET_FILES, relpath))):
+            # Like os.walk() we treat symlinks to dirs as directories
+            continue
+        files.append(relpath)
+    for relpath in untracked:
+        if not relpath.endswith("/"):
+            if not os.path.isdir(os.path.join(constants.TARGET_FILES,
+                                              relpath)):
+                files.append(relpath)
+            continue
+        # If nothing is tracked at all, git lists only "./"
+        reldir = "" if relpath == "./" else relpath[:-1]
+        if is_ignored_dir(reldir):
+            continue
+        for root, dirs, names in os.walk(
+                os.path.join(constants.TARGET_FILES, reldir)):
+            reldir = os.path.relpath(root, constants.TARGET_FILES)
+            if reldir == ".":
+                # Skip the .git directory of the repository itself
+                reldir = ""
+                dirs[:] = [name for name in dirs if name != ".git"]
+                names = [name for name in names if name != ".git"]
+            if ".git" in dirs or ".git" in names:
+                log_debug("Dotfiles contain nested repository '" + reldir +
+                          "'.")
+                return None
+            dirs[:] = [name for name in dirs if not
+                       ignorelist.ignores_dir(os.path.join(root, name))]
+            files.extend(os.path.join(reldir, name) for name in names)
+    # Filter files and directories that are ignored
     result = []
-    for root, _, files in os.walk(constants.TARGET_FILES):
-        for name in files:
-            # check if file should be ignored
-            on_ignorelist = False
-            for entry in ignorelist:
-                if re.search(entry, os.path.join(root, name)):
-                    on_ignorelist = True
-            # if not add it to result
-            if not on_ignorelist:
-                result.append((root, name))
+    for relpath in files:
+        reldir, name = os.path.split(relpath)
+        if is_ignored_dir(reldir):
+            continue
+        root = os.path.join(constants.TARGET_FILES, reldir) if reldir \
+            else constants.TARGET_FILES
+        if ignorelist.ignores(os.path.join(root, name)):
+            continue
+        result.append((root, name))
+    log_debug("Read " + str(len(result)) + " dotfiles from git index.")
+    return result
+
+
+def scan_dotfile_dirs(ignorelist):
+    """Lists all directories of :const:`~constants.TARGET_FILES` in the same
+    order as ``os.walk()`` would do, but skips ignored directories.
+
+    The listing of every directory is stored in
+    :const:`~constants.DOTFILE_INDEX_FILE` together with the modification
+    time of the directory. A directory will only be scanned again if its
+    modification time changed. If the .dotignore-file changed, all
+    directories will be scanned again.
+
+    Args:
+        ignorelist (IgnoreList): The ignore list that is used to skip
+            directories
+    Returns:
+        list: Contains tuples with the path of every directory and a list of
+        the names of all files in the directory
+    """
+    # Load old index
+    index = load_cache_file(constants.DOTFILE_INDEX_FILE)
+    old_dirs = {}
+    if (index.get("@version") == constants.VERSION and
+            index.get("root") == constants.TARGET_FILES and
+            index.get("dotignore") == ignorelist.hash):
+        old_dirs = index["dirs"]
+    # Directories that were modified just before or while we scan them could
+    # be modified again without changing their timestamp. So we don't trust
+    # the timestamps of those directories in the next run.
+    racy_mtime = int((time.time() - 2) * 10**9)
+    new_dirs = {}
+    hits = misses = 0
+    result = []
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        path = os.path.join(constants.TARGET_FILES, reldir) if reldir \
+            else constants.TARGET_FILES
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        entry = old_dirs.get(reldir)
+        if entry is not None and entry["mtime"] == mtime:
+            hits += 1
+        else:
+            misses += 1
+            entry = {"files": [], "dirs": []}
+            try:
+                for dir_entry in os.scandir(path):
+                    if dir_entry.is_dir():
+                        # Like os.walk() we don't follow symlinks to dirs
+                        if (not dir_entry.is_symlink() and
+                                not ignorelist.ignores_dir(dir_entry.path)):
+                            entry["dirs"].append(dir_entry.name)
+                    else:
+                        entry["files"].append(dir_entry.name)
+            except OSError:
+                continue
+            entry["mtime"] = mtime if mtime < racy_mtime else None
+        new_dirs[reldir] = entry
+        result.append((path, entry["files"]))
+        for subdir in reversed(entry["dirs"]):
+            stack.append(os.path.join(reldir, subdir))
+    log_debug("Dotfile index: " + str(hits) + " directories unchanged, " +
+              str(misses) + " directories scanned.")
+    # Store new index if anything changed
+    if misses or len(new_dirs) != len(old_dirs):
+        write_cache_file(constants.DOTFILE_INDEX_FILE, {
+            "@version": constants.VERSION,
+            "root": constants.TARGET_FILES,
+            "dotignore": ignorelist.hash,
+            "dirs": new_dirs
+        })
     return result
 
 
+def invalidate_dotfile_index():
+    """Removes :const:`~constants.DOTFILE_INDEX_FILE` and the index of the
+    current run, so all directories will be scanned again."""
+    global _dotfile_index
+    _dotfile_index = None
+    if os.path.exists(constants.DOTFILE_INDEX_FILE):
+        os.remove(constants.DOTFILE_INDEX_FILE)
+
+
+class DotfileIndex:
+    """An index of all dotfiles in :const:`~constants.TARGET_FILES`.
+
+    The index groups all dotfiles by their name without tag, so all
+    variants of a dotfile can be looked up without walking through the
+    repository again.
+
+    Attributes:
+        root (str): The directory that was indexed
+        files (list): Tuples with the directory and the filename of every
+            indexed file, like they are returned by :func:`walk_dotfiles()`
+        variants (dict): Maps the name of a dotfile without its tag to a list
+            of tuples with the tag (``None`` for untagged files) and the path
+            of each variant
+    """
+    def __init__(self, root, files):
+        """Constructor.
+
+        Args:
+            root (str): The directory that was indexed
+            files (list): Tuples with the directory and the filename of every
+                file that will be indexed
+        """
+        self.root = root
+        self.files = files
+        self._ranks = {}
+        self._resolved = {}
+        self._fingerprint = None
+        self.variants = {}
+        for directory, name in files:
+            tag, base = split_tag(name)
+            if base not in self.variants:
+                self.variants[base] = []
+            self.variants[base].append((tag, os.path.join(directory, name)))
+
+    @property
+    def fingerprint(self):
+        """str: A hash of the paths of all indexed files."""
+        if self._fingerprint is None:
+            import json
+            self._fingerprint = md5(json.dumps(self.files))
+        return self._fingerprint
+
+    def lookup(self, base, subtree=None):
+        """Returns all variants of a dotfile.
+
+        Args:
+            base (str): The name of the dotfile without tag
+            subtree (str): A directory relative to :attr:`self.root` that
+                the lookup will be limited to
+        Returns:
+            list: Tuples with tag and path of every variant
+        """
+        variants = self.variants.get(base, [])
+        if subtree is None:
+            return variants
+        prefix = os.path.join(os.path.normpath(
+            os.path.join(self.root, subtree)
+        ), "")
+        return [item for item in variants if item[1].startswith(prefix)]
+
+    def resolve(self, base, tags, subtree=None):
+        """Returns the variant of a dotfile that matches the tags best.
+
+        The result is memoized, so resolving the same dotfile with the same
+        tags again is cheap.
+
+        Args:
+            base (str): The name of the dotfile without tag
+            tags (list): The tags ordered by their priority
+            subtree (str): A directory relative to :attr:`self.root` that
+                the lookup will be limited to
+        Raises:
+            ValueError: There are multiple variants without tag
+        Returns:
+            str: The path of the chosen variant. ``None`` if there is no
+            matching variant.
+        """
+        key = (base, tuple(tags), subtree)
+        if key not in self._resolved:
+            self._resolved[key] = self.choose(
+                base, self.lookup(base, subtree), tags
+            )
+        return self._resolved[key]
+
+    def choose(self, base, variants, tags):
+        """Chooses the variant that matches the tags best.
+
+        This is the variant whose tag occurs first in ``tags``. If there are
+        multiple variants with that tag, the first one is chosen. If no tag
+        matches, the variant without tag is chosen.
+
+        Args:
+            base (str): The name of the dotfile without tag
+            variants (list): Tuples with tag and path of the variants that
+                will be considered
+            tags (list): The tags ordered by their priority
+        Raises:
+            ValueError: There are multiple variants without tag
+        Returns:
+            str: The path of the chosen variant. ``None`` if there is no
+            matching variant.
+        """
+        ranks = self.tag_ranks(tags)
+        best = None
+        best_rank = len(tags)
+        untagged = []
+        for tag, path in variants:
+            if tag is None:
+                untagged.append(path)
+            else:
+                rank = ranks.get(tag, best_rank)
+                if rank < best_rank:
+                    best, best_rank = path, rank
+        if best is not None:
+            return best
+        # Whithout tags there shall be only one file that matches the target
+        if len(untagged) > 1:
+            msg = "There are multiple targets that match: '" + base + "'"
+            for tmp_target in untagged:
+                msg += "\n  " + tmp_target
+            raise ValueError(msg)
+        return untagged[0] if untagged else None
+
+    def tag_ranks(self, tags):
+        """Maps each tag to its priority. The earliest occurrence of a tag
+        counts. The result is memoized for every distinct list of tags.
+
+        Args:
+            tags (list): The tags ordered by their priority
+        Returns:
+            dict: Maps every tag to its index in ``tags``
+        """
+        key = tuple(tags)
+        if key not in self._ranks:
+            ranks = {}
+            for i, tag in enumerate(key):
+                ranks.setdefault(tag, i)
+            self._ranks[key] = ranks
+        return self._ranks[key]
+
+
+_dotfile_index = None
+
+
+def get_dotfile_index():
+    """Gets the index of all dotfiles in :const:`~constants.TARGET_FILES`.
+
+    The index will be created only once per run.
+
+    Returns:
+        DotfileIndex: The index of all dotfiles
+    """
+    global _dotfile_index
+    if (_dotfile_index is None or
+            _dotfile_index.root != constants.TARGET_FILES):
+        _dotfile_index = DotfileIndex(constants.TARGET_FILES,
+                                      walk_dotfiles())
+    record_dependency("dotfiles", _dotfile_index.root,
+                      _dotfile_index.fingerprint)
+    return _dotfile_index
+
+
+# Caching metadata of the filesystem
+###############################################################################
+
+class FileSystemCache:
+    """Caches metadata of the filesystem for a single run.
+
+    The interpreters look up the same paths over and over, e.g. the directory
+    of every link is checked for existence, write access and its owner. Those
+    lookups are answered by this cache, so every path is only queried once.
+    Everything that changes the filesystem needs to invalidate the paths that
+    it changed. Paths are cached by their absolute path, so it doesn't
+    matter how they are written.
+
+    If ``prefetch`` is set, the parent directory of a path is read with a
+    single ``os.scandir()`` when the path is looked up for the first time.
+    The existence and the type of all its entries are then known without
+    querying them one by one.
+
+    Attributes:
+        prefetch (bool): True, if parent directories will be scanned
+        lookups (int): Counter for all lookups
+        syscalls (dict): Counters for all syscalls by their name
+    """
+    def __init__(self, prefetch=False):
+        """Constructor
+
+        Args:
+            prefetch (bool): Sets, if parent directories will be scanned
+        """
+        self.prefetch = prefetch
+        self.lookups = 0
+        self.syscalls = {}
+        self._lstats = {}
+        self._stats = {}
+        self._access = {}
+        self._listings = {}
+        self._scans = {}
+
+    def _call(self, name, function, *args):
+        """Calls a function of ``os`` and counts the call.
+
+        Args:
+            name (str): The name that the call will be counted as
+            function (function): The function that will be called
+            *args: The arguments for the function
+        Returns:
+            The result of the function
+        """
+        self.syscalls[name] = self.syscalls.get(name, 0) + 1
+        return function(*args)
+
+    def _stat(self, cache, name, function, path):
+        """Gets the (cached) result of a stat-like function.
+
+        Args:
+            cache (dict): The dictionary that caches the results
+            name (str): The name of the syscall
+            function (function): The stat-like function
+            path (str): The path that will be looked up
+        Returns:
+            os.stat_result: The result of the function. ``None``, if the path
+            doesn't exist or can't be accessed.
+        """
+        if path not in cache:
+            try:
+                cache[path] = self._call(name, function, path)
+            except OSError:
+                # Like os.path, paths that can't be accessed don't exist
+                cache[path] = None
+        return cache[path]
+
+    def _scan(self, dirname):
+        """Gets the (cached) types of all entries of a directory.
+
+        Args:
+            dirname (str): The path to the directory
+        Returns:
+            dict: Maps the names of all entries to either "dir", "link" or
+            "file". ``None``, if the directory can't be read.
+        """
+        if dirname not in self._scans:
+            try:
+                scan = {}
+                for entry in self._call("scandir", list,
+                                        os.scandir(dirname)):
+                    if entry.is_symlink():
+                        scan[entry.name] = "link"
+                    elif entry.is_dir(follow_symlinks=False):
+                        scan[entry.name] = "dir"
+                    else:
+                        scan[entry.name] = "file"
+            except (FileNotFoundError, NotADirectoryError):
+                # Nothing exists in a directory that doesn't exist
+                scan = {}
+            except OSError:
+                scan = None
+            self._scans[dirname] = scan
+        return self._scans[dirname]
+
+    def _type(self, path):
+        """Gets the type of a path from the scan of its parent directory.
+
+        Args:
+            path (str): The absolute path
+        Returns:
+            str: Either "dir", "link", "file" or "missing". ``None``, if the
+            type isn't known without a syscall.
+        """
+        if not self.prefetch or path == "/":
+            return None
+        dirname, name = os.path.split(path)
+        scan = self._scan(dirname)
+        if scan is None:
+            return None
+        return scan.get(name, "missing")
+
+    def lexists(self, path):
+        """Like ``os.path.lexists()``.
+
+        Args:
+            path (str): The path that will be checked
+        Returns:
+            bool: True, if the path exists (broken symlinks do exist)
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        kind = self._type(path)
+        if kind is not None:
+            return kind != "missing"
+        return self._stat(self._lstats, "lstat", os.lstat, path) is not None
+
+    def exists(self, path):
+        """Like ``os.path.exists()``.
+
+        Args:
+            path (str): The path that will be checked
+        Returns:
+            bool: True, if the path exists (broken symlinks don't exist)
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        kind = self._type(path)
+        if kind is not None and kind != "link":
+            return kind != "missing"
+        return self._stat(self._stats, "stat", os.stat, path) is not None
+
+    def isdir(self, path):
+        """Like ``os.path.isdir()``.
+
+        Args:
+            path (str): The path that will be checked
+        Returns:
+            bool: True, if the path is a directory or a symlink to a directory
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        kind = self._type(path)
+        if kind is not None and kind != "link":
+            return kind == "dir"
+        info = self._stat(self._stats, "stat", os.stat, path)
+        return info is not None and S_ISDIR(info.st_mode)
+
+    def owner(self, path):
+        """Gets the owner of a path.
+
+        Args:
+            path (str): The path to an existing file
+        Raises:
+            FileNotFoundError: The path doesn't exist
+        Returns:
+            tuple: The UID and the GID of the owner
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        info = self._stat(self._stats, "stat", os.stat, path)
+        if info is None:
+            raise FileNotFoundError("No such file or directory: '" +
+                                    path + "'")
+        return info.st_uid, info.st_gid
+
+    def access(self, path, mode):
+        """Like ``os.access()``.
+
+        Args:
+            path (str): The path that will be checked
+            mode (int): The access mode that will be checked
+        Returns:
+            bool: True, if access is allowed
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        key = (path, mode)
+        if key not in self._access:
+            self._access[key] = self._call("access", os.access, path, mode)
+        return self._access[key]
+
+    def listdir(self, path):
+        """Like ``os.listdir()``.
+
+        Args:
+            path (str): The path to a directory
+        Returns:
+            list: The names of all entries of the directory
+        """
+        path = os.path.abspath(path)
+        self.lookups += 1
+        scan = self._scans.get(path)
+        if scan is not None:
+            return list(scan)
+        if path not in self._listings:
+            self._listings[path] = self._call("listdir", os.listdir, path)
+        return list(self._listings[path])
+
+    def invalidate(self, path):
+        """Removes all cached metadata of a path. This needs to be called
+        whenever a path is created, removed or its owner or permissions change.
+
+        If the path was created or removed, the parent directory needs to be
+        invalidated by :meth:`invalidate_listing()` as well.
+
+        Args:
+            path (str): The path that changed
+        """
+        path = os.path.abspath(path)
+        self._lstats.pop(path, None)
+        self._stats.pop(path, None)
+        self._listings.pop(path, None)
+        self._scans.pop(path, None)
+        for mode in [key[1] for key in self._access if key[0] == path]:
+            del self._access[(path, mode)]
+
+    def invalidate_listing(self, dirname):
+        """Removes the cached entries of a directory. This needs to be called
+        whenever a file is created in or removed from a directory.
+
+        Args:
+            dirname (str): The path to the directory that changed
+        """
+        dirname = os.path.abspath(dirname)
+        self._listings.pop(dirname, None)
+        self._scans.pop(dirname, None)
+
+    def clear(self):
+        """Removes everything from the cache, e.g. after external programs
+        could have changed the filesystem."""
+        self._lstats.clear()
+        self._stats.clear()
+        self._access.clear()
+        self._listings.clear()
+        self._scans.clear()
+
+    def summary(self):
+        """Describes how many lookups and syscalls were made.
+
+        Returns:
+            str: The summary
+        """
+        total = sum(self.syscalls.values())
+        msg = str(self.lookups) + " lookups, " + str(total) + " syscalls"
+        if total:
+            msg += " (" + ", ".join(
+                name + ": " + str(count)
+                for name, count in sorted(self.syscalls.items())
+            ) + ")"
+        return msg
+
+
+_filesystem_cache = None
+
+
+def get_filesystem_cache():
+    """Gets the cache for metadata of the filesystem.
+
+    The cache will be created only once per run.
+
+    Returns:
+        FileSystemCache: The cache
+    """
+    global _filesystem_cache
+    if _filesystem_cache is None:
+        _filesystem_cache = FileSystemCache(constants.PREFETCH_DIRS)
+    return _filesystem_cache
+
+
 # Utils for permissions and user
 ###############################################################################
 
@@ -195,10 +954,13 @@ def get_dir_owner(filename):
         A tuple containing the UID of the directory owner and the GID of the
         directory owner
     """
+    cache = get_filesystem_cache()
     dirname = os.path.dirname(filename)
-    while not os.path.isdir(dirname):
+    while not cache.isdir(dirname):
         dirname = os.path.dirname(dirname)
-    return os.stat(dirname).st_uid, os.stat(dirname).st_gid
+    owner = cache.owner(dirname)
+    record_dependency("owner", filename, list(owner))
+    return owner
 
 
 def has_root_priveleges():
@@ -261,29 +1023,139 @@ def get_user_env_var(varname, fallback=None):
     Returns:
         str: The value of the variable
     """
-    try:
-        return get_user_env()[varname]
-    except KeyError:
-        if fallback is not None:
-            return fallback
-        raise PreconditionError("There is no environment varibable set " +
-                                "with the name: '" + varname + "'")
+    value = get_user_env().get(varname)
+    record_dependency("env", varname, value)
+    if value is not None:
+        return value
+    if fallback is not None:
+        return fallback
+    raise PreconditionError("There is no environment varibable set " +
+                            "with the name: '" + varname + "'")
+
+_user_env = None
+
 
 def get_user_env():
-    if has_root_priveleges():
-        # Looks like we have to load the environment vars by ourself
-        user_environ = {}
-        # Login into other user and read env
-        proc = subprocess.run(
-            ["sudo", "-Hiu", get_current_username(), "env"],
-            stdout=subprocess.PIPE
-        )
-        for line in proc.stdout.splitlines():
-            key, val = line.decode().split("=", 1)
-            user_environ[key] = val
-        return user_environ
-    # A normal user can access its own variables
-    return os.environ
+    """Gets the environment variables of the user that started uberdot.
+
+    The environment is only captured once per process. If executed as root,
+    this function will login as the original user to read the environment,
+    unless it was already loaded with :func:`load_user_env()`.
+
+    Returns:
+        dict: The environment variables of the user
+    """
+    global _user_env
+    if _user_env is None:
+        if has_root_priveleges():
+            # Looks like we have to load the environment vars by ourself
+            user_env = {}
+            # Login into other user and read env
+            proc = subprocess.run(
+                ["sudo", "-Hiu", get_current_username(), "env"],
+                stdout=subprocess.PIPE
+            )
+            for line in proc.stdout.splitlines():
+                key, val = line.decode().split("=", 1)
+                user_env[key] = val
+            _user_env = user_env
+        else:
+            # A normal user can access its own variables
+            _user_env = dict(os.environ)
+    return _user_env
+
+
+USER_ENV_MAX_AGE = 3600
+"""The number of seconds after which a file of :func:`save_user_env()` is
+considered stale, e.g. because sudo failed or was cancelled."""
+
+
+def save_user_env():
+    """Writes the environment of the user into a temporary file, so it can
+    be passed to a process that is restarted with sudo.
+
+    sudo closes all inherited file descriptors and stdin is needed for
+    questions to the user, so a file is the only way to pass it. The file is
+    only readable by the user. The restarted process removes the file as
+    soon as it loaded it. Files that were never loaded are removed by
+    :func:`remove_stale_user_envs()`.
+
+    Returns:
+        str: The path of the file
+    """
+    import json
+    import tempfile
+    remove_stale_user_envs()
+    handle, path = tempfile.mkstemp(prefix="uberdot-env-", suffix=".json")
+    with os.fdopen(handle, "w") as file:
+        json.dump(get_user_env(), file)
+    return path
+
+
+def remove_stale_user_envs():
+    """Removes all files of :func:`save_user_env()` in the directory for
+    temporary files that belong to the user and are older than
+    :const:`USER_ENV_MAX_AGE`."""
+    import tempfile
+    directory = tempfile.gettempdir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        if not name.startswith("uberdot-env-") or not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            info = os.lstat(path)
+            if (S_ISREG(info.st_mode) and info.st_uid == get_uid() and
+                    now - info.st_mtime > USER_ENV_MAX_AGE):
+                log_debug("Removing stale user environment '" + path + "'.")
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def load_user_env(path):
+    """Loads the environment of the user from a file that was written by
+    :func:`save_user_env()` and removes the file afterwards.
+
+    The file is only used if it is a regular file in the directory for
+    temporary files, that belongs to the user and can't be read by others.
+    Otherwise the file is neither used nor removed, so root can't be
+    tricked into reading or removing arbitrary files. If the file can't be
+    loaded, the environment will be captured as usual. Stale files of
+    earlier runs are removed as well.
+
+    Args:
+        path (str): The path of the file
+    """
+    global _user_env
+    import json
+    import tempfile
+    remove_stale_user_envs()
+    directory = os.path.realpath(os.path.dirname(os.path.abspath(path)))
+    try:
+        if directory != os.path.realpath(tempfile.gettempdir()):
+            raise OSError("Not in the directory for temporary files")
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd, "r") as file:
+            info = os.fstat(file.fileno())
+            if not S_ISREG(info.st_mode):
+                raise OSError("Not a regular file")
+            if info.st_uid != get_uid():
+                raise OSError("Not owned by " + get_current_username())
+            if S_IMODE(info.st_mode) != 0o600:
+                raise OSError("Permission is not 600")
+            user_env = json.load(file)
+        os.remove(path)
+    except (OSError, ValueError) as err:
+        log_debug("Could not load user environment from '" + path + "': " +
+                  str(err))
+        return
+    _user_env = user_env
+    _normpaths.clear()
 
 
 def expandvars(path):
@@ -347,20 +1219,97 @@ def expandpath(path):
     return None
 
 
+_normpaths = {}
+
+
 def normpath(path):
     """Normalizes path, expands ~ and environment vars,
     and converts it in an absolute path.
 
+    The results are memoized. The environment variables that were used to
+    expand a path are stored along with the result, so they can be recorded
+    again whenever the result is reused.
+
     Args:
         path (str): The path that will be normalized
     Returns:
         str: The normalized path
     """
-    if path is not None:
-        path = expandvars(path)
-        path = expanduser(path)
-        return os.path.abspath(path)
-    return None
+    if path is None:
+        return None
+    key = path, "" if path.startswith("/") else os.getcwd()
+    if key in _normpaths:
+        result, env = _normpaths[key]
+        for name, value in env.items():
+            record_dependency("env", name, value)
+        return result
+    recording = start_recording()
+    try:
+        result = os.path.abspath(expanduser(expandvars(path)))
+    finally:
+        stop_recording(recording)
+    _normpaths[key] = result, recording.get("env", {})
+    return result
+
+
+# Recording dependencies
+###############################################################################
+
+_recordings = []
+
+
+def start_recording():
+    """Starts to record all dependencies of the generation of a profile.
+
+    Recordings can be nested. Every dependency will be added to all
+    recordings that are running.
+
+    Returns:
+        dict: The recording. Maps every kind of dependency to a dictionary
+        of the recorded keys and values.
+    """
+    recording = {}
+    _recordings.append(recording)
+    return recording
+
+
+def stop_recording(recording):
+    """Stops a recording that was started by :func:`start_recording()`.
+
+    Args:
+        recording (dict): The recording that will be stopped
+    """
+    _recordings.remove(recording)
+
+
+def record_dependency(kind, key, value):
+    """Adds a dependency to all running recordings.
+
+    Args:
+        kind (str): The kind of the dependency, e.g. ``env`` for environment
+            variables
+        key (str): What the dependency is about, e.g. the name of the
+            environment variable
+        value: The value that was used. Needs to be JSON serializable.
+    """
+    for recording in _recordings:
+        recording.setdefault(kind, {})[key] = value
+
+
+def record_file(path):
+    """Adds the modification time and the size of a file to all running
+    recordings.
+
+    Args:
+        path (str): The path of the file
+    """
+    if _recordings and path is not None:
+        try:
+            info = os.stat(path)
+        except OSError:
+            record_dependency("exists", path, False)
+            return
+        record_dependency("file", path, [info.st_mtime_ns, info.st_size])
 
 
 # Dynamic imports
@@ -369,9 +1318,11 @@ def normpath(path):
 def import_profile_class(class_name):
     """Imports a profile class only by it's name.
 
-    Searches :const:`~constants.PROFILE_FILES` for python modules and imports
-    them temporarily. If the module has a class that is the same as
-    ``class_name`` it returns it.
+    Looks up the module that defines ``class_name`` in the
+    :func:`profile registry<get_profile_registry()>` and imports only this
+    module. If the class is not found this way, all python modules in
+    :const:`~constants.PROFILE_FILES` will be imported temporarily until a
+    module has a class that is the same as ``class_name``.
 
     Args:
         class_name (str): The name of the class that will be imported
@@ -384,37 +1335,179 @@ def import_profile_class(class_name):
     Returns:
         class: The class that was imported
     """
+    file = get_profile_registry().get(class_name)
+    if file is not None:
+        profile_class = get_profile_class(class_name, file)
+        if profile_class is not None:
+            return profile_class
+    log_debug("Profile '" + class_name + "' is not registered. Searching " +
+              "all modules.")
+    # Go through all files in the profile directory
+    for file in list_profile_modules():
+        profile_class = get_profile_class(class_name, file)
+        if profile_class is not None:
+            return profile_class
+    raise PreconditionError("The profile '" + class_name +
+                            "' could not be found in any module. Aborting.")
+
+
+def get_profile_class(class_name, file):
+    """Imports a python module and returns a profile class of it.
+
+    Args:
+        class_name (str): The name of the class that will be returned
+        file (str): The path of the module
+    Raises:
+        :class:`~errors.GenerationError`: The module contained errors or the
+            class doesn't inherit from :class:`~profile.Profile`
+    Returns:
+        class: The class. ``None`` if the module has no such class.
+    """
     # Import profile (can't be done globally because profile needs to
     # import this module first)
     from uberdot.profile import Profile
 
-    # Go through all files in the profile directory
+    try:
+        module = import_profile_module(file)
+    except Exception as err:
+        raise GenerationError(class_name, "The module '" + file +
+                              "' contains an error and therefor " +
+                              "can't be imported. The error was:" +
+                              "\n   " + str(err))
+    # Return the class if it is in this module
+    if class_name in module.__dict__:
+        tmp_class = module.__dict__[class_name]
+        if issubclass(tmp_class, Profile):
+            return tmp_class
+        msg = "The class '" + class_name + "' does not inherit from"
+        msg += " Profile and therefore can't be imported."
+        raise GenerationError(class_name, msg)
+    return None
+
+
+_profile_modules = {}
+profile_module_stats = {"imported": 0, "reused": 0}
+"""Counts how often profile modules were imported and how often an import
+was avoided because the module was already imported."""
+
+
+def import_profile_module(file):
+    """Imports a python module from a file.
+
+    Every module is executed only once per process. The module will be
+    executed again only if its modification time changed.
+
+    Args:
+        file (str): The path of the module
+    Returns:
+        module: The imported module
+    """
+    mtime = os.stat(file).st_mtime_ns
+    cached = _profile_modules.get(file)
+    if cached is not None and cached[0] == mtime:
+        profile_module_stats["reused"] += 1
+        return cached[1]
+    name = os.path.splitext(os.path.basename(file))[0]
+    spec = importlib.util.spec_from_file_location(name, file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _profile_modules[file] = (mtime, module)
+    profile_module_stats["imported"] += 1
+    return module
+
+
+def list_profile_modules():
+    """Lists all python modules in :const:`~constants.PROFILE_FILES`.
+
+    Returns:
+        list: The paths of all modules
+    """
+    result = []
     for root, _, files in os.walk(constants.PROFILE_FILES):
         for file in files:
-            file = os.path.join(root, file)
             # Ignore everything that isn't a python module
-            if file[-2:] != "py":
-                continue
-            try:
-                # Import module
-                spec = importlib.util.spec_from_file_location("__name__", file)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-            except Exception as err:
-                raise GenerationError(class_name, "The module '" + file +
-                                      "' contains an error and therefor " +
-                                      "can't be imported. The error was:" +
-                                      "\n   " + str(err))
-            # Return the class if it is in this module
-            if class_name in module.__dict__:
-                tmp_class = module.__dict__[class_name]
-                if issubclass(tmp_class, Profile):
-                    return module.__dict__[class_name]
-                msg = "The class '" + class_name + "' does not inherit from"
-                msg += " Profile and therefore can't be imported."
-                raise GenerationError(class_name, msg)
-    raise PreconditionError("The profile '" + class_name +
-                            "' could not be found in any module. Aborting.")
+            if file[-2:] == "py":
+                result.append(os.path.join(root, file))
+    return result
+
+
+_profile_registry = None
+
+
+def get_profile_registry():
+    """Gets the registry that maps the names of all classes in
+    :const:`~constants.PROFILE_FILES` to the module that defines them.
+
+    The registry is created by parsing the modules without executing them.
+    It is stored in :const:`~constants.PROFILE_REGISTRY_FILE` together
+    with the modification times of the modules, so only modules that changed
+    since the last run need to be parsed again. If multiple modules define a
+    class with the same name, the module that is found first is registered.
+
+    Returns:
+        dict: Maps class names to the paths of the modules
+    """
+    global _profile_registry
+    if (_profile_registry is not None and
+            _profile_registry[0] == constants.PROFILE_FILES):
+        return _profile_registry[1]
+    cache = load_cache_file(constants.PROFILE_REGISTRY_FILE)
+    old_modules = {}
+    if (cache.get("@version") == constants.VERSION and
+            cache.get("root") == constants.PROFILE_FILES):
+        old_modules = cache["modules"]
+    # Modules that were modified just now could be modified again without
+    # changing their timestamp, so we don't trust their timestamps
+    racy_mtime = int((time.time() - 2) * 10**9)
+    new_modules = {}
+    registry = {}
+    parsed = 0
+    for file in list_profile_modules():
+        try:
+            mtime = os.stat(file).st_mtime_ns
+        except OSError:
+            continue
+        entry = old_modules.get(file)
+        if entry is None or entry["mtime"] != mtime:
+            parsed += 1
+            entry = {
+                "classes": parse_class_names(file),
+                "mtime": mtime if mtime < racy_mtime else None
+            }
+        new_modules[file] = entry
+        for class_name in entry["classes"]:
+            registry.setdefault(class_name, file)
+    log_debug("Profile registry: " + str(parsed) + " of " +
+              str(len(new_modules)) + " modules parsed.")
+    if parsed or len(new_modules) != len(old_modules):
+        write_cache_file(constants.PROFILE_REGISTRY_FILE, {
+            "@version": constants.VERSION,
+            "root": constants.PROFILE_FILES,
+            "modules": new_modules
+        })
+    _profile_registry = (constants.PROFILE_FILES, registry)
+    return registry
+
+
+def parse_class_names(file):
+    """Parses a python module and returns the names of all classes that are
+    defined at the top level of the module.
+
+    Args:
+        file (str): The path of the module
+    Returns:
+        list: The names of the classes. Empty, if the module can't be parsed.
+    """
+    # Imported here, because it's only needed when profiles changed
+    import ast
+
+    try:
+        with open(file, "rb") as fin:
+            tree = ast.parse(fin.read(), file)
+    except (OSError, SyntaxError, ValueError):
+        # Errors will be reported when the module is actually imported
+        return []
+    return [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
 
 
 # Misc
@@ -547,6 +1640,120 @@ def md5(string):
     Returns:
         The hexadecimal representation of the md5 hash
     """
+    import hashlib
     if isinstance(string, str):
         string = string.encode()
     return hashlib.md5(string).hexdigest()
+
+
+def load_cache_file(path):
+    """Loads the content of a cache file.
+
+    Args:
+        path (str): The path of the cache file
+    Returns:
+        dict: The cached data. Empty, if there is no (valid) data stored.
+    """
+    import json
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache_file(path, content):
+    """Writes a cache file atomically.
+
+    Failing to write a cache is not critical, so errors are only logged.
+
+    Args:
+        path (str): The path of the cache file
+        content (dict): The data that will be cached
+    """
+    import json
+    # Every process uses its own temporary file, so concurrent processes
+    # don't write into the same file
+    tmp_path = path + "." + str(os.getpid()) + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w") as file:
+            json.dump(content, file)
+        os.chown(tmp_path, get_uid(), get_gid())
+        os.replace(tmp_path, path)
+    except OSError as err:
+        log_debug("Could not write cache '" + path + "': " + str(err))
+
+
+class FileLock:
+    """A lock that is shared by all processes of uberdot. It uses
+    ``fcntl.flock()`` on a lock file, so it's released automatically when
+    the process ends, even if it was killed.
+
+    Attributes:
+        path (str): The path of the lock file
+        description (str): What is protected by the lock. Used to tell the
+            user what uberdot is waiting for.
+        exclusive (bool): True, if the lock is held exclusively, False if it
+            is shared. ``None``, if the lock isn't held.
+    """
+    def __init__(self, path, description):
+        """Constructor.
+
+        Args:
+            path (str): The path of the lock file
+            description (str): What is protected by the lock
+        """
+        self.path = path
+        self.description = description
+        self.exclusive = None
+        self._fd = None
+
+    def acquire(self, exclusive=True):
+        """Acquires the lock. If another process holds the lock, the user is
+        informed and it is waited until the lock gets released. A shared
+        lock can be made exclusive by acquiring it again, but other
+        processes might get the lock in between.
+
+        Args:
+            exclusive (bool): True, if no other process may hold the lock.
+                False, if other processes may hold the lock as well as long
+                as they don't hold it exclusively.
+        Raises:
+            :class:`~errors.PreconditionError`: The lock file can't be
+                opened
+        """
+        if self._fd is None:
+            directory = os.path.dirname(self.path)
+            try:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                    os.chown(directory, get_uid(), get_gid())
+                created = not os.path.exists(self.path)
+                # Locks don't need write access, so O_RDONLY is enough
+                self._fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o644)
+                if created:
+                    os.chown(self.path, get_uid(), get_gid())
+            except OSError as err:
+                msg = "Could not open lock file '" + self.path + "': "
+                raise PreconditionError(msg + str(err))
+        elif self.exclusive or not exclusive:
+            return
+        import fcntl
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log("Waiting for another instance of uberdot to release the " +
+                self.description + "...")
+            fcntl.flock(self._fd, operation)
+        self.exclusive = exclusive
+        log_debug("Acquired " + ("exclusive" if exclusive else "shared") +
+                  " lock on the " + self.description + ".")
+
+    def release(self):
+        """Releases the lock, if it is held."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self.exclusive = None
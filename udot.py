@@ -33,34 +33,33 @@ or you can import UberDot for debugging and testing purposes."""
 ###############################################################################
 
 from uberdot import constants
-from uberdot.interpreters import *
 from uberdot.errors import CustomError
 from uberdot.errors import FatalError
-from uberdot.errors import PreconditionError
 from uberdot.errors import UnkownError
 from uberdot.errors import UserError
-from uberdot.differencesolver import UpdateDiffSolver
-from uberdot.differencesolver import UninstallDiffSolver
-from uberdot.differencesolver import DiffLog
+from uberdot.utils import FileLock
 from uberdot.utils import has_root_priveleges
-from uberdot.utils import get_uid
-from uberdot.utils import get_gid
+from uberdot.utils import get_dotfile_index
+from uberdot.utils import get_filesystem_cache
 from uberdot.utils import import_profile_class
+from uberdot.utils import invalidate_dotfile_index
 from uberdot.utils import log_debug
 from uberdot.utils import log_error
 from uberdot.utils import log_success
 from uberdot.utils import log_warning
+from uberdot.utils import load_user_env
 from uberdot.utils import normpath
+from uberdot.utils import profile_module_stats
+from uberdot.utils import start_recording
+from uberdot.utils import stop_recording
 
 
 import argparse
 import csv
 import grp
-import json
 import logging
 import os
 import pwd
-import shutil
 import sys
 import traceback
 
@@ -70,6 +69,9 @@ if os.getenv("COVERAGE_PROCESS_START"):
     coverage.process_startup()
 
 
+logger = logging.getLogger("root")
+
+
 class UberDot:
     """Bundles all functionality of uberdot.
 
@@ -78,7 +80,10 @@ class UberDot:
 
     Attributes:
         installed (dict): The installed-file that is used as a reference
-        profiles (list): A list of the to be installed/updated profiles
+        installed_file (InstalledFile): The snapshot and journal or the
+            database that the installed-file was loaded from
+        lock (FileLock): The lock of the installed-file and its history
+        profiles (list): The results of the to be installed/updated profiles
         args (argparse): The parsed arguments
         owd (str): The old working directory uberdot was started from
     """
@@ -90,6 +95,8 @@ class UberDot:
         directory where this module is stored."""
         # Initialise fields
         self.installed = {"@version": constants.VERSION}
+        self.installed_file = None
+        self.lock = None
         self.args = None
         self.profiles = []
         # Change current working directory to the directory of this module
@@ -99,24 +106,52 @@ class UberDot:
 
     def load_installed(self):
         """Reads the installed-file and parses it's content into
-        :attr:`self.installed<UberDot.installed>`.
+        :attr:`self.installed<UberDot.installed>`. All operations from its
+        journal are replayed, so the installed-file is recovered even if the
+        last execution of uberdot failed.
+
+        If the format of the installed-file allows it, only the profiles
+        that are specified are loaded. The profiles that are installed get
+        loaded after they were generated, see :func:`load_generated()`.
+
+        Before the installed-file is read, its lock is acquired. Modes that
+        change the installed-file hold it exclusively until uberdot exits.
 
         Raises:
             :class:`~errors.PreconditionError`: uberdot and installed-file
-                aren't version compatible.
+                aren't version compatible, the journal doesn't fit the
+                installed-file or the lock file can't be opened.
         """
-        try:
-            self.installed = json.load(open(constants.INSTALLED_FILE))
-        except FileNotFoundError:
+        from uberdot.installedfile import open_installed_file
+        profiles = None
+        if ((self.args.show or self.args.uninstall or self.args.install) and
+                self.args.profiles):
+            profiles = self.args.profiles
+            if self.args.parent is not None:
+                profiles = profiles + [self.args.parent]
+        # Modes that only read can share the lock with each other
+        self.lock = FileLock(constants.INSTALLED_LOCK_FILE, "installed-file")
+        self.lock.acquire(exclusive=self.changes_installed())
+        installed_file, installed = open_installed_file(profiles, self.lock)
+        if installed is None:
             log_debug("No installed profiles found.")
-        # Check installed-file version
-        if (int(self.installed["@version"].split("_")[1]) !=
-                int(constants.VERSION.split("_")[1])):
-            msg = "There was a change of the installed-file schema "
-            msg += "with the last update. Please revert to version "
-            msg += self.installed["@version"] + " and uninstall "
-            msg += "all of your profiles before using this version."
-            raise PreconditionError(msg)
+        else:
+            self.installed = installed
+        self.installed_file = installed_file
+
+    def load_generated(self):
+        """Loads all installed profiles that have the same name as one of the
+        generated profiles or their subprofiles, if they weren't loaded yet.
+        """
+        names = []
+        def add_names(profile):
+            """Recursively add the names of a profile and its subprofiles"""
+            names.append(profile["name"])
+            for subprofile in profile["profiles"]:
+                add_names(subprofile)
+        for profile in self.profiles:
+            add_names(profile)
+        self.installed_file.load_profiles(self.installed, names)
 
     def parse_arguments(self, arguments=None):
         """Parses the commandline arguments. This function can parse a custom
@@ -150,6 +185,10 @@ class UberDot:
         parser.add_argument("--info",
                             help="print everything but debug messages",
                             action="store_true")
+        parser.add_argument("-j", "--jobs",
+                            help="generate root profiles in JOBS processes",
+                            type=int,
+                            default=1)
         parser.add_argument("--log",
                             help="specify a file to log to")
         parser.add_argument("-m", "--makedirs",
@@ -172,6 +211,11 @@ class UberDot:
         parser.add_argument("-q", "--quiet",
                             help="print nothing but errors",
                             action="store_true")
+        parser.add_argument("--rebuild-index",
+                            help="scan all dotfiles again instead of using "
+                            + "the cached index",
+                            dest="rebuild_index",
+                            action="store_true")
         parser.add_argument("--save",
                             help="specify another install-file to use",
                             default="default")
@@ -196,6 +240,8 @@ class UberDot:
         parser.add_argument("-v", "--verbose",
                             help="print stacktrace in case of error",
                             action="store_true")
+        # Environment of the user, if the process was restarted with sudo
+        parser.add_argument("--userenv", help=argparse.SUPPRESS)
         # Modes
         modes = parser.add_mutually_exclusive_group(required=True)
         modes.add_argument("-h", "--help",
@@ -207,6 +253,14 @@ class UberDot:
         modes.add_argument("--debuginfo",
                            help="display internal values",
                            action="store_true")
+        modes.add_argument("--history",
+                           help="show the generations of the installed-file",
+                           action="store_true")
+        modes.add_argument("--rollback",
+                           help="restore the installed-file as it was at the "
+                           + "end of GENERATION",
+                           type=int,
+                           metavar="GENERATION")
         modes.add_argument("-u", "--uninstall",
                            help="uninstall (sub)profiles",
                            action="store_true")
@@ -238,6 +292,9 @@ class UberDot:
         if self.args.config:
             self.args.config = os.path.join(self.owd, self.args.config)
 
+        # Reuse the environment of the user that restarted us with sudo
+        if self.args.userenv:
+            load_user_env(self.args.userenv)
         # Load constants for this installed-file
         constants.loadconfig(self.args.config, self.args.save)
         # Write back defaults from config for arguments that weren't set
@@ -344,22 +401,27 @@ class UberDot:
                 if omit:
                     msg = "--" + ", --".join(omit) + " need to be specified "
                 return msg
+            def is_set(arg):
+                # Generation 0 is a valid value as well
+                value = self.args.__dict__[arg]
+                return value is not None and value is not False and \
+                    value != []
             # If at least one of the arguments is set
-            set_args = [1 for arg in args if self.args.__dict__[arg]]
+            set_args = [1 for arg in args if is_set(arg)]
             if set_args:
                 # we verify that at least one argument of need is set
-                if need and not [1 for arg in need if self.args.__dict__[arg]]:
+                if need and not [1 for arg in need if is_set(arg)]:
                     raise UserError(gen_msg())
                 # or else only one is set if xor is set
                 if xor and len(set_args) > 1:
                     raise UserError(msg)
             # No argument is set, so all args from "omit" need to be set
-            elif omit and [x for x in omit if self.args.__dict__[x]] != omit:
+            elif omit and [x for x in omit if is_set(x)] != omit:
                 raise UserError(gen_msg())
 
         args_depend(
             "dryrun", "print", "plain",
-            need=["install", "uninstall", "debuginfo"]
+            need=["install", "uninstall", "rollback", "debuginfo"]
         )
         args_depend(
             "dryrun", "plain", "print",
@@ -370,13 +432,30 @@ class UberDot:
             xor=True
         )
         args_depend(
-            "show", "version", "debuginfo",
+            "show", "version", "debuginfo", "history", "rollback",
             msg = "No Profile specified!!",
             omit=["profiles"]
         )
         args_depend(
             "parent", need=["install", "debuginfo"]
         )
+        args_depend(
+            "rebuild_index", need=["install"]
+        )
+        if self.args.jobs < 1:
+            raise UserError("--jobs needs to be at least 1")
+        if self.args.rollback is not None and self.args.rollback < 0:
+            raise UserError("--rollback needs a generation of at least 0")
+
+    def changes_installed(self):
+        """Checks if the selected mode can change the installed-file.
+
+        Returns:
+            bool: False, if uberdot will only print information
+        """
+        return bool((self.args.install or self.args.uninstall or
+                     self.args.rollback is not None) and not
+                    (self.args.dryrun or self.args.plain or self.args.print))
 
     def execute_arguments(self):
         """Executes whatever was specified via commandline arguments."""
@@ -388,24 +467,61 @@ class UberDot:
                   constants.VERSION)
         elif self.args.debuginfo:
             self.print_debuginfo()
+        elif self.args.history:
+            self.print_history()
         else:
             # The above are modes that just print stuff, but here we
-            # have to actually do something:
+            # have to actually do something. The modules for this are
+            # imported here, so the modes above start faster.
+            from uberdot.differencesolver import HistoryDiffSolver
+            from uberdot.differencesolver import UninstallDiffSolver
+            from uberdot.differencesolver import UpdateDiffSolver
+            from uberdot.interpreters import DUIStrategyInterpreter
+            from uberdot.interpreters import PlainPrintInterpreter
+            from uberdot.interpreters import PrintInterpreter
+            from uberdot.interpreters import SkipRootInterpreter
             # 1. Decide how to solve the differences
             if self.args.uninstall:
                 dfs = UninstallDiffSolver(self.installed, self.args.profiles)
             elif self.args.install:
-                self.execute_profiles()
-                profile_results = [p.result for p in self.profiles]
+                if self.args.rebuild_index:
+                    log_debug("Removing cached index of dotfiles.")
+                    invalidate_dotfile_index()
+                # Dynamic files are shared by all installed-files
+                dynamic_lock = FileLock(constants.DYNAMIC_LOCK_FILE,
+                                        "dynamic files")
+                dynamic_lock.acquire()
+                try:
+                    self.execute_profiles()
+                finally:
+                    dynamic_lock.release()
+                self.load_generated()
                 dfs = UpdateDiffSolver(self.installed,
-                                       profile_results,
+                                       self.profiles,
                                        self.args.parent)
-            # elif TODO history resolve...
+            elif self.args.rollback is not None:
+                from uberdot.installedfile import History
+                history = History(constants.HISTORY_FILE)
+                last = history.last_generation()
+                if self.args.rollback > last:
+                    msg = "There is no generation " + str(self.args.rollback)
+                    msg += ". The last generation is " + str(last) + "."
+                    raise UserError(msg)
+                # The events belong to the profiles, which aren't generated
+                log_debug("Events are not executed when restoring a " +
+                          "generation.")
+                self.args.skipevents = True
+                dfs = HistoryDiffSolver(self.installed, history,
+                                        self.args.rollback)
             else:
                 raise FatalError("None of the expected modes were set")
-            # 2. Solve differences
+            # 2. Solve differences. The operations are generated while they
+            # are interpreted for the first time. If they are only printed,
+            # they don't even need to be stored.
             log_debug("Calculate operations for linking process.")
-            dfl = dfs.solve()
+            keep = not (self.args.plain or self.args.print) or \
+                self.args.dui or self.args.skiproot or self.args.dryrun
+            dfl = dfs.solve(stream=True, keep=keep)
             # 3. Eventually manipulate the result
             if self.args.dui:
                 log_debug("Reordering operations according to --dui.")
@@ -423,6 +539,8 @@ class UberDot:
                 dfl.run_interpreter(PrintInterpreter())
             else:
                 self.run(dfl)
+            log_debug("Filesystem cache: " +
+                      get_filesystem_cache().summary() + ".")
 
     def execute_profiles(self, profiles=None, options=None, directory=None):
         """Imports profiles by name and executes them.
@@ -448,14 +566,67 @@ class UberDot:
         pargs["options"] = options
         pargs["directory"] = directory
 
-        # Import and create profiles
-        for profilename in profiles:
-            self.profiles.append(
-                import_profile_class(profilename)(**pargs)
-            )
-        # And execute them
-        for profile in self.profiles:
-            profile.generator()
+        # Reuse the cached results of unchanged profiles
+        results = [None] * len(profiles)
+        cache = None
+        if constants.GENERATION_CACHE:
+            from uberdot.generationcache import GenerationCache
+            cache = GenerationCache(options, directory)
+            results = [cache.get(name) for name in profiles]
+        missing = [i for i, result in enumerate(results) if result is None]
+        jobs = [(profiles[i], pargs, cache is not None) for i in missing]
+
+        if min(self.args.jobs, len(jobs)) > 1:
+            # Generate root profiles in worker processes. Profiles overwrite
+            # builtins while they are generated, so we can't use threads.
+            import multiprocessing
+            processes = min(self.args.jobs, len(jobs))
+            log_debug("Generating profiles in " + str(processes) +
+                      " processes.")
+            # Build the dotfile index before forking, so the workers
+            # inherit it instead of walking the dotfiles by themselves
+            get_dotfile_index()
+            pool = multiprocessing.get_context("fork").Pool(processes)
+            try:
+                # imap() keeps the order and raises the error of the first
+                # failed profile
+                generated = []
+                for result, recording, stats in pool.imap(generate_profile,
+                                                          jobs):
+                    generated.append((result, recording))
+                    for key, value in stats.items():
+                        profile_module_stats[key] += value
+            finally:
+                # Let the workers exit properly, so their output is flushed
+                pool.close()
+                pool.join()
+        else:
+            # Import and create profiles
+            root_profiles = []
+            for profilename, _, _ in jobs:
+                root_profiles.append(
+                    import_profile_class(profilename)(**pargs)
+                )
+            # And execute them
+            generated = []
+            for profile in root_profiles:
+                generated.append(
+                    generate_root_profile(profile, cache is not None)
+                )
+        log_debug("Profile modules: " +
+                  str(profile_module_stats["imported"]) + " imported, " +
+                  str(profile_module_stats["reused"]) + " imports avoided.")
+
+        for i, (result, recording) in zip(missing, generated):
+            results[i] = result
+            if cache is not None:
+                cache.put(profiles[i], result, recording)
+        if cache is not None:
+            log_debug("Generation cache: " +
+                      str(len(profiles) - len(missing)) + " of " +
+                      str(len(profiles)) + " profiles reused.")
+            cache.save()
+        self.profiles.extend(results)
 
     def print_debuginfo(self):
         """Print out internal values.
@@ -482,7 +653,7 @@ class UberDot:
             print(str("   " + name + ": ").ljust(32) + str(val))
 
         print_header("Config search paths")
-        for cfg in constants.CONFIG_SEARCH_PATHS:
+        for cfg in constants.get_config_search_paths():
             print("   " + cfg)
         print_header("Loaded configs")
         for cfg in constants.CFG_FILES:
@@ -504,6 +675,9 @@ class UberDot:
         print_value("COLOR", constants.COLOR)
         print_value("DATA_DIR", constants.DATA_DIR)
         print_value("DECRYPT_PWD", constants.DECRYPT_PWD)
+        print_value("GENERATION_CACHE", constants.GENERATION_CACHE)
+        print_value("PREFETCH_DIRS", constants.PREFETCH_DIRS)
+        print_value("INSTALLED_FORMAT", constants.INSTALLED_FORMAT)
         print_value("HASH_SEPARATOR", constants.HASH_SEPARATOR)
         print_value("PROFILE_FILES", constants.PROFILE_FILES)
         print_value("SHELL", constants.SHELL)
@@ -511,6 +685,7 @@ class UberDot:
         print_value("SMART_CD", constants.SMART_CD)
         print_value("TAG_SEPARATOR", constants.TAG_SEPARATOR)
         print_value("TARGET_FILES", constants.TARGET_FILES)
+        print_value("USE_GIT_INDEX", constants.USE_GIT_INDEX)
         print_header("Command options")
         print_value("DEFAULTS['directory']", self.args.directory)
         print_value("DEFAULTS['extension']", self.args.opt_dict["extension"])
@@ -527,7 +702,35 @@ class UberDot:
         print_value("DEFAULTS['tags']", self.args.opt_dict["tags"])
         print_header("Internal values")
         print_value("INSTALLED_FILE", constants.INSTALLED_FILE)
-        print_value("INSTALLED_FILE_BACKUP", constants.INSTALLED_FILE_BACKUP)
+        print_value("INSTALLED_JOURNAL_FILE",
+                    constants.INSTALLED_JOURNAL_FILE)
+        print_value("INSTALLED_DB_FILE", constants.INSTALLED_DB_FILE)
+        print_value("INSTALLED_SHARD_DIR", constants.INSTALLED_SHARD_DIR)
+        print_value("HISTORY_FILE", constants.HISTORY_FILE)
+        print_value("INSTALLED_LOCK_FILE", constants.INSTALLED_LOCK_FILE)
+        print_value("DYNAMIC_LOCK_FILE", constants.DYNAMIC_LOCK_FILE)
+        print_value("DOTFILE_INDEX_FILE", constants.DOTFILE_INDEX_FILE)
+        print_value("PROFILE_REGISTRY_FILE", constants.PROFILE_REGISTRY_FILE)
+        print_value("GENERATION_CACHE_FILE", constants.GENERATION_CACHE_FILE)
+
+    def print_history(self):
+        """Print out all generations of the history of the installed-file."""
+        from uberdot.installedfile import History
+        generations = []
+        for record in History(constants.HISTORY_FILE).load():
+            if record["operation"] == "start":
+                generations.append((record, [], set()))
+            elif generations:
+                generations[-1][1].append(record)
+                generations[-1][2].add(record["profile"])
+        if not generations:
+            log_warning("The history of the installed-file is empty.")
+        for start, records, profiles in generations:
+            print(constants.BOLD + "Generation " + str(start["generation"]) +
+                  ":" + constants.ENDC)
+            print("  Date: " + start["date"])
+            print("  Operations: " + str(len(records)))
+            print("  Profiles: " + ", ".join(sorted(profiles)))
 
     def print_installed_profiles(self):
         """Print out the installed-file in a readable format.
@@ -574,7 +777,7 @@ class UberDot:
     def run(self, difflog):
         """Performs checks on DiffLog and resolves it.
 
-        Furthermore this function handles backups, converts exceptions into
+        Furthermore this function handles the history, converts exceptions into
         UnkownErrors and might replace the entire process when uberdot was
         started with insufficient permissions.
 
@@ -588,27 +791,40 @@ class UberDot:
             :class:`~errors.CustomError`: Executed interpreters can and will
                 raise all kinds of :class:`~errors.CustomError`.
         """
-        # Run integration tests on difflog
+        from uberdot.installedfile import History
+        from uberdot.interpreters import CheckDynamicFilesInterpreter
+        from uberdot.interpreters import CheckLinkBlacklistInterpreter
+        from uberdot.interpreters import CheckLinkDirsInterpreter
+        from uberdot.interpreters import CheckLinkExistsInterpreter
+        from uberdot.interpreters import CheckLinksInterpreter
+        from uberdot.interpreters import CheckProfilesInterpreter
+        from uberdot.interpreters import EventExecInterpreter
+        from uberdot.interpreters import ExecuteInterpreter
+        from uberdot.interpreters import GainRootInterpreter
+        from uberdot.interpreters import PrintInterpreter
+        # Run integration tests on difflog and gain root if needed. All those
+        # stages only check operations, so they are run in a single traversal
         log_debug("Checking operations for errors and conflicts.")
-        difflog.run_interpreter(
-            CheckProfilesInterpreter(self.installed, self.args.parent)
-        )
-        tests = [
-            CheckLinksInterpreter(self.installed),
-            CheckLinkDirsInterpreter(self.args.makedirs),
-            CheckLinkExistsInterpreter(self.args.force),
-            CheckDynamicFilesInterpreter(False)
+        stages = [
+            CheckProfilesInterpreter(self.installed, self.args.parent),
+            [
+                CheckLinksInterpreter(self.installed, self.installed_file),
+                CheckLinkDirsInterpreter(self.args.makedirs),
+                CheckLinkExistsInterpreter(self.args.force)
+            ]
         ]
-        difflog.run_interpreter(*tests)
-        # Gain root if needed
         if not has_root_priveleges():
             log_debug("Checking if root is needed")
-            difflog.run_interpreter(GainRootInterpreter())
+            stages.append(GainRootInterpreter())
         else:
             log_debug("uberdot was started with root priveleges")
-        # Check blacklist not until now, because the user would need confirm it
-        # twice if the programm is restarted with sudo
-        difflog.run_interpreter(CheckLinkBlacklistInterpreter(self.args.superforce))
+        # Check dynamic files and blacklist not until now, because the user
+        # would need to interact twice if the programm is restarted with sudo
+        stages.append([
+            CheckDynamicFilesInterpreter(False),
+            CheckLinkBlacklistInterpreter(self.args.superforce)
+        ])
+        difflog.run_pipeline(*stages)
         # Now the critical part begins, devided into three main tasks:
         # 1. running events before, 2. linking, 3. running events after
         # Each part is surrounded with a try-catch block that wraps every
@@ -643,27 +859,28 @@ class UberDot:
             raise UnkownError(err, msg)
         # Execute operations from difflog
         try:
-            # Create Backup in case something wents wrong,
-            # so the user can fix the mess we caused
-            if os.path.isfile(constants.INSTALLED_FILE):
-                shutil.copyfile(constants.INSTALLED_FILE,
-                                constants.INSTALLED_FILE_BACKUP)
-            # Apply difflog operations and print them simultaneously
-            difflog.run_interpreter(
-                ExecuteInterpreter(self.installed, self.args.force),
-                PrintInterpreter()
-            )
-            # Remove Backup
-            if os.path.isfile(constants.INSTALLED_FILE_BACKUP):
-                os.remove(constants.INSTALLED_FILE_BACKUP)
+            # Apply difflog operations and print them simultaneously. Every
+            # operation is recorded in the journal of the installed-file and
+            # in the history as soon as it was applied.
+            history = History(constants.HISTORY_FILE)
+            try:
+                difflog.run_interpreter(
+                    ExecuteInterpreter(self.installed, self.args.force,
+                                       history, self.installed_file),
+                    PrintInterpreter()
+                )
+            finally:
+                history.close()
             log_success("Updated links successfully.")
         except CustomError:
             raise
         except Exception as err:
             msg = "An unkown error occured during linking/unlinking. Some "
-            msg += "links or your installed-file may be corrupted! Check the "
-            msg += "backup of your installed-file to resolve all possible "
-            msg += "issues before you proceed to use this tool!"
+            msg += "links may be corrupted! All operations that were applied "
+            msg += "until then are stored in the journal of your "
+            msg += "installed-file. Check the last generation of the history "
+            msg += "to resolve all possible issues before you proceed to use "
+            msg += "this tool!"
             raise UnkownError(err, msg)
         # Execute all events after linking and print them
         try:
@@ -689,23 +906,32 @@ class UberDot:
             :class:`~errors.CustomError`: Executed interpreters can and will
                 raise all kinds of :class:`~errors.CustomError`.
         """
+        from uberdot.interpreters import CheckDynamicFilesInterpreter
+        from uberdot.interpreters import CheckLinkBlacklistInterpreter
+        from uberdot.interpreters import CheckLinkDirsInterpreter
+        from uberdot.interpreters import CheckLinkExistsInterpreter
+        from uberdot.interpreters import CheckLinksInterpreter
+        from uberdot.interpreters import CheckProfilesInterpreter
+        from uberdot.interpreters import EventPrintInterpreter
+        from uberdot.interpreters import PrintInterpreter
+        from uberdot.interpreters import RootNeededInterpreter
         log_warning("This is just a dry-run! Nothing of the following " +
                     "is actually happening.")
-        # Run tests
+        # Run tests and check if root would be needed in a single traversal
         log_debug("Checking operations for errors and conflicts.")
-        difflog.run_interpreter(
-            CheckProfilesInterpreter(self.installed, self.args.parent)
+        difflog.run_pipeline(
+            CheckProfilesInterpreter(self.installed, self.args.parent),
+            [
+                CheckLinksInterpreter(self.installed, self.installed_file),
+                CheckLinkDirsInterpreter(self.args.makedirs),
+                CheckLinkExistsInterpreter(self.args.force)
+            ],
+            RootNeededInterpreter(),
+            [
+                CheckDynamicFilesInterpreter(True),
+                CheckLinkBlacklistInterpreter(self.args.superforce)
+            ]
         )
-        tests = [
-            CheckLinksInterpreter(self.installed),
-            CheckLinkBlacklistInterpreter(self.args.superforce),
-            CheckLinkDirsInterpreter(self.args.makedirs),
-            CheckLinkExistsInterpreter(self.args.force),
-            CheckDynamicFilesInterpreter(True)
-        ]
-        difflog.run_interpreter(*tests)
-        log_debug("Checking if root would be needed")
-        difflog.run_interpreter(RootNeededInterpreter())
         # Simulate events before
         if not self.args.skipevents and not self.args.skipbefore:
             difflog.run_interpreter(
@@ -724,6 +950,45 @@ class UberDot:
             )
 
 
+def generate_profile(job):
+    """Imports and executes a single root profile. This is used by the
+    worker processes of :func:`UberDot.execute_profiles()`.
+
+    Args:
+        job (tuple): The name of the profile, the arguments for its
+            constructor and if its dependencies shall be recorded
+    Returns:
+        tuple: The result of the profile, the recorded dependencies and how
+        often profile modules were imported and reused by this job
+    """
+    profilename, pargs, record = job
+    before = dict(profile_module_stats)
+    result, recording = generate_root_profile(
+        import_profile_class(profilename)(**pargs), record
+    )
+    stats = {key: profile_module_stats[key] - before[key] for key in before}
+    return result, recording, stats
+
+
+def generate_root_profile(profile, record):
+    """Executes a root profile and records its dependencies if needed.
+
+    Args:
+        profile (Profile): The root profile
+        record (bool): True, if the dependencies shall be recorded
+    Returns:
+        tuple: The result of the profile and the recorded dependencies.
+        The latter is ``None`` if nothing was recorded.
+    """
+    if not record:
+        return profile.generator(), None
+    recording = start_recording()
+    try:
+        return profile.generator(), recording
+    finally:
+        stop_recording(recording)
+
+
 class StoreDictKeyPair(argparse.Action):
     """Custom argparse.Action to parse an option dictionary from commandline"""
 
@@ -810,12 +1075,6 @@ def run_script(name):
         sys.path.append(constants.PROFILE_FILES)
         # Start everything in an exception handler
         try:
-            if os.path.isfile(constants.INSTALLED_FILE_BACKUP):
-                m = "I found a backup of your installed-file. It's most likely"
-                m += " that the last execution of this tool failed. If you "
-                m += "are certain that your installed-file is correct you can"
-                m += " remove the backup and start this tool again."
-                raise PreconditionError(m)
             uber.load_installed()
             uber.execute_arguments()
         except CustomError as err:
@@ -828,17 +1087,16 @@ def run_script(name):
                         " I did nothing critical at the time :)")
             sys.exit(100)
         finally:
-            # Write installed-file back to json file
-            try:
-                with open(constants.INSTALLED_FILE, "w") as file:
-                    file.write(json.dumps(uber.installed, indent=4))
-                    file.flush()
-                os.chown(constants.INSTALLED_FILE, get_uid(), get_gid())
-            except Exception as err:
-                msg = "An unkown error occured when trying to "
-                msg += "write all changes back to the installed-file"
-                unkw = UnkownError(err, msg)
-                log_error(unkw.message)
+            # Sync the journal and compact it into the installed-file
+            if (uber.installed_file is not None and
+                    uber.changes_installed()):
+                try:
+                    uber.installed_file.save(uber.installed)
+                except Exception as err:
+                    msg = "An unkown error occured when trying to "
+                    msg += "write all changes back to the installed-file"
+                    unkw = UnkownError(err, msg)
+                    log_error(unkw.message)
 
 
 run_script(__name__)